@@ -0,0 +1 @@
+# Render benchmarks: python -m benchmarks --help
@@ -0,0 +1,54 @@
+# Runs the benchmark suites and writes the results as JSON
+import json
+import argparse
+
+from . import micro, macro, scaling, ordering, backends, memory
+from .common import Scenes, environment
+
+Suites = ['micro', 'macro', 'scaling', 'ordering', 'backends', 'memory']
+
+def main(args):
+    results = dict(environment=environment(), settings=vars(args))
+    if "micro" in args.suites:
+        print("micro benchmarks")
+        results["micro"] = micro.run(args.num_rays, args.repeat)
+    if "macro" in args.suites:
+        print("macro benchmarks")
+        results["macro"] = macro.run(args.scenes, args.width, args.num_samples)
+    if "scaling" in args.suites:
+        print("scaling benchmark")
+        results["scaling"] = scaling.run(args.scaling_scene, args.width, args.num_samples, args.jobs)
+    if "ordering" in args.suites:
+        print("ordering benchmark")
+        results["ordering"] = ordering.run(args.scaling_scene, args.width, args.num_samples)
+    if "backends" in args.suites:
+        print("backend benchmark")
+        results["backends"] = backends.run(args.scenes, args.width, args.num_samples, args.backend_jobs)
+    if "memory" in args.suites:
+        print("worker memory benchmark")
+        results["memory"] = memory.run(args.scaling_scene, args.payload_mb, args.jobs or (1, 2, 4))
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the render benchmarks")
+    # no choices=, an empty list of suites is checked against them as a whole
+    parser.add_argument('suites', nargs='*', help=f'Suites to run, of {", ".join(Suites)} (defaults to all of them)', default=None)
+    parser.add_argument('-o', '--output', type=str, help='Output JSON file', default='bench_results.json')
+    parser.add_argument('-w', '--width', type=int, help='Image width for scene renders', default=48)
+    parser.add_argument('-n', '--num_samples', type=int, help='Samples per pixel for scene renders', default=1)
+    parser.add_argument('--scenes', nargs='+', help='Scenes for the macro and backend benchmarks', default=Scenes)
+    parser.add_argument('--scaling_scene', type=str, help='Scene for the scaling, ordering and memory benchmarks', default='cornell_box_scene')
+    parser.add_argument('--jobs', type=int, nargs='+', help='Pool sizes for the scaling and memory benchmarks', default=None)
+    parser.add_argument('--backend_jobs', type=int, help='Pool size for the backend benchmark', default=None)
+    parser.add_argument('--payload_mb', type=int, help='Size of the scene array payload in the memory benchmark', default=64)
+    parser.add_argument('--num_rays', type=int, help='Rays per shape for the micro benchmarks', default=2000)
+    parser.add_argument('--repeat', type=int, help='Repetitions of each micro benchmark', default=3)
+    args = parser.parse_args()
+    unknown = [suite for suite in args.suites if suite not in Suites]
+    if unknown:
+        parser.error(f"unknown suites {', '.join(unknown)}, choose from {', '.join(Suites)}")
+    if not args.suites:
+        args.suites = Suites
+    main(args)
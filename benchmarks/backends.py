@@ -0,0 +1,22 @@
+# Process and thread backends compared on every scene at the same pool size
+import os
+
+from src.render import Backends, make_tiles
+
+from .common import Scenes, load_scene, make_context
+from .scaling import render_with_pool
+
+def run(scenes=Scenes, width=48, num_samples=1, num_jobs=None, tile_size=16):
+    num_jobs = num_jobs or min(os.cpu_count() or 1, 4)
+    results = dict(num_jobs=num_jobs, scenes={})
+    for name in scenes:
+        scene = load_scene(name, width)
+        context = make_context(name, scene, num_samples)
+        tiles = make_tiles(scene.camera.img_width, scene.camera.img_height, tile_size)
+        runs = {backend: render_with_pool(context, tiles, num_jobs, backend) for backend in Backends}
+        results["scenes"][name] = dict(
+            seconds=runs,
+            threads_speedup=runs["processes"] / runs["threads"],
+        )
+        print(f"  {name}: " + ", ".join(f"{backend} {seconds:.2f}s" for backend, seconds in runs.items()))
+    return results
@@ -0,0 +1,70 @@
+# Helpers shared by the benchmark suites
+import sys
+import time
+import platform
+import importlib
+import subprocess
+
+from src.render import Context, make_tiles, render_tile
+
+# every scene module in the repository root
+Scenes = [
+    "ball_scene",
+    "ball_scene_spec",
+    "ball_scene_test",
+    "cornell_box_scene",
+    "cube_scene",
+    "cylinder_scene",
+    "dof_scene",
+    "heart_scene",
+    "mesh_scene",
+    "implicit_transform_showcase",
+    "instancing_scene",
+    "mirror_pair_scene",
+    "mitchell_scene",
+    "particle_scene",
+    "terrain_scene",
+    "transformation_test_scene",
+    "transformation_translucid_scene",
+    "turntable_scene",
+]
+
+def load_scene(name, width=None):
+    # build a scene, optionally at a reduced resolution with the same aspect
+    scene = importlib.import_module(name).Scene()
+    if width is not None:
+        camera = scene.camera
+        height = max(round(width * camera.img_height / camera.img_width), 1)
+        camera.set_resolution(width, height)
+    return scene
+
+def make_context(name, scene, num_samples):
+    return Context(scene=scene, camera=scene.camera, num_samples=num_samples, scene_key=name)
+
+def render_all(context, tile_size=16):
+    camera = context.camera
+    tiles = make_tiles(camera.img_width, camera.img_height, tile_size)
+    return [render_tile(context, tile, 0) for tile in tiles]
+
+def best_time(func, repeat=3):
+    # minimum over a few runs, the least noisy estimate of the cost
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(
+        commit=commit,
+        python=sys.version.split()[0],
+        implementation=platform.python_implementation(),
+        machine=platform.machine(),
+        system=platform.system(),
+        timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"),
+    )
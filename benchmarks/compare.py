@@ -0,0 +1,41 @@
+# Compares two benchmark result files and flags regressions
+import sys
+import json
+import argparse
+
+def timings(results, prefix=""):
+    # flattens every "seconds" entry into {path: seconds}
+    found = {}
+    for key, value in results.items():
+        if key in ("environment", "settings"):
+            continue
+        if isinstance(value, dict):
+            if "seconds" in value:
+                found[prefix + key] = value["seconds"]
+            found.update(timings(value, prefix + key + "/"))
+    return found
+
+def main(args):
+    with open(args.baseline) as f:
+        baseline = timings(json.load(f))
+    with open(args.candidate) as f:
+        candidate = timings(json.load(f))
+    regressions = 0
+    for name in sorted(baseline.keys() & candidate.keys()):
+        ratio = candidate[name] / baseline[name]
+        flag = ""
+        if ratio > 1 + args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif ratio < 1 - args.threshold:
+            flag = "  faster"
+        print(f"{name:60s} {baseline[name]:9.4f}s -> {candidate[name]:9.4f}s  x{ratio:.2f}{flag}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two benchmark JSON files")
+    parser.add_argument('baseline', type=str)
+    parser.add_argument('candidate', type=str)
+    parser.add_argument('--threshold', type=float, help='Relative slowdown reported as a regression', default=0.1)
+    args = parser.parse_args()
+    sys.exit(main(args))
@@ -0,0 +1,50 @@
+# Macro benchmarks: whole scenes at reduced resolution and fixed spp
+import time
+
+from src import stats
+
+from .common import Scenes, load_scene, make_context, render_all
+
+def run_scene(name, width, num_samples):
+    # one untimed instrumented render for the counters, then a timed one
+    # without instrumentation
+    scene = load_scene(name, width)
+    context = make_context(name, scene, num_samples)
+    seconds = min(timed_render(context) for _ in range(2))
+
+    stats.enable()
+    counted_scene = load_scene(name, width)
+    stats.instrument_scene(counted_scene)
+    render_stats = stats.RenderStats()
+    for result in render_all(make_context(name, counted_scene, num_samples)):
+        render_stats.merge(result.stats)
+    stats.disable()
+
+    derived = render_stats.derived()
+    total_rays = render_stats.counters["scene.hit"]
+    return dict(
+        width=scene.camera.img_width,
+        height=scene.camera.img_height,
+        num_samples=num_samples,
+        seconds=seconds,
+        rays=dict(
+            primary=derived["rays_primary"],
+            shadow=derived["rays_shadow"],
+            secondary=derived["rays_secondary"],
+            total=total_rays,
+        ),
+        rays_per_second=total_rays / seconds,
+        counters=dict(render_stats.counters),
+    )
+
+def timed_render(context):
+    start = time.perf_counter()
+    render_all(context)
+    return time.perf_counter() - start
+
+def run(scenes=Scenes, width=48, num_samples=1):
+    results = {}
+    for name in scenes:
+        results[name] = run_scene(name, width, num_samples)
+        print(f"  {name}: {results[name]['seconds']:.2f}s, {results[name]['rays_per_second']:.0f} rays/s")
+    return results
@@ -0,0 +1,58 @@
+# Worker memory with and without the shared scene arrays. The scene gets an
+# extra payload array standing in for large geometry and caches, every
+# worker reads it once and reports its resident memory.
+import os
+
+import numpy as np
+
+from src.render import StartMethods, make_pool
+from src.shared import SharedScene
+from src import render
+
+from .common import load_scene, make_context
+
+def process_memory():
+    # resident set split in private (anonymous) and shared memory pages, kB
+    fields = dict()
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssShmem"):
+                fields[key] = int(value.split()[0])
+    return fields
+
+def memory_task(_):
+    context = render._worker_context
+    total = float(context.scene.payload.sum())
+    return os.getpid(), total, process_memory()
+
+def measure(context, num_jobs, start_method, share):
+    shared = SharedScene(context.scene) if share else None
+    pool = make_pool("processes", num_jobs, context, start_method)
+    # several tasks per worker so every worker reports at least once
+    workers = dict()
+    for pid, _, memory in pool.imap_unordered(memory_task, range(8 * num_jobs)):
+        workers[pid] = memory
+    pool.close()
+    pool.join()
+    if shared is not None:
+        shared.close()
+    mean = lambda key: sum(m[key] for m in workers.values()) / len(workers)
+    return dict(workers=len(workers), rss_kb=mean("VmRSS"), private_kb=mean("RssAnon"), shared_kb=mean("RssShmem"))
+
+def run(scene_name="cornell_box_scene", payload_mb=64, jobs=(1, 2, 4), start_methods=StartMethods):
+    if not os.path.exists("/proc/self/status"):
+        print("  skipped, needs /proc")
+        return None
+    results = dict(scene=scene_name, payload_mb=payload_mb, runs={})
+    for start_method in start_methods:
+        for share in (False, True):
+            for num_jobs in jobs:
+                scene = load_scene(scene_name, 8)
+                scene.payload = np.ones(payload_mb * 2**20 // 8)
+                context = make_context(scene_name, scene, 1)
+                run = measure(context, num_jobs, start_method, share)
+                mode = "shared" if share else "copied"
+                results["runs"][f"{start_method}/{mode}/{num_jobs}"] = run
+                print(f"  {start_method:10s} {mode} {num_jobs} jobs: {run['rss_kb'] / 1024:.0f} MB resident, {run['private_kb'] / 1024:.0f} MB private per worker")
+    return results
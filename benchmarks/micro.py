@@ -0,0 +1,151 @@
+# Micro benchmarks: Shape.hit and Material.shade on fixed inputs
+import math
+import random
+
+import numpy as np
+
+from src import rng
+from src.base import BaseScene, Color
+from src.camera import Camera
+from src.light import PointLight, AreaLight
+from src.ray import Ray
+from src.vector3d import Vector3D
+from src.shapes import Ball, Cube, Cylinder, Plane, PlaneUV, MitchellSurface, HeartSurface
+from src.sphere_set import SphereSet
+from src.implicit import ImplicitSurface
+from mesh_scene import torus_mesh
+from src.object_transform import ObjectTransform, translation_matrix, rotation_z_matrix, rotation_x_matrix
+from src.materials import (
+    ColorMaterial,
+    SimpleMaterial,
+    SimpleMaterialWithShadows,
+    CheckerboardMaterial,
+    TranslucidMaterial,
+    MirrorMaterial,
+)
+
+from .common import best_time
+
+def bench_shapes():
+    # every shape is centered at the origin and roughly 2 units wide
+    return {
+        "Ball": Ball(Vector3D(0, 0, 0), 1.0),
+        "Cube": Cube(2.0),
+        "Cylinder": Cylinder(2.0, 1.0),
+        "Plane": Plane(Vector3D(0, 0, 0), Vector3D(0, 0, 1)),
+        "PlaneUV": PlaneUV(Vector3D(0, 0, 0), Vector3D(0, 0, 1), Vector3D(1, 0, 0)),
+        "MitchellSurface": MitchellSurface(),
+        "HeartSurface": HeartSurface(),
+        # the Mitchell surface compiled from its expression
+        "ImplicitSurface(Mitchell)": ImplicitSurface(
+            lambda x, y, z: 4 * (x**4 + (y**2 + z**2)**2 + 17 * x**2 * (y**2 + z**2)) - 20 * (x**2 + y**2 + z**2) + 17,
+            Vector3D(-2, -2, -2), Vector3D(2, 2, 2), max_depth=16, t_epsilon=1e-3,
+        ),
+        "ObjectTransform(Cube)": ObjectTransform(Cube(1.5), translation_matrix(0.1, 0, 0) @ rotation_z_matrix(0.5) @ rotation_x_matrix(0.3)),
+        "SphereSet(10^5)": sphere_cloud(100000),
+        "TriangleMesh(torus)": torus_mesh(0.7, 0.3, 128, 64),
+    }
+
+def sphere_cloud(count, seed=0):
+    # small spheres filling a ball of radius 1
+    rng = np.random.default_rng(seed)
+    directions = rng.normal(size=(count, 3))
+    directions /= np.linalg.norm(directions, axis=1)[:, None]
+    centers = directions * rng.uniform(0, 1, (count, 1)) ** (1 / 3)
+    return SphereSet(centers, 0.01)
+
+def ray_set(count, seed=0, distance=8.0, spread=2.5):
+    # rays from a sphere around the origin aimed at random points near it,
+    # so a share of them miss
+    rng = random.Random(seed)
+    rays = []
+    for _ in range(count):
+        z = rng.uniform(-1, 1)
+        phi = rng.uniform(0, 2 * math.pi)
+        r = math.sqrt(1 - z * z)
+        origin = Vector3D(r * math.cos(phi), r * math.sin(phi), z) * distance
+        target = Vector3D(rng.uniform(-1, 1), rng.uniform(-1, 1), rng.uniform(-1, 1)) * spread
+        rays.append(Ray(origin, target - origin))
+    return rays
+
+def run_shapes(num_rays=2000, repeat=3):
+    rays = ray_set(num_rays)
+    results = {}
+    for name, shape in bench_shapes().items():
+        hits = sum(1 for ray in rays if shape.hit(ray).hit)
+        seconds = best_time(lambda: [shape.hit(ray) for ray in rays], repeat)
+        results[name] = dict(
+            rays=num_rays,
+            hit_fraction=hits / num_rays,
+            seconds=seconds,
+            rays_per_second=num_rays / seconds,
+        )
+        if hasattr(shape, "intersect"):
+            # shapes with a batched query also run it on all rays at once
+            origins = np.array([[r.origin.x, r.origin.y, r.origin.z] for r in rays])
+            directions = np.array([[r.direction.x, r.direction.y, r.direction.z] for r in rays])
+            batch_seconds = best_time(lambda: shape.intersect(origins, directions), repeat)
+            results[name]["batched_rays_per_second"] = num_rays / batch_seconds
+    return results
+
+class ShadeScene(BaseScene):
+    def __init__(self):
+        super().__init__("Material Benchmark Scene")
+        self.background = Color(0.7, 0.8, 1)
+        self.ambient_light = Color(0.1, 0.1, 0.1)
+        self.max_depth = 3
+        self.camera = Camera(
+            eye=Vector3D(6, -6, 4),
+            look_at=Vector3D(0, 0, 0),
+            up=Vector3D(0, 0, 1),
+            fov=45,
+            img_width=64,
+            img_height=48
+        )
+        self.lights = [
+            PointLight(Vector3D(4, 2, 6), Color(1, 1, 1), 1.5),
+            AreaLight(Vector3D(-4, 3, 5), Vector3D(0, 0, 0), Vector3D(0, 0, 1), 2, 2, Color(0.8, 0.8, 1), 0.7),
+        ]
+        floor = SimpleMaterialWithShadows(0.1, 0.8, Color(0.8, 0.8, 0.8), 0, Color(1, 1, 1))
+        self.add(PlaneUV(Vector3D(0, 0, 0), Vector3D(0, 0, 1), Vector3D(1, 0, 0)), floor)
+        ball = SimpleMaterialWithShadows(0.1, 0.7, Color(0.9, 0.2, 0.2), 0.5, Color(1, 1, 1), 64)
+        self.add(Ball(Vector3D(0, 0, 1), 1.0), ball)
+
+def bench_materials():
+    return {
+        "ColorMaterial": ColorMaterial(Color(0.5, 0.5, 0.5)),
+        "SimpleMaterial": SimpleMaterial(0.1, 0.7, Color(0.5, 0.5, 0.5), 0.5, Color(1, 1, 1), 32),
+        "SimpleMaterialWithShadows": SimpleMaterialWithShadows(0.1, 0.7, Color(0.5, 0.5, 0.5), 0.5, Color(1, 1, 1), 32),
+        "CheckerboardMaterial": CheckerboardMaterial(0.1, 0.8, 0.5),
+        "TranslucidMaterial": TranslucidMaterial(0.05, 0.2, Color(0.5, 0, 0), 0.1, Color(1, 1, 1), 32, 0.8, 1.5),
+        "MirrorMaterial": MirrorMaterial(),
+    }
+
+def floor_hits(scene):
+    # primary hits on the floor (which has uv coordinates), so every
+    # material can shade the same records
+    camera = scene.camera
+    hits = []
+    for i in range(camera.img_height):
+        for j in range(camera.img_width):
+            hit = scene.hit(camera.ray(j + 0.5, i + 0.5))
+            if hit.hit and hit.uv is not None:
+                hits.append(hit)
+    return hits
+
+def run_materials(repeat=3):
+    scene = ShadeScene()
+    hits = floor_hits(scene)
+    results = {}
+    for name, material in bench_materials().items():
+        rng.seed(0)
+        seconds = best_time(lambda: [material.shade(hit, scene) for hit in hits], repeat)
+        results[name] = dict(
+            hit_records=len(hits),
+            seconds=seconds,
+            shades_per_second=len(hits) / seconds,
+        )
+    return results
+
+def run(num_rays=2000, repeat=3):
+    return dict(shapes=run_shapes(num_rays, repeat), materials=run_materials(repeat))
@@ -0,0 +1,85 @@
+# Tile and pixel order benchmark: rays/s and primary ray coherence of every
+# combination of orders, plus the effect of binning a random ray batch
+import time
+
+import numpy as np
+
+from src.ordering import Orders, order_tiles, bin_rays
+from src.render import make_tiles, render_tile
+
+from .common import load_scene, make_context
+
+class CoherenceProbe:
+    # Records whether consecutive primary rays hit the same object (same
+    # material), a proxy for cache reuse in the intersection code.
+    def __init__(self, scene, camera):
+        self.primary = set()
+        self.last = None
+        self.same = 0
+        self.total = 0
+        scene_hit = scene.hit
+        camera_rays = camera.rays
+
+        def rays(x, y):
+            result = camera_rays(x, y)
+            self.primary.update(id(ray) for ray in result)
+            return result
+
+        def hit(ray):
+            hit_rec = scene_hit(ray)
+            if id(ray) in self.primary:
+                self.primary.discard(id(ray))
+                current = id(hit_rec.material) if hit_rec.hit else None
+                self.same += current == self.last
+                self.total += 1
+                self.last = current
+            return hit_rec
+
+        scene.hit = hit
+        camera.rays = rays
+
+def run_orders(scene_name, width, num_samples, tile_size):
+    results = {}
+    for tile_order in Orders:
+        for pixel_order in Orders:
+            scene = load_scene(scene_name, width)
+            context = make_context(scene_name, scene, num_samples)
+            context.pixel_order = pixel_order
+            probe = CoherenceProbe(scene, scene.camera)
+            tiles = order_tiles(make_tiles(scene.camera.img_width, scene.camera.img_height, tile_size), tile_order)
+            start = time.perf_counter()
+            for tile in tiles:
+                render_tile(context, tile, 0)
+            seconds = time.perf_counter() - start
+            results[f"{tile_order}/{pixel_order}"] = dict(
+                seconds=seconds,
+                primary_rays_per_second=probe.total / seconds,
+                primary_coherence=probe.same / max(probe.total, 1),
+            )
+            print(f"  tiles {tile_order:8s} pixels {pixel_order:8s}: {seconds:.2f}s, coherence {probe.same / max(probe.total, 1):.3f}")
+    return results
+
+def run_binning(num_rays=100000, cell_size=0.5, seed=0):
+    # share of consecutive rays in a batch with the same octant and origin cell
+    rng = np.random.default_rng(seed)
+    origins = rng.uniform(-4, 4, (num_rays, 3))
+    directions = rng.normal(size=(num_rays, 3))
+
+    def coherence(o, d):
+        cells = np.floor(o / cell_size)
+        octants = d < 0
+        same = (cells[1:] == cells[:-1]).all(axis=1) & (octants[1:] == octants[:-1]).all(axis=1)
+        return float(same.mean())
+
+    start = time.perf_counter()
+    perm = bin_rays(origins, directions, cell_size)
+    seconds = time.perf_counter() - start
+    return dict(
+        rays=num_rays,
+        seconds=seconds,
+        coherence_unsorted=coherence(origins, directions),
+        coherence_binned=coherence(origins[perm], directions[perm]),
+    )
+
+def run(scene_name="cornell_box_scene", width=64, num_samples=1, tile_size=16):
+    return dict(scene=scene_name, orders=run_orders(scene_name, width, num_samples, tile_size), binning=run_binning())
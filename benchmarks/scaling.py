@@ -0,0 +1,51 @@
+# Parallel scaling benchmark: one scene rendered with an increasing pool size
+import os
+import time
+
+from src.render import make_tiles, render_tile, render_tile_task, make_pool
+
+from .common import load_scene, make_context
+
+# how long each worker is held by the warm-up, so that every worker of the
+# pool takes one of its tasks
+WarmUpSeconds = 0.1
+
+def render_with_pool(context, tiles, num_jobs, backend="processes"):
+    # seconds of the render alone, the pool is started and its workers are
+    # up before the clock starts
+    if num_jobs <= 1:
+        start = time.perf_counter()
+        for tile in tiles:
+            render_tile(context, tile, 0)
+        return time.perf_counter() - start
+    pool = make_pool(backend, num_jobs, context)
+    list(pool.imap(time.sleep, [WarmUpSeconds] * num_jobs))
+    start = time.perf_counter()
+    for _ in pool.imap_unordered(render_tile_task, [(tile, 0) for tile in tiles]):
+        pass
+    seconds = time.perf_counter() - start
+    pool.close()
+    pool.join()
+    return seconds
+
+def run(scene_name="cornell_box_scene", width=96, num_samples=1, jobs=None, tile_size=16):
+    if jobs is None:
+        cpus = os.cpu_count() or 1
+        jobs = sorted({1, 2, 4, 8, 16, cpus} & set(range(1, cpus + 1)))
+    scene = load_scene(scene_name, width)
+    context = make_context(scene_name, scene, num_samples)
+    tiles = make_tiles(scene.camera.img_width, scene.camera.img_height, tile_size)
+    # speedups are relative to a serial render, which is timed even when 1
+    # is not one of the pool sizes
+    baseline = render_with_pool(context, tiles, 1)
+    print(f"  serial baseline: {baseline:.2f}s")
+    results = dict(scene=scene_name, width=scene.camera.img_width, height=scene.camera.img_height, baseline_seconds=baseline, runs={})
+    for num_jobs in jobs:
+        seconds = baseline if num_jobs == 1 else render_with_pool(context, tiles, num_jobs)
+        results["runs"][str(num_jobs)] = dict(
+            seconds=seconds,
+            speedup=baseline / seconds,
+            efficiency=baseline / seconds / num_jobs,
+        )
+        print(f"  {num_jobs} jobs: {seconds:.2f}s")
+    return results
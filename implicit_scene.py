@@ -0,0 +1,62 @@
+from src.base import BaseScene, Color
+from src.shapes import PlaneUV
+from src.implicit import ImplicitSurface, X, Y, Z
+from src.camera import Camera
+from src.light import PointLight
+from src.materials import SimpleMaterialWithShadows, CheckerboardMaterial
+from src.vector3d import Vector3D
+
+# class name should be Scene
+class Scene(BaseScene):
+    def __init__(self):
+        super().__init__("Implicit Expression Scene")
+
+        self.background = Color(0.7, 0.8, 1)
+        self.ambient_light = Color(0.08, 0.08, 0.08)
+        self.max_depth = 5
+
+        self.camera = Camera(
+            eye=Vector3D(3, -12, 4),
+            look_at=Vector3D(0, 0, 0),
+            up=Vector3D(0, 0, 1),
+            fov=45,
+            img_width=800,
+            img_height=600
+        )
+
+        self.lights = [
+            PointLight(Vector3D(5, -2, 6), Color(1.0, 0.95, 0.9), 4.0),
+            PointLight(Vector3D(-4, -3, 2), Color(0.3, 0.4, 0.6), 2.0)
+        ]
+
+        # Tangle cube written as an expression in X, Y and Z
+        tangle = X**4 - 5 * X**2 + Y**4 - 5 * Y**2 + Z**4 - 5 * Z**2 + 11.8
+        self.add(
+            ImplicitSurface(tangle, Vector3D(-3, -3, -3), Vector3D(3, 3, 3)),
+            SimpleMaterialWithShadows(0.3, 0.6, Color(0.8, 0.4, 0.2), 0.5, Color(1, 1, 1), 50)
+        )
+
+        # Torus around the tangle cube written as a function of x, y and z
+        R, r = 3.2, 0.4
+        torus = lambda x, y, z: (x**2 + y**2 + z**2 + R**2 - r**2)**2 - 4 * R**2 * (x**2 + y**2)
+        self.add(
+            ImplicitSurface(torus, Vector3D(-R - r, -R - r, -r), Vector3D(R + r, R + r, r)),
+            SimpleMaterialWithShadows(0.3, 0.6, Color(0.2, 0.4, 0.8), 0.5, Color(1, 1, 1), 50)
+        )
+
+        # Checkerboard ground plane
+        ground_material = CheckerboardMaterial(
+            ambient_coefficient=0.6,
+            diffuse_coefficient=0.8,
+            square_size=1.0,
+            white_color=Color(0.9, 0.9, 0.9),
+            black_color=Color(0.2, 0.2, 0.2)
+        )
+        self.add(
+            PlaneUV(
+                point=Vector3D(0, 0, -3),
+                normal=Vector3D(0, 0, 1),
+                forward_direction=Vector3D(1, 1, 0)
+            ),
+            ground_material
+        )
@@ -0,0 +1,58 @@
+# Instancing scene: a forest of 400 trees sharing one trunk and one crown
+import math
+import numpy as np
+from src.base import BaseScene, Color
+from src.shapes import Cylinder, PlaneUV
+from src.instancing import InstanceSet
+from src.camera import Camera
+from src.vector3d import Vector3D
+from src.light import PointLight
+from src.materials import SimpleMaterialWithShadows, CheckerboardMaterial
+from src.object_transform import translation_matrix, rotation_z_matrix, scale_matrix
+from mesh_scene import octahedron_mesh
+
+# class name should be Scene
+class Scene(BaseScene):
+    def __init__(self, num_trees=400, seed=3):
+        super().__init__("Instancing Scene")
+
+        self.background = Color(0.7, 0.8, 1)
+        self.ambient_light = Color(0.1, 0.1, 0.1)
+        self.max_depth = 3
+        self.camera = Camera(
+            eye=Vector3D(0, -22, 7),
+            look_at=Vector3D(0, 0, 0),
+            up=Vector3D(0, 0, 1),
+            fov=45,
+            img_width=800,
+            img_height=600
+        )
+        self.lights = [
+            PointLight(Vector3D(10, -10, 20), Color(1, 1, 0.95), 1.5),
+        ]
+
+        # the geometry exists once, every tree is two transforms
+        trunk = Cylinder(1.0, 0.15)
+        crown = octahedron_mesh(1.0)
+        bark = SimpleMaterialWithShadows(0.2, 0.7, Color(0.4, 0.25, 0.1), 0.1, Color(1, 1, 1), 8)
+        leaves = [
+            SimpleMaterialWithShadows(0.2, 0.7, Color(0.1, 0.5, 0.15), 0.2, Color(1, 1, 1), 16),
+            SimpleMaterialWithShadows(0.2, 0.7, Color(0.3, 0.6, 0.1), 0.2, Color(1, 1, 1), 16),
+            SimpleMaterialWithShadows(0.2, 0.7, Color(0.1, 0.4, 0.3), 0.2, Color(1, 1, 1), 16),
+        ]
+        rng = np.random.default_rng(seed)
+        shapes, matrices, materials = [], [], []
+        for k in range(num_trees):
+            x, y = rng.uniform(-15, 15, 2)
+            height = rng.uniform(1.5, 3.0)
+            place = translation_matrix(x, y, 0) @ rotation_z_matrix(rng.uniform(0, 2 * math.pi))
+            shapes.append(trunk)
+            matrices.append(place @ translation_matrix(0, 0, height / 4) @ scale_matrix(1, 1, height / 2))
+            materials.append(bark)
+            shapes.append(crown)
+            matrices.append(place @ translation_matrix(0, 0, height * 0.75) @ scale_matrix(0.6, 0.6, height / 2))
+            materials.append(leaves[k % len(leaves)])
+        self.add(InstanceSet(shapes, matrices, materials), bark)
+
+        ground = CheckerboardMaterial(ambient_coefficient=1, diffuse_coefficient=0.8, square_size=2.0, white_color=Color(0.6, 0.7, 0.5), black_color=Color(0.4, 0.5, 0.3))
+        self.add(PlaneUV(point=Vector3D(0, 0, 0), normal=Vector3D(0, 0, 1), forward_direction=Vector3D(1, 0, 0)), ground)
@@ -0,0 +1,35 @@
+# Merges shards and HDR accumulation files rendered by independent runs of raster.py
+import argparse
+
+import matplotlib.pyplot as plt
+
+from src.accumulator import Accumulator
+
+def main(args):
+    merged = Accumulator.load(args.inputs[0])
+    for path in args.inputs[1:]:
+        # raises if the files are from another scene, resolution or tiling,
+        # or if two of them rendered the same tile of the same pass
+        merged.merge(Accumulator.load(path))
+
+    # every pass must have all of its tiles, otherwise a shard is missing
+    incomplete = {p: merged.missing_tiles(p) for p in merged.coverage if p not in merged.passes}
+    for pass_index, missing in incomplete.items():
+        print(f"Pass {pass_index} is missing {len(missing)}/{merged.num_tiles} tiles: {missing[:10]}{'...' if len(missing) > 10 else ''}")
+    if incomplete and not args.allow_partial:
+        raise SystemExit("Refusing to assemble an incomplete image, use --allow_partial to override")
+    print(f"Merged {len(args.inputs)} files of scene {merged.meta['scene']}: {len(merged.passes)} complete passes")
+
+    if args.accumulate is not None:
+        merged.save(args.accumulate)
+    if args.output is not None:
+        plt.imsave(args.output, merged.image(), vmin=0, vmax=1, origin='lower')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge shards and accumulation files from raster.py runs")
+    parser.add_argument('inputs', type=str, nargs='+', help='Shard or accumulation files (.npz) to merge')
+    parser.add_argument('-o', '--output', type=str, help='Output image file name', default='output.png')
+    parser.add_argument('--accumulate', type=str, help='Write the merged accumulation file here', default=None)
+    parser.add_argument('--allow_partial', action='store_true', help='Write the image even if some tiles are missing')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,57 @@
+# Triangle mesh scene: a smooth shaded torus and a flat shaded octahedron
+import math
+import numpy as np
+from src.base import BaseScene, Color
+from src.shapes import PlaneUV
+from src.mesh import TriangleMesh
+from src.camera import Camera
+from src.vector3d import Vector3D
+from src.light import PointLight
+from src.materials import SimpleMaterialWithShadows, CheckerboardMaterial
+
+def torus_mesh(major_radius, minor_radius, nu, nv, center=(0, 0, 0)):
+    # nu x nv grid over the two angles, two triangles per cell
+    u, v = np.meshgrid(np.linspace(0, 2 * math.pi, nu, endpoint=False), np.linspace(0, 2 * math.pi, nv, endpoint=False), indexing="ij")
+    normals = np.stack([np.cos(v) * np.cos(u), np.cos(v) * np.sin(u), np.sin(v)], axis=-1).reshape(-1, 3)
+    ring = np.stack([major_radius * np.cos(u), major_radius * np.sin(u), np.zeros_like(u)], axis=-1).reshape(-1, 3)
+    vertices = ring + minor_radius * normals + np.array(center)
+    i, j = np.meshgrid(np.arange(nu), np.arange(nv), indexing="ij")
+    a = i * nv + j
+    b = (i + 1) % nu * nv + j
+    c = (i + 1) % nu * nv + (j + 1) % nv
+    d = i * nv + (j + 1) % nv
+    faces = np.concatenate([np.stack([a, b, c], axis=-1).reshape(-1, 3), np.stack([a, c, d], axis=-1).reshape(-1, 3)])
+    return TriangleMesh(vertices, faces, normals)
+
+def octahedron_mesh(size, center=(0, 0, 0)):
+    vertices = np.array([[1, 0, 0], [-1, 0, 0], [0, 1, 0], [0, -1, 0], [0, 0, 1], [0, 0, -1]]) * size + np.array(center)
+    faces = [[0, 2, 4], [2, 1, 4], [1, 3, 4], [3, 0, 4], [2, 0, 5], [1, 2, 5], [3, 1, 5], [0, 3, 5]]
+    return TriangleMesh(vertices, faces)
+
+# class name should be Scene
+class Scene(BaseScene):
+    def __init__(self):
+        super().__init__("Mesh Scene")
+
+        self.background = Color(0.7, 0.8, 1)
+        self.ambient_light = Color(0.1, 0.1, 0.1)
+        self.max_depth = 3
+        self.camera = Camera(
+            eye=Vector3D(0, -9, 4),
+            look_at=Vector3D(0, 0, 1),
+            up=Vector3D(0, 0, 1),
+            fov=40,
+            img_width=800,
+            img_height=600
+        )
+        self.lights = [
+            PointLight(Vector3D(4, -4, 8), Color(1, 1, 1), 1.5),
+        ]
+
+        gold = SimpleMaterialWithShadows(0.2, 0.7, Color(0.9, 0.7, 0.3), 0.6, Color(1, 1, 1), 64)
+        self.add(torus_mesh(1.6, 0.5, 96, 48, center=(-1.2, 0, 1.2)), gold)
+        teal = SimpleMaterialWithShadows(0.2, 0.7, Color(0.2, 0.7, 0.7), 0.3, Color(1, 1, 1), 32)
+        self.add(octahedron_mesh(1.0, center=(2.2, 0.5, 1.0)), teal)
+
+        floor = CheckerboardMaterial(ambient_coefficient=1, diffuse_coefficient=0.8, square_size=1.0, white_color=Color(0.9, 0.9, 0.9), black_color=Color(0.2, 0.2, 0.2))
+        self.add(PlaneUV(point=Vector3D(0, 0, 0), normal=Vector3D(0, 0, 1), forward_direction=Vector3D(1, 0, 0)), floor)
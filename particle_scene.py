@@ -0,0 +1,51 @@
+# Particle cloud scene: a spiral galaxy of small spheres in one SphereSet
+import math
+import numpy as np
+from src.base import BaseScene, Color
+from src.shapes import PlaneUV
+from src.sphere_set import SphereSet
+from src.camera import Camera
+from src.vector3d import Vector3D
+from src.light import PointLight
+from src.materials import SimpleMaterialWithShadows, CheckerboardMaterial
+
+# class name should be Scene
+class Scene(BaseScene):
+    def __init__(self, num_particles=50000, seed=7):
+        super().__init__("Particle Scene")
+
+        self.background = Color(0.02, 0.02, 0.05)
+        self.ambient_light = Color(0.1, 0.1, 0.1)
+        self.max_depth = 3
+        self.camera = Camera(
+            eye=Vector3D(0, -12, 7),
+            look_at=Vector3D(0, 0, 1),
+            up=Vector3D(0, 0, 1),
+            fov=45,
+            img_width=800,
+            img_height=600
+        )
+        self.lights = [
+            PointLight(Vector3D(0, 0, 8), Color(1, 0.95, 0.9), 1.5),
+        ]
+
+        # particles along three logarithmic spiral arms
+        rng = np.random.default_rng(seed)
+        arm = rng.integers(0, 3, num_particles)
+        r = rng.exponential(2.0, num_particles) + 0.3
+        angle = 2 * math.pi * arm / 3 + 1.2 * np.log(r) + rng.normal(0, 0.25, num_particles)
+        centers = np.stack([
+            r * np.cos(angle),
+            r * np.sin(angle),
+            1.5 + rng.normal(0, 0.15, num_particles) * np.exp(-r / 4),
+        ], axis=1)
+        radii = rng.uniform(0.01, 0.04, num_particles)
+        materials = [
+            SimpleMaterialWithShadows(0.3, 0.7, Color(1.0, 0.85, 0.6), 0.5, Color(1, 1, 1), 32),
+            SimpleMaterialWithShadows(0.3, 0.7, Color(0.6, 0.7, 1.0), 0.5, Color(1, 1, 1), 32),
+            SimpleMaterialWithShadows(0.3, 0.7, Color(1.0, 0.5, 0.7), 0.5, Color(1, 1, 1), 32),
+        ]
+        self.add(SphereSet(centers, radii, material_ids=arm, materials=materials), materials[0])
+
+        floor = CheckerboardMaterial(ambient_coefficient=1, diffuse_coefficient=0.6, square_size=1.0, white_color=Color(0.5, 0.5, 0.5), black_color=Color(0.1, 0.1, 0.1))
+        self.add(PlaneUV(point=Vector3D(0, 0, 0), normal=Vector3D(0, 0, 1), forward_direction=Vector3D(1, 0, 0)), floor)
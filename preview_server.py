@@ -0,0 +1,196 @@
+# asyncio preview server: streams tiles to the browser as they finish,
+# coarse-to-fine, and drops in-flight work when new parameters arrive
+import json
+import time
+import base64
+import asyncio
+import argparse
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.render import DefaultTileSize, make_tiles, resolve_image
+from src.service import Job, SceneCache, init_service_worker, render_job_task
+
+# image is refined by rendering at 1/8, 1/4, 1/2 and full resolution
+Levels = [8, 4, 2, 1]
+
+Page = """<!DOCTYPE html>
+<html><head><title>Raster preview</title></head>
+<body>
+<form id="form">
+  scene <input name="scene" value="ball_scene">
+  samples <input name="num_samples" value="1" size="3">
+  params <input name="params" value="" placeholder='{"key": value}'>
+  <button>render</button>
+</form>
+<p id="status"></p>
+<canvas id="canvas"></canvas>
+<script>
+let source = null;
+const canvas = document.getElementById("canvas");
+const ctx = canvas.getContext("2d");
+const status = document.getElementById("status");
+document.getElementById("form").onsubmit = (e) => {
+  e.preventDefault();
+  if (source) source.close();
+  source = new EventSource("/render?" + new URLSearchParams(new FormData(e.target)));
+  source.addEventListener("start", (e) => {
+    const d = JSON.parse(e.data);
+    canvas.width = d.width; canvas.height = d.height;
+    ctx.imageSmoothingEnabled = false;
+  });
+  source.addEventListener("tile", (e) => {
+    const d = JSON.parse(e.data);
+    const bytes = Uint8Array.from(atob(d.pixels), c => c.charCodeAt(0));
+    const data = new ImageData(d.w, d.h);
+    for (let i = 0; i < d.w * d.h; i++) {
+      data.data.set(bytes.subarray(3 * i, 3 * i + 3), 4 * i);
+      data.data[4 * i + 3] = 255;
+    }
+    const tile = document.createElement("canvas");
+    tile.width = d.w; tile.height = d.h;
+    tile.getContext("2d").putImageData(data, 0, 0);
+    ctx.drawImage(tile, d.x * d.sx, d.y * d.sy, d.w * d.sx, d.h * d.sy);
+  });
+  source.addEventListener("level", (e) => {
+    const d = JSON.parse(e.data);
+    status.textContent = `1/${d.level} resolution after ${d.elapsed.toFixed(2)}s`;
+  });
+  source.addEventListener("done", (e) => {
+    const d = JSON.parse(e.data);
+    status.textContent = `first image ${d.first_image.toFixed(2)}s, total ${d.total.toFixed(2)}s`;
+    source.close();
+  });
+  source.addEventListener("failed", (e) => { status.textContent = e.data; source.close(); });
+};
+</script>
+</body></html>
+"""
+
+class PreviewServer:
+    def __init__(self, num_jobs, tile_size):
+        self.num_jobs = num_jobs
+        self.tile_size = tile_size
+        self.executor = ProcessPoolExecutor(num_jobs, initializer=init_service_worker)
+        self.cache = SceneCache()
+        # the render currently streaming, cancelled by the next request
+        self.current = None
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode()
+            # skip the remaining request headers
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            _, target, _ = request_line.split(" ", 2)
+            url = urlsplit(target)
+            if url.path == "/":
+                body = Page.encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n")
+                writer.write(f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            elif url.path == "/render":
+                await self.stream(url, writer)
+            else:
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def stream(self, url, writer):
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        job = Job(
+            scene=query.get("scene", "ball_scene"),
+            num_samples=int(query.get("num_samples", 1)),
+            params=json.loads(query["params"]) if query.get("params") else None,
+            tile_size=self.tile_size,
+        )
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n\r\n")
+
+        # a new request always wins: stop streaming the previous render
+        if self.current is not None:
+            self.current.cancel()
+        self.current = asyncio.current_task()
+        try:
+            await self.render_levels(job, writer)
+        except asyncio.CancelledError:
+            print(f"{job.scene}: cancelled")
+        except Exception as e:
+            self.send_event(writer, "failed", f"{type(e).__name__}: {e}")
+        finally:
+            if self.current is asyncio.current_task():
+                self.current = None
+
+    def send_event(self, writer, event, data):
+        payload = data if isinstance(data, str) else json.dumps(data)
+        writer.write(f"event: {event}\ndata: {payload}\n\n".encode())
+
+    async def render_levels(self, job, writer):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        # building the scene imports user code, keep it off the event loop
+        camera = (await loop.run_in_executor(None, job.context, self.cache)).camera
+        width, height = camera.img_width, camera.img_height
+        self.send_event(writer, "start", dict(width=width, height=height))
+        first_image = None
+        for level in Levels:
+            level_job = Job(**dict(job.as_dict(), width=max(width // level, 1), height=max(height // level, 1)))
+            await self.render_level(level_job, width / level_job.width, height / level_job.height, writer)
+            elapsed = time.perf_counter() - start
+            if first_image is None:
+                first_image = elapsed
+            self.send_event(writer, "level", dict(level=level, elapsed=elapsed))
+            await writer.drain()
+        total = time.perf_counter() - start
+        self.send_event(writer, "done", dict(first_image=first_image, total=total))
+        print(f"{job.scene}: first image {first_image:.2f}s, total {total:.2f}s")
+
+    async def render_level(self, job, sx, sy, writer):
+        loop = asyncio.get_running_loop()
+        tiles = make_tiles(job.width, job.height, job.tile_size)
+        # only a small window of tiles is queued in the pool, so a cancelled
+        # render frees the workers after at most one tile each
+        window = set()
+        pending = iter(tiles)
+        try:
+            while True:
+                while len(window) < 2 * self.num_jobs:
+                    tile = next(pending, None)
+                    if tile is None:
+                        break
+                    window.add(loop.run_in_executor(self.executor, render_job_task, (job, tile, 0)))
+                if not window:
+                    break
+                finished, window = await asyncio.wait(window, return_when=asyncio.FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    tile = result.tile
+                    pixels = resolve_image(result.sums, result.counts)
+                    # image rows start at the bottom (origin='lower'), canvas at the top
+                    pixels = (pixels[::-1] * 255).astype(np.uint8)
+                    self.send_event(writer, "tile", dict(
+                        x=tile.x0, y=job.height - tile.y1, w=tile.width, h=tile.height, sx=sx, sy=sy,
+                        pixels=base64.b64encode(pixels.tobytes()).decode(),
+                    ))
+                await writer.drain()
+        finally:
+            for future in window:
+                future.cancel()
+
+async def serve(args):
+    preview = PreviewServer(args.num_jobs, args.tile_size)
+    server = await asyncio.start_server(preview.handle, "127.0.0.1", args.port)
+    print(f"Preview server on http://127.0.0.1:{args.port}/")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming preview server")
+    parser.add_argument('-j', '--num_jobs', type=int, help='Number of worker processes', default=4)
+    parser.add_argument('-t', '--tile_size', type=int, help='Tile size in pixels', default=DefaultTileSize)
+    parser.add_argument('--port', type=int, help='Localhost HTTP port', default=8000)
+    args = parser.parse_args()
+    asyncio.run(serve(args))
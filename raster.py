@@ -1,75 +1,296 @@
-import random
+import os
+import json
+import time
 import argparse
 import importlib
-from itertools import product
-from functools import partial
-from multiprocessing import Pool
 
 import numpy as np
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 
-from src.base import Color
-
-class Context:
-    def __init__(self, **kwargs):
-        self.__dict__.update(kwargs)
-
-def render_pixel(context, ij):
-    i, j = ij
-    pixel = Color(0, 0, 0)
-    total_rays = 0
-    for _ in range(context.num_samples):
-        # random offset for anti-aliasing
-        dx = np.random.uniform(-0.5, 0.5)
-        dy = np.random.uniform(-0.5, 0.5)
-        # middle of pixel coordinates
-        x = j + 0.5 + dx
-        y = i + 0.5 + dy
-        # rays from camera (supports depth of field)
-        rays = context.camera.rays(x, y)
-        total_rays += len(rays)
-        for ray in rays:
-            # hit ray with scene
-            hit_rec = context.scene.hit(ray)
-            # test if hit something
-            if hit_rec.hit:
-                material = hit_rec.material
-                shaded_color = material.shade(hit_rec, context.scene)
-                pixel = pixel + shaded_color
-            else:
-                pixel = pixel + context.scene.background
-    if total_rays > 0:
-        pixel = pixel / total_rays
-    return (i, j, pixel)
+from src.render import Backends, Context, DefaultTileSize, make_tiles, shard_tiles, render_tile, render_tile_task, make_pool, StartMethods
+from src.accumulator import Accumulator
+from src.gbuffer import GBuffer, GBufferRecorder, GBufferRelighter, scene_geometry
+from src.incremental import DependencyTracker, IncrementalCache, scene_keys
+from src.adaptive import AdaptiveSampler, FeatureTracer
+from src.fingerprint import fingerprint
+from src.checkpoint import Checkpoint
+from src import stats
+from src.heatmap import CostChannels, save_cost_map
+from src.shared import SharedScene
+from src.scheduler import CostModel, TileAssembler, probe_costs, plan
+from src.ordering import Orders, order_tiles
+
+def parse_shard(spec):
+    # "k/N": render the k-th of N interleaved shards
+    try:
+        k, n = (int(v) for v in spec.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard '{spec}', expected k/N")
+    if n < 1 or not 0 <= k < n:
+        raise argparse.ArgumentTypeError(f"invalid shard '{spec}', expected 0 <= k < N")
+    return k, n
+
+def parse_tile_range(spec):
+    # "a:b": render tiles a (inclusive) to b (exclusive)
+    try:
+        a, b = (int(v) for v in spec.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid tile range '{spec}', expected a:b")
+    if not 0 <= a < b:
+        raise argparse.ArgumentTypeError(f"invalid tile range '{spec}', expected 0 <= a < b")
+    return a, b
+
+class EmptySelection(ValueError):
+    # --shard or --tiles selecting none of the tiles, which is only known
+    # once the scene is loaded; reported as a usage error
+    pass
 
-def main(args, pool):
+def dispatch(args, context, tiles, pending, pool, pixel_costs=None):
+    # yields whole tile results, the passes of every tile in increasing
+    # order so resumed renders sum in the same order bit for bit; tiles are
+    # the ones the results are for, pixel_costs the cost pre-pass when the
+    # schedule uses it
+    if pixel_costs is not None and pending:
+        tasks = plan(pending, CostModel(pixel_costs), args.num_jobs)
+        assembler = TileAssembler(tiles, tasks)
+        if pool is None:
+            parts = (render_tile(context, tile, pass_index) for tile, pass_index in tasks)
+        else:
+            parts = pool.imap_unordered(render_tile_task, tasks)
+        for part in parts:
+            yield from assembler.add(part)
+    elif pool is None:
+        for tile, pass_index in pending:
+            yield render_tile(context, tile, pass_index)
+    else:
+        yield from pool.imap(render_tile_task, pending)
+
+def main(args):
     # load scene from file args.scene
     scene = importlib.import_module(args.scene).Scene()
+    gbuffer = None
+    materials = None
+    # fingerprints are taken before statistics wrap the implicit functions
+    if args.gbuffer is not None or args.relight is not None:
+        camera_key = fingerprint(scene.camera)
+        geometry_key, materials = scene_geometry(scene)
+    if args.incremental is not None:
+        keys = scene_keys(scene)
+    if args.relight is not None:
+        gbuffer = GBuffer.load(args.relight)
+        gbuffer.check(args.scene, camera_key, geometry_key)
+        # rendered exactly as the G-buffer was
+        args.num_samples = gbuffer.meta["num_samples"]
+        args.tile_size = gbuffer.meta["tile_size"]
+        print(f"Relighting from {args.relight}")
+    if args.stats or args.cost_map:
+        # must happen before the pool forks so workers are instrumented too
+        stats.enable()
+        stats.instrument_scene(scene)
+    render_stats = stats.RenderStats()
     camera = scene.camera
     img_width = camera.img_width
     img_height = camera.img_height
-    image = np.zeros((img_height, img_width, 3)) # create tensor for image: RGB
-
-    # for each pixel, determine if it is inside any primitive in the scene
-    # use cartesian product for efficiency
-    print("Rendering... with anti-aliasing samples:", args.num_samples)
-    context = Context(scene=scene, camera=camera, num_samples=args.num_samples)
-    with tqdm(total=img_height*img_width) as pbar:
-        if args.num_jobs <= 1:
-            for i, j in product(range(img_height), range(img_width)):
-                _, _, pixel = render_pixel(context, (i, j))
-                image[i, j] = np.clip(pixel.as_list(), 0, 1)
-                pbar.update(1)
-                pbar.refresh()
-        else:
-            for i, j, pixel in pool.imap(partial(render_pixel, context), product(range(img_height), range(img_width))):
-                image[i, j] = np.clip(pixel.as_list(), 0, 1)
-                pbar.update(1)
+
+    # the image is split in tiles, each one rendered with its own random
+    # stream seeded from (scene, tile, pass)
+    tiles = make_tiles(img_width, img_height, args.tile_size)
+    selected = tiles
+    if args.shard is not None:
+        selected = shard_tiles(tiles, *args.shard)
+    elif args.tiles is not None:
+        selected = tiles[slice(*args.tiles)]
+    elif gbuffer is not None:
+        selected = [tiles[k] for k in sorted(set(k for k, _ in gbuffer.meta["tasks"]))]
+    if not selected:
+        # an empty partial render would still be written and merged
+        option = f"--shard {args.shard[0]}/{args.shard[1]}" if args.shard is not None else f"--tiles {args.tiles[0]}:{args.tiles[1]}"
+        raise EmptySelection(f"{option} selects none of the {len(tiles)} tiles")
+    partial = len(selected) < len(tiles)
+    # neighbouring tiles rendered close in time share cached scene data
+    selected = order_tiles(selected, args.tile_order)
+    meta = dict(
+        scene=args.scene,
+        img_width=img_width,
+        img_height=img_height,
+        tile_size=args.tile_size,
+    )
+
+    # per-pixel HDR accumulators, optionally continuing a previous run
+    accumulator = Accumulator(meta, len(tiles))
+    if args.accumulate is not None and os.path.exists(args.accumulate):
+        accumulator = Accumulator.load(args.accumulate)
+        if accumulator.meta != meta:
+            raise ValueError(f"{args.accumulate} was rendered with different settings: {accumulator.meta}")
+        print(f"Accumulating on top of {len(accumulator.passes)} passes from {args.accumulate}")
+    first_pass = args.first_pass if args.first_pass is not None else accumulator.next_pass()
+    passes = list(range(first_pass, first_pass + args.passes))
+    if gbuffer is not None:
+        passes = gbuffer.passes
+
+    incremental = None
+    if args.incremental is not None:
+        incremental = IncrementalCache(args.incremental, dict(meta, num_samples=args.num_samples, passes=passes), len(tiles))
+        previous = incremental.load() if incremental.exists() else None
+        if previous is not None:
+            # tiles not affected by the scene changes are kept as they are
+            dirty = incremental.dirty_tiles(scene, keys)
+            previous.reset_tiles([tiles[k] for k in dirty])
+            incremental.reset(dirty)
+            accumulator = previous
+            print(f"Re-rendering {len(dirty)} of {len(tiles)} tiles affected by changes since the last run")
+
+    checkpoint = None
+    if args.checkpoint is not None:
+        checkpoint_meta = dict(meta, num_samples=args.num_samples, passes=passes, tiles=sorted(tile.index for tile in selected))
+        checkpoint = Checkpoint(args.checkpoint, checkpoint_meta, args.checkpoint_interval)
+        if args.resume and checkpoint.exists():
+            accumulator = checkpoint.load()
+            print(f"Resuming from {args.checkpoint}")
+
+    pending = [(tile, p) for p in passes for tile in selected if not accumulator.is_done(tile.index, p)]
+    if gbuffer is not None:
+        recorded = set(tuple(task) for task in gbuffer.meta["tasks"])
+        pending = [(tile, p) for tile, p in pending if (tile.index, p) in recorded]
+    recorder = None
+    if args.gbuffer is not None:
+        gbuffer_meta = dict(meta, num_samples=args.num_samples, tasks=[(tile.index, p) for tile, p in pending], camera=camera_key, geometry=geometry_key)
+        recorder = GBuffer(gbuffer_meta, sorted(set(p for _, p in pending)), img_width, img_height)
+    tracer = None
+    if gbuffer is not None:
+        tracer = GBufferRelighter
+    elif recorder is not None:
+        tracer = GBufferRecorder
+    elif incremental is not None:
+        tracer = DependencyTracker
+    adaptive = None
+    if args.adaptive is not None:
+        adaptive = AdaptiveSampler(img_width, img_height, args.num_samples, args.adaptive)
+        tracer = FeatureTracer
+    total_pixels = len(passes) * sum(tile.width * tile.height for tile in selected)
+    remaining_pixels = sum(tile.width * tile.height for tile, _ in pending)
+
+    print("Rendering... with anti-aliasing samples:", args.num_samples, "passes:", len(passes))
+    if partial:
+        print(f"Partial render of {len(selected)}/{len(tiles)} tiles")
+    context = Context(scene=scene, camera=camera, num_samples=args.num_samples, scene_key=args.scene, stats=args.stats or args.cost_map, track_cost=args.cost_map,
+                      pixel_order=args.pixel_order, tracer=tracer, gbuffer=gbuffer, materials=materials)
+    cost = np.zeros((img_height, img_width, len(CostChannels))) if args.cost_map else None
+    start = time.perf_counter()
+    busy = 0.0
+    replay = dict(replayed=0, traced=0)
+
+    def add_result(result):
+        nonlocal busy
+        accumulator.add_tile(result, args.num_samples)
+        render_stats.merge(result.stats)
+        if recorder is not None:
+            recorder.add_tile(result)
+        if incremental is not None:
+            incremental.add_tile(result)
+        if adaptive is not None:
+            adaptive.add_tile(result)
+        if result.replay is not None:
+            for k, v in result.replay.items():
+                replay[k] += v
+        busy += result.seconds
+        if cost is not None:
+            tile = result.tile
+            cost[tile.y0:tile.y1, tile.x0:tile.x1] += result.cost
+        if checkpoint is not None:
+            checkpoint.maybe_save(accumulator)
+
+    pool = None
+    shared = None
+    finished = False
+    try:
+        if args.num_jobs > 1:
+            if args.backend == 'processes' and not args.copy_scene:
+                # workers map the scene (and G-buffer) arrays instead of
+                # holding a copy each
+                shared = SharedScene([scene, gbuffer])
+            pool = make_pool(args.backend, args.num_jobs, context, args.start_method)
+        # the cost pre-pass, also used by the passes of adaptive sampling
+        pixel_costs = probe_costs(context, args.probe_scale, pool) if args.schedule == 'cost' and pending else None
+
+        with tqdm(total=total_pixels, initial=total_pixels - remaining_pixels) as pbar:
+            for result in dispatch(args, context, tiles, pending, pool, pixel_costs):
+                add_result(result)
+                pbar.update(result.tile.width * result.tile.height)
                 pbar.refresh()
+        if adaptive is not None:
+            # the flagged pixels of the first pass get the remaining samples
+            refine = adaptive.refine_tasks(selected, accumulator.image())
+            flagged = int(adaptive.mask.sum())
+            print(f"Supersampling {flagged} of {img_width * img_height} pixels ({100 * flagged / (img_width * img_height):.1f}%) up to {args.adaptive} samples")
+            with tqdm(total=sum(int(tile.mask.sum()) for tile, _ in refine)) as pbar:
+                # results are joined into the masked tiles
+                for result in dispatch(args, context, [tile for tile, _ in refine], refine, pool, pixel_costs):
+                    add_result(result)
+                    pbar.update(int(result.tile.mask.sum()))
+                    pbar.refresh()
+        finished = True
+    finally:
+        if pool is not None:
+            # on errors the queued tasks are dropped instead of waited for
+            if finished:
+                pool.close()
+            else:
+                pool.terminate()
+            pool.join()
+        # the shared memory block outlives the process unless it is unlinked
+        if shared is not None:
+            shared.close()
+
+    # share of the workers' time spent rendering tiles, the rest is idle
+    # time, the pre-pass and overhead
+    wall = time.perf_counter() - start
+    if pending:
+        efficiency = busy / (wall * max(args.num_jobs, 1))
+        print(f"Parallel efficiency: {100 * efficiency:.1f}% ({busy:.2f}s of tile work in {wall:.2f}s on {max(args.num_jobs, 1)} workers)")
+
+    render_stats.counters["time.wall"] += wall
+
+    if adaptive is not None:
+        rays = int(accumulator.counts.sum())
+        uniform = img_width * img_height * args.adaptive
+        print(f"Rays: {rays}, {100 * rays / uniform:.1f}% of uniform supersampling with {args.adaptive} samples")
+    if gbuffer is not None:
+        queries = replay["replayed"] + replay["traced"]
+        print(f"Shading queries reused from the G-buffer: {replay['replayed']} of {queries}, {replay['traced']} traced")
+    if recorder is not None:
+        recorder.save(args.gbuffer)
+        print(f"G-buffer written to {args.gbuffer}")
+
+    if args.stats:
+        print(render_stats.report())
+        if args.stats_output is not None:
+            with open(args.stats_output, "w") as f:
+                json.dump(dict(scene=args.scene, **render_stats.as_dict()), f, indent=2)
+
+    if cost is not None:
+        # only covers the tiles rendered by this run
+        array_path, image_path = save_cost_map(args.output, cost, args.cost_channel)
+        print(f"Cost map written to {array_path} and {image_path}")
+
+    if checkpoint is not None:
+        checkpoint.save(accumulator)
+    if args.accumulate is not None:
+        accumulator.save(args.accumulate)
+    if incremental is not None:
+        incremental.save(accumulator, keys)
+
+    if partial:
+        # a shard only holds part of the image, merge.py assembles them
+        if args.accumulate is None:
+            path = os.path.splitext(args.output)[0] + ".npz"
+            accumulator.save(path)
+            print(f"Partial output written to {path}")
+        return
 
     # save image as png using matplotlib
-    plt.imsave(args.output, image, vmin=0, vmax=1, origin='lower')
+    plt.imsave(args.output, accumulator.image(), vmin=0, vmax=1, origin='lower')
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Raster module main function")
@@ -77,10 +298,58 @@ if __name__ == "__main__":
     parser.add_argument('-n', '--num_samples', type=int, help='Number of samples per pixel for anti-aliasing', default=1)
     parser.add_argument('-j', '--num_jobs', type=int, help='Number of parallel jobs for rendering', default=4)
     parser.add_argument('-o', '--output', type=str, help='Output image file name', default='output.png')
+    parser.add_argument('--backend', type=str, choices=Backends, help='Run the parallel jobs in worker processes or in threads sharing the scene', default='processes')
+    parser.add_argument('--start_method', type=str, choices=StartMethods, help='How worker processes are started (defaults to the platform default)', default=None)
+    parser.add_argument('--copy_scene', action='store_true', help='Give every worker process its own copy of the scene arrays instead of shared memory')
+    parser.add_argument('-t', '--tile_size', type=int, help='Tile size in pixels', default=DefaultTileSize)
+    parser.add_argument('-p', '--passes', type=int, help='Number of sample passes to render, each with num_samples per pixel', default=1)
+    parser.add_argument('--first_pass', type=int, help='Index of the first pass (defaults to the one after the accumulated passes)', default=None)
+    parser.add_argument('--accumulate', type=str, help='HDR accumulation file (.npz) that new passes are added to', default=None)
+    parser.add_argument('--shard', type=parse_shard, help='Render only shard k/N of the tiles (interleaved)', default=None)
+    parser.add_argument('--tiles', type=parse_tile_range, help='Render only tiles a:b', default=None)
+    parser.add_argument('--tile_order', type=str, choices=Orders, help='Order in which tiles are dispatched', default='hilbert')
+    parser.add_argument('--pixel_order', type=str, choices=Orders, help='Order of the pixels inside a tile', default='morton')
+    parser.add_argument('--schedule', type=str, choices=['static', 'cost'], help='Tile dispatch: static in --tile_order, or most expensive first from a low resolution pre-pass', default='static')
+    parser.add_argument('--probe_scale', type=int, help='Resolution divisor of the cost pre-pass', default=4)
+    parser.add_argument('--stats', action='store_true', help='Count scene and shape hits, implicit evaluations and rays while rendering')
+    parser.add_argument('--stats_output', type=str, help='Also write the statistics to this JSON file', default=None)
+    parser.add_argument('--cost_map', action='store_true', help='Write the per-pixel render cost next to the output image')
+    parser.add_argument('--cost_channel', type=str, choices=CostChannels, help='Cost shown in the false-color cost image', default='time')
+    parser.add_argument('--checkpoint', type=str, help='Directory where render progress is periodically saved', default=None)
+    parser.add_argument('--checkpoint_interval', type=float, help='Seconds between checkpoint saves', default=60.0)
+    parser.add_argument('--resume', action='store_true', help='Resume from the checkpoint directory, skipping finished tiles')
+    parser.add_argument('--gbuffer', type=str, help='Also write the hits of the rendered rays to this G-buffer file (.npz) for --relight', default=None)
+    parser.add_argument('--relight', type=str, help='Shade the image again from a G-buffer written with --gbuffer, only tracing the shading queries that changed', default=None)
+    parser.add_argument('--adaptive', type=int, help='Render num_samples per pixel, then supersample only the pixels on edges (shape, normal, depth or color discontinuities) up to this many samples', default=None)
+    parser.add_argument('--incremental', type=str, help='Directory keeping the image and what every tile depends on, so the next run only re-renders the tiles affected by scene changes', default=None)
     args = parser.parse_args()
 
-    # create a pool of workers for parallel processing
-    pool = Pool(args.num_jobs)
-    main(args, pool)
-    pool.close()
-    pool.join()
\ No newline at end of file
+    if args.resume and args.checkpoint is None:
+        parser.error("--resume requires --checkpoint")
+    if args.stats_output is not None:
+        args.stats = True
+    if args.backend == 'threads' and (args.stats or args.cost_map):
+        # the counters are per process, threads would mix their tiles
+        parser.error("--stats and --cost_map require the processes backend")
+    if args.shard is not None and args.tiles is not None:
+        parser.error("--shard and --tiles are mutually exclusive")
+    if args.gbuffer is not None and args.resume:
+        # tiles rendered before the resume would be missing
+        parser.error("--gbuffer cannot be written by a resumed render")
+    if args.relight is not None and any(v is not None for v in (args.gbuffer, args.shard, args.tiles, args.accumulate, args.checkpoint)):
+        # the tiles and passes come from the G-buffer
+        parser.error("--relight cannot be combined with --gbuffer, --shard, --tiles, --accumulate or --checkpoint")
+    if args.incremental is not None and any(v is not None for v in (args.gbuffer, args.relight, args.shard, args.tiles, args.accumulate, args.checkpoint, args.first_pass)):
+        # the directory holds the whole image and all its passes
+        parser.error("--incremental cannot be combined with --gbuffer, --relight, --shard, --tiles, --accumulate, --checkpoint or --first_pass")
+    if args.adaptive is not None and (args.passes != 1 or any(v is not None for v in (args.gbuffer, args.relight, args.incremental, args.shard, args.tiles, args.accumulate, args.checkpoint, args.first_pass))):
+        # the first pass of the whole image decides where the others render
+        parser.error("--adaptive cannot be combined with --passes, --gbuffer, --relight, --incremental, --shard, --tiles, --accumulate, --checkpoint or --first_pass")
+    if args.adaptive is not None and args.adaptive % args.num_samples:
+        # every further pass adds num_samples
+        parser.error(f"--adaptive must be a multiple of --num_samples ({args.num_samples})")
+
+    try:
+        main(args)
+    except EmptySelection as e:
+        parser.error(str(e))
@@ -0,0 +1,49 @@
+# Thin client for render_server.py: submits one job and saves the image
+import json
+import socket
+import argparse
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from src.render import DefaultTileSize
+from src.service import send_message, recv_message
+
+def main(args):
+    job = dict(
+        scene=args.scene,
+        num_samples=args.num_samples,
+        passes=args.passes,
+        params=json.loads(args.params) if args.params else None,
+        width=args.width,
+        height=args.height,
+        tile_size=args.tile_size,
+    )
+    if args.port is not None:
+        sock = socket.create_connection(("127.0.0.1", args.port))
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(args.socket)
+    with sock, sock.makefile("rwb") as stream:
+        send_message(stream, dict(job=job))
+        header, payload = recv_message(stream)
+    if header["status"] != "ok":
+        raise SystemExit(f"Render failed: {header['message']}")
+    image = np.frombuffer(payload, dtype=np.float32).reshape(header["shape"])
+    plt.imsave(args.output, image, vmin=0, vmax=1, origin='lower')
+    print(f"Rendered {args.scene} in {header['time']:.2f}s -> {args.output}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Submit a render job to render_server.py")
+    parser.add_argument('-s', '--scene', type=str, help='Scene name', default='ball_scene')
+    parser.add_argument('-n', '--num_samples', type=int, help='Number of samples per pixel for anti-aliasing', default=1)
+    parser.add_argument('-p', '--passes', type=int, help='Number of sample passes', default=1)
+    parser.add_argument('-o', '--output', type=str, help='Output image file name', default='output.png')
+    parser.add_argument('-t', '--tile_size', type=int, help='Tile size in pixels', default=DefaultTileSize)
+    parser.add_argument('--width', type=int, help='Override the camera image width', default=None)
+    parser.add_argument('--height', type=int, help='Override the camera image height', default=None)
+    parser.add_argument('--params', type=str, help='JSON object of keyword arguments for the Scene constructor', default=None)
+    parser.add_argument('--socket', type=str, help='Unix socket path of the server', default='/tmp/raster.sock')
+    parser.add_argument('--port', type=int, help='Localhost TCP port of the server instead of a Unix socket', default=None)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,87 @@
+# Long running render server: keeps a warm worker pool and the built scenes
+# around so queued jobs run back-to-back without start-up cost
+import os
+import time
+import queue
+import argparse
+import threading
+import socketserver
+from multiprocessing import Pool
+
+import numpy as np
+
+from src.service import Job, SceneCache, init_service_worker, render_job, send_message, recv_message
+
+class JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            header, _ = recv_message(self.rfile)
+            job = Job(**header["job"])
+        except (ConnectionError, ValueError, KeyError, TypeError) as e:
+            send_message(self.wfile, dict(status="error", message=f"bad request: {e}"))
+            return
+        # the dispatcher fills in `result` and wakes us up
+        request = dict(job=job, done=threading.Event(), result=None)
+        self.server.jobs.put(request)
+        request["done"].wait()
+        status, value, elapsed = request["result"]
+        if status == "ok":
+            image = value.astype(np.float32)
+            send_message(self.wfile, dict(status="ok", shape=list(image.shape), time=elapsed), image.tobytes())
+        else:
+            send_message(self.wfile, dict(status="error", message=value))
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def dispatch(jobs, pool, cache):
+    # jobs are rendered one at a time, each using the whole pool
+    while True:
+        request = jobs.get()
+        job = request["job"]
+        start = time.perf_counter()
+        try:
+            image = render_job(job, pool, cache)
+            request["result"] = ("ok", image, time.perf_counter() - start)
+        except Exception as e:
+            request["result"] = ("error", f"{type(e).__name__}: {e}", time.perf_counter() - start)
+        print(f"{job.scene} n={job.num_samples} {request['result'][0]} in {request['result'][2]:.2f}s, {jobs.qsize()} queued")
+        request["done"].set()
+
+def main(args):
+    pool = Pool(args.num_jobs, initializer=init_service_worker, initargs=(args.cache_size,))
+    cache = SceneCache(args.cache_size)
+    if args.port is not None:
+        # only listen on localhost, the protocol has no authentication
+        server = TCPServer(("127.0.0.1", args.port), JobHandler)
+        print(f"Render server listening on 127.0.0.1:{args.port}")
+    else:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        server = UnixServer(args.socket, JobHandler)
+        print(f"Render server listening on {args.socket}")
+    server.jobs = queue.Queue()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        dispatch(server.jobs, pool, cache)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        pool.terminate()
+        if args.port is None and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render server with a persistent worker pool")
+    parser.add_argument('-j', '--num_jobs', type=int, help='Number of worker processes', default=4)
+    parser.add_argument('--socket', type=str, help='Unix socket path', default='/tmp/raster.sock')
+    parser.add_argument('--port', type=int, help='Listen on this localhost TCP port instead of a Unix socket', default=None)
+    parser.add_argument('--cache_size', type=int, help='Number of built scenes kept per process', default=8)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,127 @@
+# Renders the frames of an animated scene in one run: the worker pool and
+# the scene (and its acceleration structures) are set up once, workers move
+# their copy of the scene from frame to frame, and each frame is written
+# while the next one renders. With --temporal, frames also reuse the
+# samples of the previous frame where it saw the same surfaces.
+import time
+import argparse
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from tqdm import tqdm
+import matplotlib.pyplot as plt
+
+from src.render import Context, DefaultTileSize, make_tiles, render_tile, render_frame_tile_task, resolve_image, set_frame, make_pool, StartMethods
+from src.shared import SharedScene
+from src.ordering import Orders, order_tiles
+from src.temporal import SurfaceTracer, TemporalHistory
+
+def parse_frames(spec):
+    # "a:b": frames a (inclusive) to b (exclusive)
+    try:
+        a, b = (int(v) for v in spec.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid frame range '{spec}', expected a:b")
+    return a, b
+
+def render_local(context, tasks):
+    for frame, tile, pass_index in tasks:
+        set_frame(context, frame)
+        yield frame, render_tile(context, tile, pass_index)
+
+def main(args):
+    scene = importlib.import_module(args.scene).Scene()
+    if not hasattr(scene, "set_frame"):
+        raise SystemExit(f"{args.scene} is not animated, its Scene has no set_frame(frame)")
+    frames = list(range(*args.frames)) if args.frames is not None else list(range(scene.frames))
+    img_width = scene.camera.img_width
+    img_height = scene.camera.img_height
+    tiles = order_tiles(make_tiles(img_width, img_height, args.tile_size), args.tile_order)
+    context = Context(scene=scene, camera=scene.camera, num_samples=args.num_samples, scene_key=args.scene, sequence_key=args.scene, pixel_order=args.pixel_order)
+    history = None
+    if args.temporal:
+        context.tracer = SurfaceTracer
+        history = TemporalHistory(args.history_samples)
+    # tiles of all frames in one stream, so workers never wait for the
+    # last tiles of a frame before starting on the next one
+    tasks = ((frame, tile, 0) for frame in frames for tile in tiles)
+
+    print(f"Rendering {len(frames)} frames with anti-aliasing samples: {args.num_samples}")
+    start = time.perf_counter()
+    pool = None
+    shared = None
+    if args.num_jobs > 1:
+        if not args.copy_scene:
+            shared = SharedScene(scene)
+        pool = make_pool('processes', args.num_jobs, context, args.start_method)
+        results = pool.imap(render_frame_tile_task, tasks)
+    else:
+        results = render_local(context, tasks)
+
+    # frames are written by a background thread
+    writer = ThreadPoolExecutor(1)
+    writes = []
+    sums = np.zeros((img_height, img_width, 3))
+    counts = np.zeros((img_height, img_width))
+    if history is not None:
+        points = np.full((img_height, img_width, 3), np.nan)
+        normals = np.full((img_height, img_width, 3), np.nan)
+    remaining = len(tiles)
+    frame_start = start
+    with tqdm(total=len(frames) * img_width * img_height) as pbar:
+        for frame, result in results:
+            tile = result.tile
+            sums[tile.y0:tile.y1, tile.x0:tile.x1] = result.sums
+            counts[tile.y0:tile.y1, tile.x0:tile.x1] = result.counts
+            if history is not None:
+                points[tile.y0:tile.y1, tile.x0:tile.x1] = result.surface["points"]
+                normals[tile.y0:tile.y1, tile.x0:tile.x1] = result.surface["normals"]
+            remaining -= 1
+            pbar.update(tile.width * tile.height)
+            if remaining == 0:
+                path = args.output.format(frame=frame)
+                reuse = ""
+                if history is not None:
+                    # the history keeps a reference to the arrays, the next
+                    # frame gets new ones
+                    mean, reused = history.blend(result.surface["camera"], sums, counts, points, normals)
+                    image = np.clip(mean, 0, 1)
+                    reuse = f", history reused by {100 * reused:.1f}% of the pixels"
+                    points = np.full((img_height, img_width, 3), np.nan)
+                    normals = np.full((img_height, img_width, 3), np.nan)
+                else:
+                    image = resolve_image(sums, counts)
+                writes.append(writer.submit(plt.imsave, path, image, vmin=0, vmax=1, origin='lower'))
+                now = time.perf_counter()
+                pbar.write(f"Frame {frame} in {now - frame_start:.2f}s{reuse} -> {path}")
+                frame_start = now
+                remaining = len(tiles)
+    for write in writes:
+        write.result()
+    writer.shutdown()
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if shared is not None:
+        shared.close()
+
+    wall = time.perf_counter() - start
+    print(f"{len(frames)} frames in {wall:.2f}s: {60 * len(frames) / wall:.2f} frames per minute")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the frames of an animated scene")
+    parser.add_argument('-s', '--scene', type=str, help='Scene name, its Scene needs frames and set_frame(frame)', default='turntable_scene')
+    parser.add_argument('-n', '--num_samples', type=int, help='Number of samples per pixel for anti-aliasing', default=1)
+    parser.add_argument('-j', '--num_jobs', type=int, help='Number of worker processes', default=4)
+    parser.add_argument('-o', '--output', type=str, help='Output file name pattern, formatted with the frame number', default='frame_{frame:04d}.png')
+    parser.add_argument('-t', '--tile_size', type=int, help='Tile size in pixels', default=DefaultTileSize)
+    parser.add_argument('--frames', type=parse_frames, help='Render only frames a:b (defaults to all frames of the scene)', default=None)
+    parser.add_argument('--start_method', type=str, choices=StartMethods, help='How worker processes are started (defaults to the platform default)', default=None)
+    parser.add_argument('--copy_scene', action='store_true', help='Give every worker process its own copy of the scene arrays instead of shared memory')
+    parser.add_argument('--tile_order', type=str, choices=Orders, help='Order in which tiles are dispatched', default='hilbert')
+    parser.add_argument('--temporal', action='store_true', help='Blend every frame with the samples of the previous frame where it saw the same surfaces')
+    parser.add_argument('--history_samples', type=int, help='With --temporal, samples per pixel the blended history may hold', default=32)
+    parser.add_argument('--pixel_order', type=str, choices=Orders, help='Order of the pixels inside a tile', default='morton')
+    args = parser.parse_args()
+    main(args)
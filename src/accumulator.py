@@ -0,0 +1,121 @@
+# HDR per-pixel sample accumulation that can grow across runs and machines
+import os
+import json
+
+import numpy as np
+
+from .render import resolve_image
+
+class Accumulator:
+    def __init__(self, meta, num_tiles):
+        # meta identifies the image: scene, resolution and tiling. Only
+        # accumulators with the same meta can be merged.
+        self.meta = dict(meta)
+        self.num_tiles = num_tiles
+        height, width = meta["img_height"], meta["img_width"]
+        # per pixel radiance sum, sum of squares and number of rays
+        self.sums = np.zeros((height, width, 3))
+        self.sums_sq = np.zeros((height, width, 3))
+        self.counts = np.zeros((height, width))
+        # pass index -> mask of the tiles already accumulated for that pass
+        self.coverage = dict()
+        # pass index -> samples per pixel the pass was rendered with
+        self.pass_samples = dict()
+
+    def is_done(self, tile_index, pass_index):
+        mask = self.coverage.get(pass_index)
+        return mask is not None and bool(mask[tile_index])
+
+    def add_tile(self, result, num_samples):
+        tile, pass_index = result.tile, result.pass_index
+        if self.is_done(tile.index, pass_index):
+            raise ValueError(f"Tile {tile.index} of pass {pass_index} was already accumulated")
+        if self.pass_samples.setdefault(pass_index, num_samples) != num_samples:
+            raise ValueError(f"Pass {pass_index} was started with {self.pass_samples[pass_index]} samples, not {num_samples}")
+        self.sums[tile.y0:tile.y1, tile.x0:tile.x1] += result.sums
+        self.sums_sq[tile.y0:tile.y1, tile.x0:tile.x1] += result.sums_sq
+        self.counts[tile.y0:tile.y1, tile.x0:tile.x1] += result.counts
+        if pass_index not in self.coverage:
+            self.coverage[pass_index] = np.zeros(self.num_tiles, dtype=bool)
+        self.coverage[pass_index][tile.index] = True
+
+    def reset_tiles(self, tiles):
+        # forgets every pass of the tiles so they can be rendered again
+        for tile in tiles:
+            self.sums[tile.y0:tile.y1, tile.x0:tile.x1] = 0
+            self.sums_sq[tile.y0:tile.y1, tile.x0:tile.x1] = 0
+            self.counts[tile.y0:tile.y1, tile.x0:tile.x1] = 0
+            for mask in self.coverage.values():
+                mask[tile.index] = False
+
+    @property
+    def passes(self):
+        # passes with every tile accumulated
+        return sorted(p for p, mask in self.coverage.items() if mask.all())
+
+    def missing_tiles(self, pass_index):
+        mask = self.coverage.get(pass_index, np.zeros(self.num_tiles, dtype=bool))
+        return np.flatnonzero(~mask).tolist()
+
+    def next_pass(self):
+        return max(self.coverage, default=-1) + 1
+
+    def merge(self, other):
+        # Adding accumulators is only unbiased if they hold independent
+        # samples, i.e. no (tile, pass) pair was rendered by both.
+        if other.meta != self.meta:
+            raise ValueError(f"Cannot merge accumulators with different settings: {self.meta} != {other.meta}")
+        for pass_index, mask in other.coverage.items():
+            if pass_index in self.coverage and (self.coverage[pass_index] & mask).any():
+                raise ValueError(f"Accumulators overlap on pass {pass_index}, samples would be counted twice")
+            # tiles of one pass rendered elsewhere must use the same settings
+            if self.pass_samples.get(pass_index, other.pass_samples[pass_index]) != other.pass_samples[pass_index]:
+                raise ValueError(f"Pass {pass_index} was rendered with different samples per pixel")
+        self.sums += other.sums
+        self.sums_sq += other.sums_sq
+        self.counts += other.counts
+        for pass_index, mask in other.coverage.items():
+            if pass_index in self.coverage:
+                self.coverage[pass_index] = self.coverage[pass_index] | mask
+            else:
+                self.coverage[pass_index] = mask.copy()
+        self.pass_samples.update(other.pass_samples)
+
+    def image(self):
+        return resolve_image(self.sums, self.counts)
+
+    def variance(self):
+        # per pixel sample variance of the radiance
+        n = np.maximum(self.counts, 1)[..., None]
+        mean = self.sums / n
+        return np.maximum(self.sums_sq / n - mean * mean, 0)
+
+    def save(self, path):
+        pass_ids = sorted(self.coverage)
+        coverage = np.array([self.coverage[p] for p in pass_ids], dtype=bool).reshape(len(pass_ids), self.num_tiles)
+        # write to a temporary file and rename so readers never see a partial file
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            meta=np.array(json.dumps(self.meta)),
+            sums=self.sums,
+            sums_sq=self.sums_sq,
+            counts=self.counts,
+            pass_ids=np.array(pass_ids, dtype=np.int64),
+            pass_samples=np.array([self.pass_samples[p] for p in pass_ids], dtype=np.int64),
+            coverage=coverage,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            coverage = data["coverage"]
+            acc = cls(meta, coverage.shape[1])
+            acc.sums = data["sums"]
+            acc.sums_sq = data["sums_sq"]
+            acc.counts = data["counts"]
+            acc.coverage = {int(p): mask for p, mask in zip(data["pass_ids"], coverage)}
+            acc.pass_samples = {int(p): int(n) for p, n in zip(data["pass_ids"], data["pass_samples"])}
+        return acc
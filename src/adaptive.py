@@ -0,0 +1,102 @@
+# Edge guided anti-aliasing.
+#
+# A first pass renders every pixel with the base samples and notes, per
+# pixel, the shape, normal and depth its first ray hit. Aliasing only shows
+# where neighbouring pixels differ: another shape (silhouettes, misses), a
+# crease between normals, a jump in depth, or a jump in color for what the
+# features cannot see (shadow boundaries, texture transitions). Only those
+# pixels are rendered again, in further passes restricted to them, until
+# they reach the maximum number of samples.
+import numpy as np
+
+from .render import Tile
+
+# smallest cosine between the normals of neighbours on the same surface
+NormalThreshold = 0.95
+# largest depth difference of neighbours, relative to the nearer one
+DepthThreshold = 0.1
+# largest difference of neighbours in any color channel
+ColorThreshold = 0.1
+
+class FeatureTracer:
+    # shades the rays normally and keeps what the first ray of every pixel
+    # hit: shape index (-1 on a miss), normal and depth
+    def __init__(self, context, tile, pass_index):
+        self.scene = context.scene
+        self.tile = tile
+        self.shapes = np.full((tile.height, tile.width), -1, dtype=np.int64)
+        self.normals = np.zeros((tile.height, tile.width, 3))
+        self.depths = np.full((tile.height, tile.width), np.inf)
+        self.pixel = None
+
+    def start_pixel(self, i, j):
+        self.pixel = (i - self.tile.y0, j - self.tile.x0)
+
+    def shade(self, ray):
+        hit_rec = self.scene.hit(ray)
+        if self.pixel is not None:
+            if hit_rec.hit:
+                n = hit_rec.normal
+                # hits without a scene index share one id
+                self.shapes[self.pixel] = len(self.scene.shapes) if hit_rec.shape_id is None else hit_rec.shape_id
+                self.normals[self.pixel] = [n.x, n.y, n.z]
+                self.depths[self.pixel] = hit_rec.t
+            self.pixel = None
+        if not hit_rec.hit:
+            return self.scene.background
+        return hit_rec.material.shade(hit_rec, self.scene)
+
+    def finish(self, result):
+        result.features = dict(shapes=self.shapes, normals=self.normals, depths=self.depths)
+
+def discontinuities(shapes, normals, depths, image):
+    # mask of the pixels that differ from a neighbour to their right or
+    # above, both pixels of every such pair are flagged
+    mask = np.zeros(shapes.shape, dtype=bool)
+    for axis in (0, 1):
+        a = [slice(None), slice(None)]
+        b = [slice(None), slice(None)]
+        a[axis] = slice(None, -1)
+        b[axis] = slice(1, None)
+        a, b = tuple(a), tuple(b)
+        shape_edge = shapes[a] != shapes[b]
+        crease = (normals[a] * normals[b]).sum(axis=-1) < NormalThreshold
+        with np.errstate(invalid="ignore"):
+            # misses on both sides have inf depths and are not a jump
+            jump = np.abs(depths[a] - depths[b]) > DepthThreshold * np.minimum(depths[a], depths[b])
+        contrast = np.abs(image[a] - image[b]).max(axis=-1) > ColorThreshold
+        edge = shape_edge | ((shapes[a] >= 0) & (crease | jump)) | contrast
+        mask[a] |= edge
+        mask[b] |= edge
+    return mask
+
+class AdaptiveSampler:
+    def __init__(self, img_width, img_height, num_samples, max_samples):
+        self.num_samples = num_samples
+        # further passes of num_samples each until flagged pixels reach
+        # max_samples, a multiple of num_samples
+        self.num_passes = max(max_samples // num_samples - 1, 0)
+        self.shapes = np.full((img_height, img_width), -1, dtype=np.int64)
+        self.normals = np.zeros((img_height, img_width, 3))
+        self.depths = np.full((img_height, img_width), np.inf)
+        self.mask = None
+
+    def add_tile(self, result):
+        if result.pass_index != 0 or result.features is None:
+            return
+        tile, features = result.tile, result.features
+        self.shapes[tile.y0:tile.y1, tile.x0:tile.x1] = features["shapes"]
+        self.normals[tile.y0:tile.y1, tile.x0:tile.x1] = features["normals"]
+        self.depths[tile.y0:tile.y1, tile.x0:tile.x1] = features["depths"]
+
+    def refine_tasks(self, tiles, image):
+        # (tile, pass) tasks rendering the flagged pixels of the first pass
+        self.mask = discontinuities(self.shapes, self.normals, self.depths, image)
+        masked = []
+        for tile in tiles:
+            mask = self.mask[tile.y0:tile.y1, tile.x0:tile.x1]
+            if mask.any():
+                part = Tile(tile.index, tile.x0, tile.y0, tile.x1, tile.y1)
+                part.mask = mask
+                masked.append(part)
+        return [(tile, p) for p in range(1, self.num_passes + 1) for tile in masked]
@@ -12,6 +12,11 @@ class Shape:
         # Placeholder method for point-in-primitive test
         raise NotImplementedError("in_out method not implemented")
 
+    def bounds(self):
+        # (min, max) corners of an axis aligned box around the shape as
+        # arrays, None for unbounded shapes
+        return None
+
 class Color(Vector3D):
     def __init__(self, r, g, b):
         super().__init__(r, g, b)
@@ -66,12 +71,15 @@ class BaseScene:
     def hit(self, ray):
         # check for hits with all shapes
         hit_rec = HitRecord()
-        for shape, material in zip(self.shapes, self.materials):
+        for shape_id, (shape, material) in enumerate(zip(self.shapes, self.materials)):
             new_hit = shape.hit(ray)
             if new_hit.hit and new_hit.t < hit_rec.t and new_hit.t > CastEpsilon:
                 hit_rec = new_hit
-                # set material
-                hit_rec.material = material
+                hit_rec.shape_id = shape_id
+                # set material, unless the shape has its own per element
+                # materials (e.g. SphereSet)
+                if hit_rec.material is None:
+                    hit_rec.material = material
                 hit_rec.ray = ray
         return hit_rec
 
@@ -84,6 +92,30 @@ class HitRecord:
         self.material = material
         self.ray = ray
         self.uv = uv
+        # index of the scene shape hit, set by the scene
+        self.shape_id = None
+        # change of uv per pixel step, (du/dx, dv/dx) and (du/dy, dv/dy) as
+        # two vectors, for hits of rays with differentials
+        self._duv = None
+        # computes it on first use instead, only shaded hits need it
+        self._make_duv = None
+
+    @property
+    def duv(self):
+        if self._make_duv is not None:
+            self._duv = self._make_duv()
+            self._make_duv = None
+        return self._duv
+
+    @duv.setter
+    def duv(self, value):
+        self._duv = value
+        self._make_duv = None
+
+    def defer_duv(self, make):
+        # make() returns the uv change when it is first read
+        self._duv = None
+        self._make_duv = make
 
 class Material:
     def __init__(self):
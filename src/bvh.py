@@ -0,0 +1,118 @@
+# Linear bounding volume hierarchy over NumPy arrays.
+#
+# Primitives are sorted along a 3D Morton curve of their box centers and
+# grouped in leaves of at most leaf_size consecutive primitives. The nodes
+# above the leaves form a complete tree of the given width stored as flat
+# arrays, root first, so the children of node k are width * k + 1 to
+# width * k + width. Building is a sort and one reduction per level, and rays
+# are traversed in batches one level at a time, so neither runs a Python
+# loop per primitive. A wide tree has few levels, which keeps the per level
+# NumPy overhead of single ray queries low.
+import numpy as np
+
+from .base import CastEpsilon
+from .ordering import morton_order
+
+class BVH:
+    def __init__(self, lo, hi, leaf_size=8, width=8):
+        # lo, hi: N x 3 bounds of the primitives
+        lo = np.asarray(lo, dtype=float)
+        hi = np.asarray(hi, dtype=float)
+        self.count = len(lo)
+        self.width = width
+        # callers store their primitives in this order, so the primitives of
+        # a leaf are contiguous in memory
+        self.order = morton_order(0.5 * (lo + hi))
+        # the number of leaves is a power of the width, the leaves are filled
+        # evenly so the padding stays below one primitive per leaf
+        self.num_leaves = 1
+        while self.num_leaves * leaf_size < self.count:
+            self.num_leaves *= width
+        self.leaf_size = max(-(-self.count // self.num_leaves), 1)
+        self.refit(lo, hi)
+
+    def refit(self, lo, hi):
+        # node bounds for new primitive bounds (in the original order),
+        # keeping the order and the leaves. Much cheaper than a new build
+        # for moving primitives, the tree just gets looser the more they
+        # move away from where it was built.
+        lo = np.asarray(lo, dtype=float)
+        hi = np.asarray(hi, dtype=float)
+        leaf_size, width = self.leaf_size, self.width
+        pad = self.num_leaves * leaf_size - self.count
+        # padding leaves get empty boxes (lo > hi)
+        lo = np.concatenate([lo[self.order], np.full((pad, 3), np.inf)])
+        hi = np.concatenate([hi[self.order], np.full((pad, 3), -np.inf)])
+        levels_lo = [lo.reshape(self.num_leaves, leaf_size, 3).min(axis=1)]
+        levels_hi = [hi.reshape(self.num_leaves, leaf_size, 3).max(axis=1)]
+        while len(levels_lo[-1]) > 1:
+            levels_lo.append(levels_lo[-1].reshape(-1, width, 3).min(axis=1))
+            levels_hi.append(levels_hi[-1].reshape(-1, width, 3).max(axis=1))
+        # single precision with the bounds rounded outwards, so no box
+        # shrinks and half the memory
+        self.lo = np.nextafter(np.concatenate(levels_lo[::-1]).astype(np.float32), np.float32(-np.inf))
+        self.hi = np.nextafter(np.concatenate(levels_hi[::-1]).astype(np.float32), np.float32(np.inf))
+
+    def arrays(self):
+        # everything needed to rebuild the tree without sorting again
+        return dict(
+            bvh_order=self.order, bvh_lo=self.lo, bvh_hi=self.hi,
+            bvh_shape=np.array([self.count, self.leaf_size, self.width, self.num_leaves]),
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        bvh = cls.__new__(cls)
+        bvh.order = arrays["bvh_order"]
+        bvh.lo = arrays["bvh_lo"]
+        bvh.hi = arrays["bvh_hi"]
+        bvh.count, bvh.leaf_size, bvh.width, bvh.num_leaves = (int(v) for v in arrays["bvh_shape"])
+        return bvh
+
+    def _enter(self, nodes, origins, inv_directions, t_max):
+        # slab test of every (ray, node) pair; fmin/fmax skip the NaNs of
+        # rays parallel to a slab
+        lo = self.lo[nodes]
+        hi = self.hi[nodes]
+        t0 = (lo - origins) * inv_directions
+        t1 = (hi - origins) * inv_directions
+        near = np.fmax.reduce(np.fmin(t0, t1), axis=1)
+        far = np.fmin.reduce(np.fmax(t0, t1), axis=1)
+        return (near <= far) & (far > CastEpsilon) & (near < t_max) & (lo[:, 0] <= hi[:, 0])
+
+    def candidates(self, origins, directions, t_max):
+        # (ray, primitive) pairs for the leaves each ray enters before t_max,
+        # primitives numbered in BVH order
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv_directions = 1.0 / directions
+            rays = np.arange(len(origins))
+            nodes = np.zeros(len(origins), dtype=np.int64)
+            first_leaf = (self.num_leaves - 1) // (self.width - 1)
+            while True:
+                keep = self._enter(nodes, origins[rays], inv_directions[rays], t_max[rays])
+                rays, nodes = rays[keep], nodes[keep]
+                # the tree is complete, all nodes of the frontier are on the same level
+                if len(nodes) == 0 or nodes[0] >= first_leaf:
+                    break
+                rays = np.repeat(rays, self.width)
+                nodes = (self.width * nodes[:, None] + np.arange(1, self.width + 1)).ravel()
+        prims = ((nodes - first_leaf)[:, None] * self.leaf_size + np.arange(self.leaf_size)).ravel()
+        rays = np.repeat(rays, self.leaf_size)
+        valid = prims < self.count
+        return rays[valid], prims[valid]
+
+def nearest(rays, t, num_rays):
+    # smallest t of every ray over its candidate pairs, and the pair it came
+    # from (-1 when the ray hit nothing)
+    best_t = np.full(num_rays, np.inf)
+    best_pair = np.full(num_rays, -1, dtype=np.int64)
+    hit = np.flatnonzero(np.isfinite(t))
+    if len(hit) == 0:
+        return best_t, best_pair
+    order = hit[np.lexsort((t[hit], rays[hit]))]
+    sorted_rays = rays[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = sorted_rays[1:] != sorted_rays[:-1]
+    best_t[sorted_rays[first]] = t[order[first]]
+    best_pair[sorted_rays[first]] = order[first]
+    return best_t, best_pair
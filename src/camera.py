@@ -1,13 +1,12 @@
 # world is right-handed, z is up
 import math
-import random
 
-from .ray import Ray
+from . import rng
+from .ray import Ray, normalized_differential
 from .vector3d import Vector3D
 
 class Camera:
     def __init__(self, eye, look_at, up, fov, img_width, img_height):
-        self.eye = eye
         # self.look_at = look_at
         # self.up = up
         # self.fov = fov
@@ -20,12 +19,23 @@ class Camera:
         self.su = 2 * math.tan(math.radians(fov) / 2)
         self.sv = self.su * aspect_ratio
 
+        self.set_view(eye, look_at, up)
+
+    def set_view(self, eye, look_at, up):
+        # also used to move the camera between animation frames
+        self.eye = eye
         self.w = (eye - look_at).normalize()
         up = up.normalize()
         #self.u = self.w.cross(up).normalize()
         self.u = up.cross(self.w).normalize()
         self.v = self.w.cross(self.u).normalize()
 
+    def set_resolution(self, img_width, img_height):
+        # keep the horizontal field of view, adapt the vertical one
+        self.img_width = img_width
+        self.img_height = img_height
+        self.sv = self.su * img_height / img_width
+
     def point_image2world(self, x, y):
         # from image coordinates to coordinates 
         # in the camera's view plane
@@ -35,10 +45,22 @@ class Camera:
         # from view plane to world coordinates
         return self.eye + self.u * x_ndc + self.v * y_ndc - self.w
 
+    def pixel_steps(self):
+        # change of the view plane point per pixel in x and y
+        return self.u * (self.su / self.img_width), self.v * (self.sv / self.img_height)
+
     def ray(self, x, y):
         point_world = self.point_image2world(x, y)
         direction = (point_world - self.eye).normalize()
-        return Ray(self.eye, direction)
+        ray = Ray(self.eye, direction)
+        ray.defer_differentials(lambda: self._differentials(point_world))
+        return ray
+
+    def _differentials(self, point_world):
+        # the origin is the same for every pixel
+        zero = Vector3D(0, 0, 0)
+        dx, dy = self.pixel_steps()
+        return (zero, normalized_differential(point_world - self.eye, dx), zero, normalized_differential(point_world - self.eye, dy))
 
     def rays(self, x, y):
         # Default camera emits a single ray per pixel sample.
@@ -54,8 +76,8 @@ class DoFCamera(Camera):
 
     def _sample_lens(self):
         # Uniform sample on a disk using polar coordinates.
-        r = self.lens_radius * math.sqrt(random.random())
-        theta = 2.0 * math.pi * random.random()
+        r = self.lens_radius * math.sqrt(rng.random())
+        theta = 2.0 * math.pi * rng.random()
         return r * math.cos(theta), r * math.sin(theta)
 
     def rays(self, x, y):
@@ -63,15 +85,30 @@ class DoFCamera(Camera):
         point_world = self.point_image2world(x, y)
         view_dir = (point_world - self.eye).normalize()
         focal_point = self.eye + view_dir * self.focal_distance
+        # the focal step is shared by the rays of the sample, computed once
+        # when the first one needs it
+        steps = []
 
         if self.lens_radius <= 0 or self.lens_samples <= 1:
-            return [Ray(self.eye, (focal_point - self.eye).normalize())]
+            ray = Ray(self.eye, (focal_point - self.eye).normalize())
+            ray.defer_differentials(lambda: self._lens_differentials(point_world, focal_point, self.eye, steps))
+            return [ray]
 
         rays = []
         for _ in range(self.lens_samples):
             dx, dy = self._sample_lens()
             lens_point = self.eye + self.u * dx + self.v * dy
             direction = (focal_point - lens_point).normalize()
-            rays.append(Ray(lens_point, direction))
-
-        return rays
\ No newline at end of file
+            ray = Ray(lens_point, direction)
+            ray.defer_differentials(lambda lens_point=lens_point: self._lens_differentials(point_world, focal_point, lens_point, steps))
+            rays.append(ray)
+
+        return rays
+
+    def _lens_differentials(self, point_world, focal_point, lens_point, steps):
+        # the focal point moves with the pixel, the lens point does not;
+        # steps caches the move of the focal point for the sample
+        if not steps:
+            steps.extend(normalized_differential(point_world - self.eye, step) * self.focal_distance for step in self.pixel_steps())
+        zero = Vector3D(0, 0, 0)
+        return (zero, normalized_differential(focal_point - lens_point, steps[0]), zero, normalized_differential(focal_point - lens_point, steps[1]))
\ No newline at end of file
@@ -0,0 +1,50 @@
+# Periodic on-disk checkpoints of a tiled render so it can be resumed
+import os
+import json
+import time
+
+from .accumulator import Accumulator
+
+class Checkpoint:
+    def __init__(self, directory, meta, interval=60.0):
+        self.directory = directory
+        # settings that must match for a checkpoint to be resumable
+        self.meta = meta
+        # minimum number of seconds between two saves
+        self.interval = interval
+        self.last_save = time.monotonic()
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.directory, "meta.json")
+
+    @property
+    def state_path(self):
+        return os.path.join(self.directory, "state.npz")
+
+    def exists(self):
+        return os.path.exists(self.meta_path) and os.path.exists(self.state_path)
+
+    def load(self):
+        # returns the accumulator saved by the last call to save
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        if meta != self.meta:
+            raise ValueError(f"Checkpoint in {self.directory} was written with different settings: {meta}")
+        return Accumulator.load(self.state_path)
+
+    def save(self, accumulator):
+        os.makedirs(self.directory, exist_ok=True)
+        # the accumulator is written atomically; the meta file is renamed
+        # into place too so a render killed while saving never leaves a
+        # truncated checkpoint behind
+        accumulator.save(self.state_path)
+        tmp_meta = self.meta_path + ".tmp"
+        with open(tmp_meta, "w") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp_meta, self.meta_path)
+        self.last_save = time.monotonic()
+
+    def maybe_save(self, accumulator):
+        if time.monotonic() - self.last_save >= self.interval:
+            self.save(accumulator)
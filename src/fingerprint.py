@@ -0,0 +1,79 @@
+# Content fingerprints of scene objects, used to tell whether cached render
+# data still matches a scene
+import types
+import hashlib
+
+import numpy as np
+
+from .base import Material
+
+class Fingerprint:
+    # Hash of everything reachable from an object. Unless material_content
+    # is set, materials are only counted by position so their parameters
+    # can change. Their list in the order they are found gives material
+    # slots that are stable for any scene with the same fingerprint.
+    def __init__(self, material_content=False):
+        self.material_content = material_content
+        self.hash = hashlib.sha256()
+        self.seen = dict()
+        self.materials = []
+
+    def add(self, obj):
+        h = self.hash
+        if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+            h.update(f"{type(obj).__name__}:{obj!r};".encode())
+            return
+        if id(obj) in self.seen:
+            h.update(f"ref {self.seen[id(obj)]};".encode())
+            return
+        self.seen[id(obj)] = len(self.seen)
+        if isinstance(obj, Material):
+            h.update(f"material {len(self.materials)};".encode())
+            self.materials.append(obj)
+            if self.material_content:
+                h.update(f"object {type(obj).__module__}.{type(obj).__qualname__};".encode())
+                self.add(obj.__dict__)
+        elif isinstance(obj, np.ndarray):
+            h.update(f"array {obj.dtype.str} {obj.shape};".encode())
+            if obj.dtype == object:
+                for value in obj.ravel():
+                    self.add(value)
+            else:
+                h.update(np.ascontiguousarray(obj).data)
+        elif isinstance(obj, (list, tuple)):
+            h.update(f"{type(obj).__name__} {len(obj)};".encode())
+            for value in obj:
+                self.add(value)
+        elif isinstance(obj, dict):
+            h.update(f"dict {len(obj)};".encode())
+            for key, value in obj.items():
+                self.add(key)
+                self.add(value)
+        elif isinstance(obj, type):
+            h.update(f"type {obj.__module__}.{obj.__qualname__};".encode())
+        elif isinstance(obj, types.MethodType):
+            self.add(obj.__func__)
+            self.add(obj.__self__)
+        elif isinstance(obj, types.FunctionType):
+            # the code of implicit functions, not their identity
+            h.update(f"function {obj.__qualname__};".encode())
+            self.add(obj.__code__)
+            self.add(obj.__defaults__)
+            self.add([cell.cell_contents for cell in obj.__closure__ or ()])
+        elif isinstance(obj, types.CodeType):
+            h.update(obj.co_code)
+            self.add(obj.co_consts)
+            self.add(obj.co_names)
+        elif hasattr(obj, "__dict__"):
+            h.update(f"object {type(obj).__module__}.{type(obj).__qualname__};".encode())
+            self.add(obj.__dict__)
+        else:
+            h.update(f"{obj!r};".encode())
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+def fingerprint(obj, material_content=False):
+    f = Fingerprint(material_content)
+    f.add(obj)
+    return f.hexdigest()
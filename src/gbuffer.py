@@ -0,0 +1,235 @@
+# G-buffer: the hits of a render saved so the image can be shaded again
+# without tracing its rays.
+#
+# For every primary ray the G-buffer keeps the ray and its closest hit (t,
+# point, normal, uv and its change per pixel, shape and material), followed
+# by every scene query the shading made for it: shadow rays and reflected
+# or refracted rays, in call order. Relighting reuses the primary hits as
+# they are. The shading runs again with the current lights and materials
+# and its queries are answered from the G-buffer when the ray is the same
+# as the one recorded, so when only material colors change nothing is
+# traced at all; queries whose ray changed (a moved light, a new refraction
+# index) are traced for real.
+#
+# The hits are only valid for the same camera and geometry. Both are
+# fingerprinted when the G-buffer is written and checked when it is loaded.
+import os
+import json
+import math
+
+import numpy as np
+
+from .base import HitRecord
+from .fingerprint import Fingerprint
+from .mesh import mmap_npz
+from .vector3d import Vector3D
+
+# float columns of a record: ray origin and direction, then the hit
+Origin = slice(0, 3)
+Direction = slice(3, 6)
+T = 6
+Point = slice(7, 10)
+Normal = slice(10, 13)
+UV = slice(13, 16)
+# uv change per pixel step: du/dx, dv/dx, du/dy, dv/dy
+DUV = slice(16, 20)
+NumFloats = 20
+# integer columns: shape index, material slot (-1 on a miss) and, for
+# primary rays, the number of queries recorded after it
+ShapeId, MaterialId, Queries = 0, 1, 2
+
+def scene_geometry(scene):
+    # fingerprint of the shapes and of which material each one uses, and
+    # the material slots
+    f = Fingerprint()
+    f.add([scene.shapes, scene.materials])
+    return f.hexdigest(), f.materials
+
+class SceneView:
+    # the scene as the materials see it while a ray is shaded: attributes
+    # come from the scene, hit queries go to a tracer
+    def __init__(self, scene, hit):
+        self.scene = scene
+        self.hit = hit
+
+    def __getattr__(self, name):
+        return getattr(self.scene, name)
+
+class GBufferRecorder:
+    # shades the rays of one tile normally and records their hits
+    def __init__(self, context, tile, pass_index):
+        self.scene = context.scene
+        self.tile = tile
+        # slots by object id, the ids of this process's copy of the scene
+        self.slots = {id(material): k for k, material in enumerate(context.materials)}
+        self.first = np.zeros((tile.height, tile.width), dtype=np.int64)
+        self.floats = []
+        self.ints = []
+        self.view = SceneView(self.scene, self._query)
+
+    def start_pixel(self, i, j):
+        self.first[i - self.tile.y0, j - self.tile.x0] = len(self.floats)
+
+    def _add(self, ray, hit_rec):
+        o, d = ray.origin, ray.direction
+        if not hit_rec.hit:
+            self.floats.append([o.x, o.y, o.z, d.x, d.y, d.z, np.inf] + [np.nan] * (NumFloats - 7))
+            self.ints.append([-1, -1, 0])
+            return
+        slot = self.slots.get(id(hit_rec.material))
+        if slot is None:
+            raise ValueError(f"{type(hit_rec.material).__name__} of a hit is not reachable from the scene and cannot be recorded")
+        p, n, uv = hit_rec.point, hit_rec.normal, hit_rec.uv
+        uv = [np.nan] * 3 if uv is None else [uv.x, uv.y, uv.z]
+        duv = [np.nan] * 4 if hit_rec.duv is None else [hit_rec.duv[0].x, hit_rec.duv[0].y, hit_rec.duv[1].x, hit_rec.duv[1].y]
+        self.floats.append([o.x, o.y, o.z, d.x, d.y, d.z, hit_rec.t, p.x, p.y, p.z, n.x, n.y, n.z] + uv + duv)
+        self.ints.append([-1 if hit_rec.shape_id is None else hit_rec.shape_id, slot, 0])
+
+    def _query(self, ray):
+        hit_rec = self.scene.hit(ray)
+        self._add(ray, hit_rec)
+        return hit_rec
+
+    def shade(self, ray):
+        hit_rec = self.scene.hit(ray)
+        k = len(self.floats)
+        self._add(ray, hit_rec)
+        if not hit_rec.hit:
+            return self.scene.background
+        color = hit_rec.material.shade(hit_rec, self.view)
+        self.ints[k][Queries] = len(self.floats) - k - 1
+        return color
+
+    def finish(self, result):
+        result.gbuffer = [dict(
+            x0=self.tile.x0, y0=self.tile.y0, first=self.first,
+            floats=np.array(self.floats, dtype=float).reshape(-1, NumFloats),
+            ints=np.array(self.ints, dtype=np.int32).reshape(-1, 3),
+        )]
+
+class GBufferRelighter:
+    # shades the rays of one tile from the hits of a G-buffer
+    def __init__(self, context, tile, pass_index):
+        gbuffer = context.gbuffer
+        self.scene = context.scene
+        self.materials = context.materials
+        self.first = gbuffer.first[gbuffer.passes.index(pass_index)]
+        self.floats = gbuffer.floats
+        self.ints = gbuffer.ints
+        self.view = SceneView(self.scene, self._query)
+        self.next = 0
+        self.query = self.end = 0
+        # shading queries answered from the G-buffer and traced again
+        self.replayed = 0
+        self.traced = 0
+
+    def start_pixel(self, i, j):
+        self.next = int(self.first[i, j])
+        if self.next < 0:
+            raise ValueError(f"Pixel ({i}, {j}) is not in the G-buffer")
+
+    def _record(self, k, ray):
+        # the recorded hit as a HitRecord, None if it was for another ray
+        row = self.floats[k].tolist()
+        o, d = ray.origin, ray.direction
+        if row[Origin] != [o.x, o.y, o.z] or row[Direction] != [d.x, d.y, d.z]:
+            return None
+        shape_id, slot, _ = self.ints[k].tolist()
+        if slot < 0:
+            return HitRecord()
+        uv = None if math.isnan(row[UV.start]) else Vector3D(*row[UV])
+        hit_rec = HitRecord(True, row[T], Vector3D(*row[Point]), Vector3D(*row[Normal]), self.materials[slot], ray, uv)
+        hit_rec.shape_id = shape_id if shape_id >= 0 else None
+        if not math.isnan(row[DUV.start]):
+            dudx, dvdx, dudy, dvdy = row[DUV]
+            hit_rec.duv = (Vector3D(dudx, dvdx, 0), Vector3D(dudy, dvdy, 0))
+        return hit_rec
+
+    def _query(self, ray):
+        if self.query < self.end:
+            hit_rec = self._record(self.query, ray)
+            self.query += 1
+            if hit_rec is not None:
+                self.replayed += 1
+                return hit_rec
+        self.traced += 1
+        return self.scene.hit(ray)
+
+    def shade(self, ray):
+        k = self.next
+        hit_rec = self._record(k, ray)
+        if hit_rec is None:
+            raise ValueError("Camera ray differs from the one in the G-buffer, it was written by another camera")
+        self.query = k + 1
+        self.end = self.next = k + 1 + int(self.ints[k, Queries])
+        if not hit_rec.hit:
+            return self.scene.background
+        return hit_rec.material.shade(hit_rec, self.view)
+
+    def finish(self, result):
+        result.replay = dict(replayed=self.replayed, traced=self.traced)
+
+class GBuffer:
+    def __init__(self, meta, passes, img_width, img_height):
+        # meta: render settings plus the camera and geometry fingerprints
+        self.meta = dict(meta)
+        self.passes = list(passes)
+        # first record of every pixel of every pass, -1 if not rendered
+        self.first = np.full((len(self.passes), img_height, img_width), -1, dtype=np.int64)
+        self.floats = np.zeros((0, NumFloats))
+        self.ints = np.zeros((0, 3), dtype=np.int32)
+        self._parts = []
+        self._count = 0
+
+    def add_tile(self, result):
+        p = self.passes.index(result.pass_index)
+        for part in result.gbuffer:
+            height, width = part["first"].shape
+            self.first[p, part["y0"]:part["y0"] + height, part["x0"]:part["x0"] + width] = part["first"] + self._count
+            self._count += len(part["floats"])
+            self._parts.append((part["floats"], part["ints"]))
+
+    def _flush(self):
+        if self._parts:
+            self.floats = np.concatenate([self.floats] + [f for f, _ in self._parts])
+            self.ints = np.concatenate([self.ints] + [i for _, i in self._parts])
+            self._parts = []
+
+    def check(self, scene_name, camera_key, geometry_key):
+        # raises when the hits cannot be reused for this scene
+        if self.meta["scene"] != scene_name:
+            raise ValueError(f"G-buffer was rendered from {self.meta['scene']}, not {scene_name}")
+        if self.meta["camera"] != camera_key:
+            raise ValueError("Camera changed since the G-buffer was written, render it again")
+        if self.meta["geometry"] != geometry_key:
+            raise ValueError("Geometry or material assignment changed since the G-buffer was written, render it again")
+
+    def save(self, path):
+        self._flush()
+        # uncompressed so it can be memory-mapped when loaded
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            meta=np.array(json.dumps(self.meta)),
+            passes=np.array(self.passes, dtype=np.int64),
+            first=self.first,
+            floats=self.floats,
+            ints=self.ints,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        arrays = mmap_npz(path)
+        meta = json.loads(str(np.asarray(arrays["meta"])))
+        passes = np.asarray(arrays["passes"]).tolist()
+        gbuffer = cls.__new__(cls)
+        gbuffer.meta = meta
+        gbuffer.passes = passes
+        # plain views of the mapped file, element access on np.memmap is slow
+        gbuffer.first = np.asarray(arrays["first"])
+        gbuffer.floats = np.asarray(arrays["floats"])
+        gbuffer.ints = np.asarray(arrays["ints"])
+        gbuffer._parts = []
+        gbuffer._count = len(gbuffer.floats)
+        return gbuffer
@@ -0,0 +1,30 @@
+# Per-pixel render cost maps, built from the statistics counters
+import os
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+# work measured for every pixel
+CostChannels = ["time", "rays", "shape_tests", "implicit_evals"]
+
+def pixel_cost(snapshot, seconds):
+    # reduces the counters of one pixel to the cost channels
+    tests = sum(v for k, v in snapshot.items() if k.startswith("shape.hit."))
+    evals = sum(v for k, v in snapshot.items() if k.startswith("implicit.eval."))
+    return [seconds, snapshot.get("scene.hit", 0), tests, evals]
+
+def cost_paths(output):
+    # cost files are written next to the rendered image
+    stem = os.path.splitext(output)[0]
+    return stem + ".cost.npy", stem + ".cost.png"
+
+def save_cost_map(output, cost, channel="time"):
+    array_path, image_path = cost_paths(output)
+    np.save(array_path, cost)
+    values = cost[..., CostChannels.index(channel)]
+    # costs span orders of magnitude, a log scale keeps cheap areas readable
+    positive = values[values > 0]
+    vmin = positive.min() if positive.size else 1.0
+    vmax = max(values.max(), vmin)
+    plt.imsave(image_path, np.log10(np.maximum(values, vmin)), vmin=np.log10(vmin), vmax=np.log10(vmax), cmap="inferno", origin='lower')
+    return array_path, image_path
@@ -0,0 +1,181 @@
+# Terrain from a 2D grid of heights. Rays walk the grid cell by cell (DDA)
+# through a min/max pyramid: a block of cells whose height range the ray
+# passes above or below is skipped at once, so most of the grid is never
+# visited. Each cell is two triangles intersected exactly.
+import math
+
+import numpy as np
+
+from .base import Shape, HitRecord, CastEpsilon
+from .vector3d import Vector3D
+
+def height_pyramid(heights):
+    # min/max height of every cell, then of 2x2 blocks of the level below
+    # until a single block covers the whole grid
+    h = np.asarray(heights, dtype=np.float32)
+    corners = np.stack([h[:-1, :-1], h[:-1, 1:], h[1:, :-1], h[1:, 1:]])
+    # single precision rounded outwards, so no block range shrinks
+    lo = np.nextafter(corners.min(axis=0), np.float32(-np.inf))
+    hi = np.nextafter(corners.max(axis=0), np.float32(np.inf))
+    levels = [(lo, hi)]
+    while max(levels[-1][0].shape) > 1:
+        lo, hi = levels[-1]
+        rows, cols = -(-lo.shape[0] // 2) * 2, -(-lo.shape[1] // 2) * 2
+        # odd sizes are padded with blocks no ray can touch
+        lo = np.pad(lo, ((0, rows - lo.shape[0]), (0, cols - lo.shape[1])), constant_values=np.inf)
+        hi = np.pad(hi, ((0, rows - hi.shape[0]), (0, cols - hi.shape[1])), constant_values=-np.inf)
+        levels.append((lo.reshape(rows // 2, 2, cols // 2, 2).min(axis=(1, 3)), hi.reshape(rows // 2, 2, cols // 2, 2).max(axis=(1, 3))))
+    return levels
+
+class Heightfield(Shape):
+    def __init__(self, heights, origin=(0.0, 0.0), cell_size=(1.0, 1.0), z_scale=1.0, z_offset=0.0, smooth=True):
+        # heights[j, i] is the height of the grid point at
+        # (origin[0] + i * cell_size[0], origin[1] + j * cell_size[1])
+        super().__init__("heightfield")
+        if heights.ndim != 2 or min(heights.shape) < 2:
+            raise ValueError(f"Heightfield needs a 2D grid of at least 2 x 2 heights, got shape {heights.shape}")
+        # kept as given, a memory-mapped grid is only read where rays go
+        self.heights = heights
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.cell_size = (float(cell_size[0]), float(cell_size[1]))
+        self.z_scale = float(z_scale)
+        self.z_offset = float(z_offset)
+        # interpolate vertex normals across the triangles instead of flat faces
+        self.smooth = smooth
+        # pyramid in grid units; with a negative scale min and max swap
+        self.levels = height_pyramid(heights)
+        lo, hi = self.levels[-1][0][0, 0], self.levels[-1][1][0, 0]
+        self.z_range = tuple(sorted((self.z(lo), self.z(hi))))
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        # heights from a .npy file, memory-mapped
+        return cls(np.load(path, mmap_mode="r"), **kwargs)
+
+    def z(self, h):
+        return float(h) * self.z_scale + self.z_offset
+
+    def bounds(self):
+        rows, cols = self.heights.shape
+        x0, y0 = self.origin
+        x1 = x0 + (cols - 1) * self.cell_size[0]
+        y1 = y0 + (rows - 1) * self.cell_size[1]
+        return np.array([x0, y0, self.z_range[0]]), np.array([x1, y1, self.z_range[1]])
+
+    def _block_range(self, level, i, j):
+        lo, hi = self.levels[level]
+        a, b = self.z(lo[j, i]), self.z(hi[j, i])
+        # padding blocks stay empty (lower end above the upper one)
+        return (a, b) if self.z_scale >= 0 else (b, a)
+
+    def _vertex_normal(self, i, j):
+        # central differences, one sided at the border
+        h = self.heights
+        rows, cols = h.shape
+        i0, i1 = max(i - 1, 0), min(i + 1, cols - 1)
+        j0, j1 = max(j - 1, 0), min(j + 1, rows - 1)
+        dzdx = (float(h[j, i1]) - float(h[j, i0])) * self.z_scale / ((i1 - i0) * self.cell_size[0])
+        dzdy = (float(h[j1, i]) - float(h[j0, i])) * self.z_scale / ((j1 - j0) * self.cell_size[1])
+        return np.array([-dzdx, -dzdy, 1.0])
+
+    def _cell_hit(self, i, j, o, d, t_min, t_max):
+        # two triangles of cell (i, j) in grid units (x, y) and world z; the
+        # ray parameter is the same as in world space
+        z00 = self.z(self.heights[j, i])
+        z10 = self.z(self.heights[j, i + 1])
+        z01 = self.z(self.heights[j + 1, i])
+        z11 = self.z(self.heights[j + 1, i + 1])
+        best = None
+        for corners in (((0, 0, z00), (1, 0, z10), (1, 1, z11)), ((0, 0, z00), (1, 1, z11), (0, 1, z01))):
+            v0 = np.array([i + corners[0][0], j + corners[0][1], corners[0][2]])
+            e1 = np.array([i + corners[1][0], j + corners[1][1], corners[1][2]]) - v0
+            e2 = np.array([i + corners[2][0], j + corners[2][1], corners[2][2]]) - v0
+            # Moller-Trumbore
+            p = np.cross(d, e2)
+            det = e1 @ p
+            if abs(det) < 1e-14:
+                continue
+            s = o - v0
+            u = (s @ p) / det
+            if u < 0 or u > 1:
+                continue
+            q = np.cross(s, e1)
+            v = (d @ q) / det
+            if v < 0 or u + v > 1:
+                continue
+            t = (e2 @ q) / det
+            if t_min - 1e-9 <= t <= t_max + 1e-9 and t > CastEpsilon and (best is None or t < best[0]):
+                best = (t, corners, u, v)
+        return best
+
+    def _normal(self, i, j, corners, u, v):
+        if self.smooth:
+            normals = [self._vertex_normal(i + c[0], j + c[1]) for c in corners]
+            n = (1 - u - v) * normals[0] + u * normals[1] + v * normals[2]
+        else:
+            cx, cy = self.cell_size
+            a, b, c = (np.array([k[0] * cx, k[1] * cy, k[2]]) for k in corners)
+            n = np.cross(b - a, c - a)
+        return Vector3D(*n.tolist()).normalize()
+
+    def hit(self, ray):
+        rows, cols = self.heights.shape
+        cx, cy = self.cell_size
+        # ray in grid units
+        o = np.array([(ray.origin.x - self.origin[0]) / cx, (ray.origin.y - self.origin[1]) / cy, ray.origin.z])
+        d = np.array([ray.direction.x / cx, ray.direction.y / cy, ray.direction.z])
+        # clip against the box of the whole terrain
+        t_start, t_end = 0.0, math.inf
+        box = ((0.0, cols - 1.0), (0.0, rows - 1.0), self.z_range)
+        for axis in range(3):
+            if abs(d[axis]) < 1e-15:
+                if not box[axis][0] <= o[axis] <= box[axis][1]:
+                    return HitRecord(False, float('inf'), None, None)
+                continue
+            t0 = (box[axis][0] - o[axis]) / d[axis]
+            t1 = (box[axis][1] - o[axis]) / d[axis]
+            t_start = max(t_start, min(t0, t1))
+            t_end = min(t_end, max(t0, t1))
+        if t_start > t_end:
+            return HitRecord(False, float('inf'), None, None)
+
+        top = len(self.levels) - 1
+        level = top
+        t = t_start
+        while t <= t_end:
+            size = 1 << level
+            x = o[0] + t * d[0]
+            y = o[1] + t * d[1]
+            # block containing the point, on a boundary the one the ray enters
+            i = math.floor(x / size) if d[0] >= 0 else math.ceil(x / size) - 1
+            j = math.floor(y / size) if d[1] >= 0 else math.ceil(y / size) - 1
+            i = min(max(i, 0), self.levels[level][0].shape[1] - 1)
+            j = min(max(j, 0), self.levels[level][0].shape[0] - 1)
+            # where the ray leaves the block
+            t_exit = t_end
+            if d[0] > 0:
+                t_exit = min(t_exit, ((i + 1) * size - o[0]) / d[0])
+            elif d[0] < 0:
+                t_exit = min(t_exit, (i * size - o[0]) / d[0])
+            if d[1] > 0:
+                t_exit = min(t_exit, ((j + 1) * size - o[1]) / d[1])
+            elif d[1] < 0:
+                t_exit = min(t_exit, (j * size - o[1]) / d[1])
+            z_lo, z_hi = sorted((o[2] + t * d[2], o[2] + t_exit * d[2]))
+            block_lo, block_hi = self._block_range(level, i, j)
+            if z_hi >= block_lo and z_lo <= block_hi:
+                if level > 0:
+                    level -= 1
+                    continue
+                found = self._cell_hit(i, j, o, d, t, t_exit)
+                if found is not None:
+                    t_hit, corners, u, v = found
+                    point = ray.point_at_parameter(t_hit)
+                    uv = Vector3D(point.x - self.origin[0], point.y - self.origin[1], 0)
+                    return HitRecord(True, t_hit, point, self._normal(i, j, corners, u, v), uv=uv)
+            if t_exit >= t_end:
+                break
+            # step past the block; the next one may be skipped at a coarser level
+            t = max(t_exit, math.nextafter(t, math.inf))
+            level = min(level + 1, top)
+        return HitRecord(False, float('inf'), None, None)
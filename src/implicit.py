@@ -0,0 +1,307 @@
+# Implicit surfaces from expressions.
+#
+# f is written with +, -, *, division by numbers and powers by non-negative
+# integers of X, Y and Z, or as a function of x, y and z using only those,
+# which is traced by calling it on X, Y and Z. The expression compiles to
+# Python source that evaluates every shared subexpression once and runs on
+# floats and NumPy arrays alike, so a whole coarse scan of a ray is one call.
+# The gradient is derived symbolically, and interval arithmetic bounds f
+# over boxes (to shrink the bounding box and prove seeds) and the gradient
+# (a Lipschitz bound for skipping samples).
+import math
+from itertools import product
+
+from .shapes import ImplicitFunction
+from . import interval
+from .vector3d import Vector3D
+
+# halvings of the bounding box in the octree that shrinks it
+OccupancyDepth = 5
+
+class Expr:
+    # node of an expression: "var" (value is the name), "const" (value is
+    # the number), "add", "mul", "neg" or "pow" (value is the exponent)
+    def __init__(self, op, args=(), value=None):
+        self.op = op
+        self.args = args
+        self.value = value
+        # structural identity, equal subexpressions are evaluated once
+        self.key = (op, value) + tuple(a.key for a in args)
+
+    def __add__(self, other):
+        return add(self, as_expr(other))
+
+    def __radd__(self, other):
+        return add(as_expr(other), self)
+
+    def __sub__(self, other):
+        return add(self, neg(as_expr(other)))
+
+    def __rsub__(self, other):
+        return add(as_expr(other), neg(self))
+
+    def __mul__(self, other):
+        return mul(self, as_expr(other))
+
+    def __rmul__(self, other):
+        return mul(as_expr(other), self)
+
+    def __truediv__(self, other):
+        if not isinstance(other, (int, float)):
+            raise TypeError("Implicit expressions can only be divided by numbers")
+        return mul(self, constant(1.0 / other))
+
+    def __neg__(self):
+        return neg(self)
+
+    def __pos__(self):
+        return self
+
+    def __pow__(self, n):
+        if not isinstance(n, int) or n < 0:
+            raise TypeError(f"Implicit expressions only have non-negative integer powers, not {n!r}")
+        return power(self, n)
+
+X = Expr("var", value="x")
+Y = Expr("var", value="y")
+Z = Expr("var", value="z")
+
+def constant(c):
+    return Expr("const", value=float(c))
+
+def as_expr(a):
+    if isinstance(a, Expr):
+        return a
+    if isinstance(a, (int, float)):
+        return constant(a)
+    raise TypeError(f"{type(a).__name__} is not an implicit expression")
+
+def trace(f):
+    # the expression of f, given as one or as a function of x, y and z
+    if isinstance(f, Expr):
+        return f
+    return as_expr(f(X, Y, Z))
+
+# Constructors folding constants and dropping neutral terms, which keeps the
+# derived gradients small
+
+def is_const(a, c=None):
+    return a.op == "const" and (c is None or a.value == c)
+
+def add(a, b):
+    if is_const(a) and is_const(b):
+        return constant(a.value + b.value)
+    if is_const(a, 0):
+        return b
+    if is_const(b, 0):
+        return a
+    return Expr("add", (a, b))
+
+def mul(a, b):
+    if is_const(a) and is_const(b):
+        return constant(a.value * b.value)
+    if is_const(a, 0) or is_const(b, 0):
+        return constant(0)
+    if is_const(a, 1):
+        return b
+    if is_const(b, 1):
+        return a
+    # constants first, the bounds scale instead of multiplying
+    if is_const(b):
+        return Expr("mul", (b, a))
+    return Expr("mul", (a, b))
+
+def neg(a):
+    if is_const(a):
+        return constant(-a.value)
+    if a.op == "neg":
+        return a.args[0]
+    return Expr("neg", (a,))
+
+def power(a, n):
+    if n == 0:
+        return constant(1)
+    if n == 1:
+        return a
+    if is_const(a):
+        return constant(a.value ** n)
+    return Expr("pow", (a,), n)
+
+def differentiate(a, name, memo=None):
+    # d a / d name
+    if memo is None:
+        memo = dict()
+    if a.key in memo:
+        return memo[a.key]
+    if a.op == "const":
+        d = constant(0)
+    elif a.op == "var":
+        d = constant(1 if a.value == name else 0)
+    elif a.op == "add":
+        d = add(differentiate(a.args[0], name, memo), differentiate(a.args[1], name, memo))
+    elif a.op == "mul":
+        u, v = a.args
+        d = add(mul(differentiate(u, name, memo), v), mul(u, differentiate(v, name, memo)))
+    elif a.op == "neg":
+        d = neg(differentiate(a.args[0], name, memo))
+    else:
+        u = a.args[0]
+        d = mul(mul(constant(a.value), power(u, a.value - 1)), differentiate(u, name, memo))
+    memo[a.key] = d
+    return d
+
+def _code(a, args):
+    # one operation on floats or arrays; powers are products so that both
+    # round the same
+    if a.op == "add":
+        return f"{args[0]} + {args[1]}"
+    if a.op == "mul":
+        return f"{args[0]} * {args[1]}"
+    if a.op == "neg":
+        return f"-{args[0]}"
+    return " * ".join([args[0]] * a.value)
+
+def _interval_code(a, args):
+    # one operation on (lo, hi) intervals
+    u = a.args[0]
+    if a.op == "add":
+        if is_const(a.args[1]):
+            return f"interval.shift({args[0]}, {a.args[1].value!r})"
+        if is_const(u):
+            return f"interval.shift({args[1]}, {u.value!r})"
+        return f"interval.add({args[0]}, {args[1]})"
+    if a.op == "mul":
+        if is_const(u):
+            return f"interval.scale({u.value!r}, {args[1]})"
+        if u.key == a.args[1].key:
+            return f"interval.square({args[0]})"
+        return f"interval.mul({args[0]}, {args[1]})"
+    if a.op == "neg":
+        return f"interval.scale(-1.0, {args[0]})"
+    return f"interval.power({args[0]}, {a.value})"
+
+def generate(name, outputs, intervals=False):
+    # source of def name(x, y, z) returning the outputs, on intervals of
+    # x, y and z when intervals is set
+    lines = []
+    names = dict()
+
+    def visit(a):
+        if a.key in names:
+            return names[a.key]
+        if a.op == "var":
+            return a.value
+        if a.op == "const":
+            return f"({a.value!r}, {a.value!r})" if intervals else f"({a.value!r})"
+        args = [visit(arg) for arg in a.args]
+        names[a.key] = f"t{len(lines)}"
+        lines.append(f"    {names[a.key]} = {(_interval_code if intervals else _code)(a, args)}")
+        return names[a.key]
+
+    results = [visit(a) for a in outputs]
+    return "\n".join([f"def {name}(x, y, z):"] + lines + [f"    return {', '.join(results)}", ""])
+
+class CompiledExpression:
+    def __init__(self, expr):
+        self.expr = expr
+        gradient = [differentiate(expr, name) for name in "xyz"]
+        self.sources = dict(
+            value=generate("value", [expr]),
+            gradient=generate("gradient", gradient),
+            value_bound=generate("value_bound", [expr], intervals=True),
+            gradient_bound=generate("gradient_bound", gradient, intervals=True),
+        )
+        self._compile()
+
+    def _compile(self):
+        namespace = dict(interval=interval)
+        for source in self.sources.values():
+            exec(source, namespace)
+        self.functions = {name: namespace[name] for name in self.sources}
+
+    # generated functions do not pickle, workers compile the sources again
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["functions"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile()
+
+    def value(self, x, y, z):
+        return self.functions["value"](x, y, z)
+
+    def gradient(self, x, y, z):
+        return self.functions["gradient"](x, y, z)
+
+    def bound(self, lo, hi):
+        # (min, max) of f over the box between two corners
+        return self.functions["value_bound"](*interval.box(lo, hi))
+
+    def lipschitz(self, lo, hi):
+        # bound of |grad f| over the box between two corners
+        g = self.functions["gradient_bound"](*interval.box(lo, hi))
+        return math.sqrt(sum(interval.magnitude(c) ** 2 for c in g))
+
+def occupied_box(bound, lo, hi, margin, depth=OccupancyDepth):
+    # corners of the smallest box around the cells of an octree of the box
+    # between lo and hi where the bound cannot prove |f| > margin, None when
+    # it proves it everywhere
+    found_lo = [math.inf] * 3
+    found_hi = [-math.inf] * 3
+
+    def visit(lo, hi, depth):
+        # cells inside the box found so far cannot grow it
+        if all(found_lo[k] <= lo[k] and hi[k] <= found_hi[k] for k in range(3)):
+            return
+        f_lo, f_hi = bound(lo, hi)
+        # neither the bound nor f round in a known direction
+        slack = margin + 1e-9 * max(1.0, abs(f_lo), abs(f_hi))
+        if f_lo > slack or f_hi < -slack:
+            return
+        if depth == 0:
+            for k in range(3):
+                found_lo[k] = min(found_lo[k], lo[k])
+                found_hi[k] = max(found_hi[k], hi[k])
+            return
+        mid = [0.5 * (lo[k] + hi[k]) for k in range(3)]
+        for half in product((0, 1), repeat=3):
+            visit(
+                tuple(mid[k] if half[k] else lo[k] for k in range(3)),
+                tuple(hi[k] if half[k] else mid[k] for k in range(3)),
+                depth - 1,
+            )
+
+    visit(tuple(lo), tuple(hi), depth)
+    if found_lo[0] > found_hi[0]:
+        return None
+    return tuple(found_lo), tuple(found_hi)
+
+class ImplicitSurface(ImplicitFunction):
+    # f = 0 for an expression f (see above); vectorize takes the coarse scan
+    # of a ray in one call of the array kernel, else it skips samples with
+    # the Lipschitz bound
+    def __init__(self, f, bbox_min, bbox_max, vectorize=True, **kwargs):
+        self.compiled = CompiledExpression(trace(f))
+        super().__init__(
+            function=self._func,
+            gradient=self._grad,
+            bbox_min=bbox_min,
+            bbox_max=bbox_max,
+            bound=self.compiled.bound,
+            kernel=self.compiled.value if vectorize else None,
+            **kwargs,
+        )
+        # rays only search where the surface can be
+        box = occupied_box(self.bound, (bbox_min.x, bbox_min.y, bbox_min.z), (bbox_max.x, bbox_max.y, bbox_max.z), self.f_epsilon)
+        if box is not None:
+            self.bbox_min = Vector3D(*box[0])
+            self.bbox_max = Vector3D(*box[1])
+            self.lipschitz = self.compiled.lipschitz(*box)
+
+    def _func(self, point):
+        return self.compiled.value(point.x, point.y, point.z)
+
+    def _grad(self, point):
+        return Vector3D(*self.compiled.gradient(point.x, point.y, point.z))
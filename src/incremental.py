@@ -0,0 +1,234 @@
+# Incremental re-rendering after scene edits.
+#
+# While rendering, every tile notes what its pixels depend on: the shapes
+# its rays hit (primary, shadow and secondary rays alike, only the closest
+# hit of each query counts), the lights its shading read and the ray
+# segments themselves, from the origin to the closest hit. Together with a
+# content fingerprint of every shape, material and light this is kept next
+# to the image. On the next run the fingerprints tell which objects
+# changed, and a tile is rendered again only if
+# - it hit a changed shape, or a shape whose material changed,
+# - it read a changed light, or went through the list of lights when
+#   lights were added (even if the list was empty then),
+# - one of its ray segments enters the new box of a changed shape, which
+#   could now be hit in front of what was hit before.
+# Every other tile would render bit for bit the same and is kept.
+import os
+import json
+
+import numpy as np
+
+from .accumulator import Accumulator
+from .fingerprint import fingerprint
+from .gbuffer import SceneView
+
+def scene_keys(scene):
+    # content fingerprints of the scene objects; settings covers everything
+    # else (camera, background, ambient light, depth)
+    settings = {k: v for k, v in scene.__dict__.items() if k not in ("shapes", "materials", "lights")}
+    return dict(
+        settings=fingerprint(settings, material_content=True),
+        shapes=[fingerprint(shape, material_content=True) for shape in scene.shapes],
+        materials=[fingerprint(material, material_content=True) for material in scene.materials],
+        lights=[fingerprint(light) for light in getattr(scene, "lights", [])],
+    )
+
+# noted in the lights a tile read when its shading went through the list
+AnyLight = -1
+
+class LightList(list):
+    # the scene lights, noting when the shading goes through the list
+    def __init__(self, lights, touched):
+        super().__init__(lights)
+        self.touched = touched
+
+    def __iter__(self):
+        self.touched.add(AnyLight)
+        return super().__iter__()
+
+    def __len__(self):
+        self.touched.add(AnyLight)
+        return super().__len__()
+
+class LightView:
+    # a scene light that notes when the shading reads it
+    def __init__(self, light, index, touched):
+        self.light = light
+        self.index = index
+        self.touched = touched
+
+    def __getattr__(self, name):
+        self.touched.add(self.index)
+        return getattr(self.light, name)
+
+class DependencyTracker:
+    # shades the rays of one tile normally and notes what they depend on
+    def __init__(self, context, tile, pass_index):
+        self.scene = context.scene
+        self.shapes = set()
+        self.lights = set()
+        self.segments = []
+        self.view = SceneView(self.scene, self._query)
+        self.view.lights = LightList([LightView(light, k, self.lights) for k, light in enumerate(getattr(self.scene, "lights", []))], self.lights)
+
+    def start_pixel(self, i, j):
+        pass
+
+    def _query(self, ray):
+        hit_rec = self.scene.hit(ray)
+        o, d = ray.origin, ray.direction
+        self.segments.append((o.x, o.y, o.z, d.x, d.y, d.z, hit_rec.t))
+        if hit_rec.shape_id is not None:
+            self.shapes.add(hit_rec.shape_id)
+        return hit_rec
+
+    def shade(self, ray):
+        hit_rec = self._query(ray)
+        if not hit_rec.hit:
+            return self.scene.background
+        return hit_rec.material.shade(hit_rec, self.view)
+
+    def finish(self, result):
+        result.dependencies = dict(
+            shapes=self.shapes, lights=self.lights,
+            segments=np.array(self.segments, dtype=np.float32).reshape(-1, 7),
+        )
+
+def segments_enter(segments, lo, hi):
+    # mask of the segments (origin, direction, length) entering a box
+    o = segments[:, :3].astype(float)
+    d = segments[:, 3:6].astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv_d = 1.0 / d
+        t0 = (lo - o) * inv_d
+        t1 = (hi - o) * inv_d
+    near = np.fmax.reduce(np.fmin(t0, t1), axis=1)
+    far = np.fmin.reduce(np.fmax(t0, t1), axis=1)
+    return (near <= far) & (far >= 0) & (near <= segments[:, 6])
+
+class TileDependencies:
+    def __init__(self):
+        self.shapes = set()
+        self.lights = set()
+        self.segments = []
+
+    def add(self, dependencies):
+        self.shapes |= dependencies["shapes"]
+        self.lights |= dependencies["lights"]
+        self.segments.append(dependencies["segments"])
+
+    def all_segments(self):
+        if len(self.segments) > 1:
+            self.segments = [np.concatenate(self.segments)]
+        return self.segments[0] if self.segments else np.zeros((0, 7), dtype=np.float32)
+
+class IncrementalCache:
+    def __init__(self, directory, meta, num_tiles):
+        self.directory = directory
+        # render settings, a cache written with others is not reused
+        self.meta = dict(meta)
+        self.num_tiles = num_tiles
+        # fingerprints of the scene the cache was rendered from
+        self.keys = None
+        # tile index -> TileDependencies
+        self.tiles = dict()
+
+    @property
+    def image_path(self):
+        return os.path.join(self.directory, "image.npz")
+
+    @property
+    def dependencies_path(self):
+        return os.path.join(self.directory, "dependencies.npz")
+
+    def exists(self):
+        return os.path.exists(self.image_path) and os.path.exists(self.dependencies_path)
+
+    def load(self):
+        # the accumulator of the previous run, None if it used other settings
+        with np.load(self.dependencies_path) as data:
+            state = json.loads(str(data["state"]))
+            if state["meta"] != self.meta:
+                return None
+            segments = data["segments"]
+            offsets = data["offsets"]
+        self.keys = state["keys"]
+        self.tiles = dict()
+        for index, shapes, lights in state["tiles"]:
+            deps = self.tiles[index] = TileDependencies()
+            deps.shapes = set(shapes)
+            deps.lights = set(lights)
+            deps.segments = [segments[offsets[index]:offsets[index + 1]]]
+        return Accumulator.load(self.image_path)
+
+    def dirty_tiles(self, scene, keys):
+        # indices of the tiles that may render differently with the scene
+        # of the given keys
+        everything = list(range(self.num_tiles))
+        old = self.keys
+        if old is None or old["settings"] != keys["settings"]:
+            return everything
+        # shapes that changed, appeared or disappeared, and shapes that only
+        # got another material
+        changed = set()
+        recolored = set()
+        for k in range(max(len(old["shapes"]), len(keys["shapes"]))):
+            if k >= len(old["shapes"]) or k >= len(keys["shapes"]) or old["shapes"][k] != keys["shapes"][k]:
+                changed.add(k)
+            elif old["materials"][k] != keys["materials"][k]:
+                recolored.add(k)
+        lights = set(k for k in range(max(len(old["lights"]), len(keys["lights"])))
+                     if k >= len(old["lights"]) or k >= len(keys["lights"]) or old["lights"][k] != keys["lights"][k])
+        added_lights = len(keys["lights"]) > len(old["lights"])
+        dirty = set(k for k in everything if k not in self.tiles)
+        for index, deps in self.tiles.items():
+            if deps.shapes & (changed | recolored) or deps.lights & lights or (added_lights and AnyLight in deps.lights):
+                dirty.add(index)
+        # rays of the remaining tiles that may hit the changed shapes now
+        for k in sorted(changed):
+            if k >= len(scene.shapes):
+                continue
+            bounds = scene.shapes[k].bounds()
+            if bounds is None:
+                # unbounded shapes can be anywhere
+                return everything
+            lo, hi = (np.asarray(b, dtype=float) for b in bounds)
+            # covers the single precision rounding of the stored segments
+            pad = 1e-5 * (1 + np.abs(np.concatenate([lo, hi])).max())
+            for index, deps in self.tiles.items():
+                if index not in dirty and segments_enter(deps.all_segments(), lo - pad, hi + pad).any():
+                    dirty.add(index)
+        return sorted(dirty)
+
+    def reset(self, tile_indices):
+        for index in tile_indices:
+            self.tiles.pop(index, None)
+
+    def add_tile(self, result):
+        self.tiles.setdefault(result.tile.index, TileDependencies()).add(result.dependencies)
+
+    def save(self, accumulator, keys):
+        os.makedirs(self.directory, exist_ok=True)
+        indices = sorted(self.tiles)
+        segments = [self.tiles[k].all_segments() for k in indices]
+        offsets = np.zeros(self.num_tiles + 1, dtype=np.int64)
+        for k, s in zip(indices, segments):
+            offsets[k + 1] = len(s)
+        offsets = np.cumsum(offsets)
+        state = dict(
+            meta=self.meta, keys=keys,
+            tiles=[(k, sorted(self.tiles[k].shapes), sorted(self.tiles[k].lights)) for k in indices],
+        )
+        # the image first: dependencies older than the image only make the
+        # next run render more tiles
+        accumulator.save(self.image_path)
+        # segments are stored in tile order
+        tmp_path = self.dependencies_path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            state=np.array(json.dumps(state)),
+            offsets=offsets,
+            segments=np.concatenate(segments) if segments else np.zeros((0, 7), dtype=np.float32),
+        )
+        os.replace(tmp_path, self.dependencies_path)
+        self.keys = keys
@@ -0,0 +1,162 @@
+# Two level instancing: many transformed copies of a few shapes.
+#
+# InstanceSet keeps the unique shapes once and, per instance, only the index
+# of its shape, its transform matrices and its material. A top level BVH
+# over the world bounds of the instances finds the few instances a ray can
+# hit, and the ray is moved into each of their object spaces and handed to
+# the shared shape (with its own BVH, for meshes and sphere sets).
+import numpy as np
+
+from .base import Shape, HitRecord, CastEpsilon
+from .bvh import BVH, nearest
+from .object_transform import transform_bounds
+from .ray import Ray
+from .vector3d import Vector3D
+
+class InstanceSet(Shape):
+    def __init__(self, shapes, matrices, materials=None, leaf_size=4, width=8):
+        # shapes: one shape for all instances or one per instance; materials:
+        # one per instance, None to use the scene material
+        super().__init__("instance_set")
+        matrices = np.asarray(matrices, dtype=float).reshape(-1, 4, 4)
+        count = len(matrices)
+        if isinstance(shapes, Shape):
+            shapes = [shapes] * count
+        if len(shapes) != count:
+            raise ValueError(f"{len(shapes)} shapes for {count} instance matrices")
+        # unique shapes, instances refer to them by index
+        self.shapes = []
+        index = dict()
+        shape_ids = np.zeros(count, dtype=np.int32)
+        for k, shape in enumerate(shapes):
+            if id(shape) not in index:
+                if shape.bounds() is None:
+                    raise ValueError(f"{type(shape).__name__} is unbounded and cannot be instanced")
+                index[id(shape)] = len(self.shapes)
+                self.shapes.append(shape)
+            shape_ids[k] = index[id(shape)]
+        lo, hi = self._world_bounds(shape_ids, matrices)
+        self.bvh = BVH(lo, hi, leaf_size, width)
+        # instances are stored in BVH order
+        order = self.bvh.order
+        self.shape_ids = shape_ids[order]
+        self._set(matrices, lo, hi)
+        self.materials = None
+        if materials is not None:
+            if len(materials) != count:
+                raise ValueError(f"{len(materials)} materials for {count} instances")
+            self.materials = [materials[k] for k in order]
+
+    def _world_bounds(self, shape_ids, matrices):
+        # all instances of a shape at once
+        lo = np.zeros((len(matrices), 3))
+        hi = np.zeros((len(matrices), 3))
+        for s, shape in enumerate(self.shapes):
+            mask = shape_ids == s
+            lo[mask], hi[mask] = transform_bounds(shape.bounds(), matrices[mask])
+        return lo, hi
+
+    def _set(self, matrices, lo, hi):
+        # matrices and world bounds in the original instance order
+        order = self.bvh.order
+        self.lo = lo[order]
+        self.hi = hi[order]
+        self.matrices = matrices[order]
+        self.inverses = np.linalg.inv(self.matrices)
+        self.inverse_transposes = self.inverses.transpose(0, 2, 1)
+
+    def set_matrices(self, matrices):
+        # moves the instances (given in their original order, as in the
+        # constructor) and refits the BVH instead of building it again
+        matrices = np.asarray(matrices, dtype=float).reshape(-1, 4, 4)
+        if len(matrices) != len(self.shape_ids):
+            raise ValueError(f"{len(matrices)} matrices for {len(self.shape_ids)} instances")
+        shape_ids = np.empty_like(self.shape_ids)
+        shape_ids[self.bvh.order] = self.shape_ids
+        lo, hi = self._world_bounds(shape_ids, matrices)
+        self.bvh.refit(lo, hi)
+        self._set(matrices, lo, hi)
+
+    def bounds(self):
+        return self.bvh.lo[0].astype(float), self.bvh.hi[0].astype(float)
+
+    def __len__(self):
+        return len(self.shape_ids)
+
+    def _local_hit(self, k, origin, direction, depth):
+        # hit of instance k in object space, t measured along the world ray
+        o = self.inverses[k] @ np.append(origin, 1.0)
+        d = self.inverses[k] @ np.append(direction, 0.0)
+        local_ray = Ray(Vector3D(*(o[:3] / o[3]).tolist()), Vector3D(*d[:3].tolist()), depth)
+        local = self.shapes[self.shape_ids[k]].hit(local_ray)
+        if not local.hit:
+            return None, None
+        p = local.point
+        world = self.matrices[k] @ np.array([p.x, p.y, p.z, 1.0])
+        world = world[:3] / world[3]
+        return float((world - origin) @ direction), (local, world)
+
+    def intersect(self, origins, directions, t_max=None):
+        # Batched closest hits: distance along the ray (inf on a miss) and
+        # index of the instance hit (-1 on a miss)
+        origins = np.asarray(origins, dtype=float)
+        directions = np.asarray(directions, dtype=float)
+        n = len(origins)
+        t_max = np.full(n, np.inf) if t_max is None else np.asarray(t_max, dtype=float)
+        rays, instances = self.bvh.candidates(origins, directions, t_max)
+        t = np.full(len(rays), np.inf)
+        # rays are moved to object space together, instance by instance
+        for k in np.unique(instances):
+            pairs = np.flatnonzero(instances == k)
+            o = np.c_[origins[rays[pairs]], np.ones(len(pairs))] @ self.inverses[k].T
+            d = directions[rays[pairs]] @ self.inverses[k][:3, :3].T
+            o = o[:, :3] / o[:, 3:]
+            shape = self.shapes[self.shape_ids[k]]
+            if hasattr(shape, "intersect"):
+                length = np.linalg.norm(d, axis=1)
+                local_t, _ = shape.intersect(o, d / length[:, None])
+                # object space distance back to world space distance
+                local_t = local_t / length
+            else:
+                local_t = np.array([self._local_t(shape, o[m], d[m]) for m in range(len(pairs))])
+            local_t[local_t >= t_max[rays[pairs]]] = np.inf
+            t[pairs] = local_t
+        t[t <= CastEpsilon] = np.inf
+        best_t, pair = nearest(rays, t, n)
+        found = pair >= 0
+        best_index = np.full(n, -1, dtype=np.int64)
+        best_index[found] = instances[pair[found]]
+        return best_t, best_index
+
+    def _local_t(self, shape, o, d):
+        # world distance of a scalar hit for shapes without a batched query
+        length = np.linalg.norm(d)
+        hit_rec = shape.hit(Ray(Vector3D(*o.tolist()), Vector3D(*d.tolist())))
+        return hit_rec.t / length if hit_rec.hit else np.inf
+
+    def hit(self, ray):
+        origin = np.array([ray.origin.x, ray.origin.y, ray.origin.z])
+        direction = np.array([ray.direction.x, ray.direction.y, ray.direction.z])
+        _, instances = self.bvh.candidates(origin[None], direction[None], np.array([np.inf]))
+        # instances in the order the ray enters their boxes, so the search
+        # stops at the first box behind the closest hit so far
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t0 = (self.lo[instances] - origin) / direction
+            t1 = (self.hi[instances] - origin) / direction
+        entry = np.fmax.reduce(np.fmin(t0, t1), axis=1)
+        best_t, best = float('inf'), None
+        for near, k in sorted(zip(entry.tolist(), instances.tolist())):
+            if near > best_t:
+                break
+            t, found = self._local_hit(k, origin, direction, ray.depth)
+            if found is not None and CastEpsilon < t < best_t:
+                best_t, best = t, (k, found)
+        if best is None:
+            return HitRecord(False, float('inf'), None, None)
+        k, (local, world) = best
+        n = local.normal
+        normal = self.inverse_transposes[k] @ np.array([n.x, n.y, n.z, 0.0])
+        material = local.material
+        if material is None and self.materials is not None:
+            material = self.materials[k]
+        return HitRecord(True, best_t, Vector3D(*world.tolist()), Vector3D(*normal[:3].tolist()).normalize(), material, ray, local.uv)
@@ -0,0 +1,42 @@
+# Interval arithmetic on (lo, hi) pairs, for conservative bounds of
+# implicit functions over boxes. Rounding is not directed: callers keep a
+# small margin around zero.
+
+def add(a, b):
+    return a[0] + b[0], a[1] + b[1]
+
+def scale(c, a):
+    if c >= 0:
+        return c * a[0], c * a[1]
+    return c * a[1], c * a[0]
+
+def shift(a, c):
+    return a[0] + c, a[1] + c
+
+def mul(a, b):
+    products = (a[0] * b[0], a[0] * b[1], a[1] * b[0], a[1] * b[1])
+    return min(products), max(products)
+
+def square(a):
+    lo, hi = a
+    if lo >= 0:
+        return lo * lo, hi * hi
+    if hi <= 0:
+        return hi * hi, lo * lo
+    return 0.0, max(lo * lo, hi * hi)
+
+def power(a, n):
+    # non-negative integer powers
+    if n == 0:
+        return 1.0, 1.0
+    if n % 2:
+        return a[0] ** n, a[1] ** n
+    return square(a) if n == 2 else power(square(a), n // 2)
+
+def magnitude(a):
+    # largest absolute value
+    return max(-a[0], a[1])
+
+def box(lo, hi):
+    # the intervals of x, y and z over the box between two corners
+    return (lo[0], hi[0]), (lo[1], hi[1]), (lo[2], hi[2])
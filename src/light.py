@@ -1,4 +1,4 @@
-from random import uniform
+from .rng import uniform
 from .vector3d import Vector3D
 from .base import Color
 
@@ -4,6 +4,15 @@ from .base import Color, CastEpsilon, Material
 from .ray import Ray
 from .vector3d import Vector3D
 
+def defer_secondary_differentials(secondary, hit_record, follow, *args):
+    # gives a ray leaving the hit the differentials follow (one of the Ray
+    # *_differentials methods) computes from the hit ray, when the hit ray
+    # has some; they are only computed if the ray reaches a shape reading
+    # them (an implicit surface, or a checkerboard it shades)
+    ray = hit_record.ray
+    if ray is not None and ray.has_differentials():
+        secondary.defer_differentials(lambda: follow(ray, hit_record.t, hit_record.normal, *args))
+
 class ColorMaterial(Material):
     def __init__(self,
                 diffuse_color: Color,
@@ -70,6 +79,7 @@ class SimpleMaterialWithShadows(SimpleMaterial):
 
             # Shadow check
             shadow_ray = Ray(hit_record.point + hit_record.normal * CastEpsilon, light_vector.normalize())
+            defer_secondary_differentials(shadow_ray, hit_record, Ray.shadow_differentials, light_vector.length())
             shadow_hit = scene.hit(shadow_ray)
             if shadow_hit.hit and shadow_hit.t < light_vector.length():
                 continue  # In shadow, skip this light
@@ -90,17 +100,24 @@ class SimpleMaterialWithShadows(SimpleMaterial):
 
         return shaded_color
 
+# most boxes a stretched pixel footprint is filtered with
+MaxFootprintBoxes = 16
+
 class CheckerboardMaterial(SimpleMaterial):
-    def __init__(self, ambient_coefficient: float, diffuse_coefficient: float, square_size: float, white_color: Color = Color(1,1,1), black_color: Color = Color(0,0,0)):
+    def __init__(self, ambient_coefficient: float, diffuse_coefficient: float, square_size: float, white_color: Color = Color(1,1,1), black_color: Color = Color(0,0,0), filtered: bool = True):
         super().__init__(ambient_coefficient, diffuse_coefficient, Color(0, 0, 0), 0, Color(0,0,0), 32)
         self.square_size = square_size
         self.white_color = white_color
         self.black_color = black_color
+        # filter over the pixel footprint of rays with differentials; point
+        # sampling skips computing them
+        self.filtered = filtered
 
     def shade(self, hit_record, scene):
         shaded_color = Color(0, 0, 0)
         # Ambient component
         amb_color = scene.ambient_light * self.ambient_coefficient 
+        diffuse_color = None
         for light in scene.lights:
             light_vector = light.position() - hit_record.point
 
@@ -109,17 +126,16 @@ class CheckerboardMaterial(SimpleMaterial):
 
             # Shadow check
             shadow_ray = Ray(hit_record.point + hit_record.normal * CastEpsilon, light_vector.normalize())
+            defer_secondary_differentials(shadow_ray, hit_record, Ray.shadow_differentials, light_vector.length())
             shadow_hit = scene.hit(shadow_ray)
             if shadow_hit.hit and shadow_hit.t < light_vector.length():
                 continue  # In shadow, skip this light
 
-            # Diffuse component from checkerboard pattern
-            u = hit_record.uv.x / self.square_size
-            v = hit_record.uv.y / self.square_size
-
-            diffuse_color = self.black_color  # black
-            if (int(math.floor(u)) + int(math.floor(v))) % 2 == 0:
-                diffuse_color = self.white_color  # white
+            # Diffuse component from checkerboard pattern, the same for
+            # every light and not needed when all of them are shadowed
+            if diffuse_color is None:
+                white = self.white_share(hit_record)
+                diffuse_color = self.white_color * white + self.black_color * (1 - white)
 
             light_dir = light_vector.normalize()
             diff_intensity = max(hit_record.normal.dot(light_dir), 0)
@@ -130,6 +146,37 @@ class CheckerboardMaterial(SimpleMaterial):
 
         return shaded_color
 
+    def white_share(self, hit_record):
+        # share of white squares over the pixel footprint, or at the point
+        # for rays without differentials and unfiltered checkerboards. The
+        # footprint is the parallelogram spanned by the uv change per pixel;
+        # it is cut along its longer side in boxes about as long as they are
+        # wide, and the checker is box filtered analytically over each of
+        # them.
+        u = hit_record.uv.x / self.square_size
+        v = hit_record.uv.y / self.square_size
+        if not self.filtered or hit_record.duv is None:
+            return 1.0 if (int(math.floor(u)) + int(math.floor(v))) % 2 == 0 else 0.0
+        major, minor = (d / self.square_size for d in hit_record.duv)
+        if math.hypot(major.x, major.y) < math.hypot(minor.x, minor.y):
+            major, minor = minor, major
+        count = min(MaxFootprintBoxes, max(1, math.ceil(math.hypot(major.x, major.y) / max(math.hypot(minor.x, minor.y), 1e-12))))
+        wu = abs(major.x) / count + abs(minor.x)
+        wv = abs(major.y) / count + abs(minor.y)
+        total = 0.0
+        for k in range(count):
+            offset = (k + 0.5) / count - 0.5
+            total += filtered_square_wave(u + offset * major.x, wu) * filtered_square_wave(v + offset * major.y, wv)
+        return 0.5 + 0.5 * total / count
+
+def filtered_square_wave(x, width):
+    # average over [x - width / 2, x + width / 2] of the wave that is 1 on
+    # [0, 1) and -1 on [1, 2), from its integral -2 |fract(x / 2) - 1 / 2|
+    if width < 1e-9:
+        return 1.0 if int(math.floor(x)) % 2 == 0 else -1.0
+    integral = lambda a: -2 * abs(a / 2 - math.floor(a / 2) - 0.5)
+    return (integral(x + width / 2) - integral(x - width / 2)) / width
+
 class TranslucidMaterial(SimpleMaterial):
     def __init__(self, ambient_coefficient: float, diffuse_coefficient: float, diffuse_color: Color, specular_coefficient: float, specular_color: Color, specular_shininess: float = 32, transmission_coefficient: float = 0.5, refraction_index: float = 1.5):
         super().__init__(ambient_coefficient, diffuse_coefficient, diffuse_color, specular_coefficient, specular_color, specular_shininess)
@@ -178,6 +225,7 @@ class TranslucidMaterial(SimpleMaterial):
             if k >= 0: # if k < 0 total internal reflection occurs
                 refract_dir =  (-view_dir * eta  + n * (eta * c - math.sqrt(k))).normalize()
                 transmission_ray = Ray(hit_record.point, refract_dir, hit_record.ray.depth + 1)
+                defer_secondary_differentials(transmission_ray, hit_record, Ray.transmitted_differentials)
                 transmission_hit = scene.hit(transmission_ray)
                 if transmission_hit.hit:
                     transmission_material = transmission_hit.material
@@ -186,6 +234,7 @@ class TranslucidMaterial(SimpleMaterial):
                 # total internal reflection, treat as perfect mirror
                 reflect_dir = (n * 2 * n.dot(view_dir) - view_dir).normalize()
                 reflection_ray = Ray(hit_record.point, reflect_dir, hit_record.ray.depth + 1)
+                defer_secondary_differentials(reflection_ray, hit_record, Ray.reflected_differentials)
                 reflection_hit = scene.hit(reflection_ray)
                 if reflection_hit.hit:
                     reflection_material = reflection_hit.material
@@ -227,6 +276,7 @@ class MirrorMaterial(Material):
 
         reflect_dir = (incident_dir - normal * 2 * incident_dir.dot(normal)).normalize()
         reflect_ray = Ray(hit_record.point + normal * CastEpsilon, reflect_dir, hit_record.ray.depth + 1)
+        defer_secondary_differentials(reflect_ray, hit_record, Ray.reflected_differentials)
         reflect_hit = scene.hit(reflect_ray)
         decay = self.reflection_coefficient * self.decay_per_bounce
         if reflect_hit.hit:
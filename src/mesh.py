@@ -0,0 +1,303 @@
+# Triangle meshes: vertex, index and normal arrays with a BVH over the
+# triangles, loaded from OBJ or binary PLY files. Parsed arrays and the
+# built BVH are cached in an uncompressed .npz file next to the model, which
+# is memory-mapped on reload, so a model is only parsed and sorted once and
+# reloads without reading it all.
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+from .base import Shape, HitRecord, CastEpsilon
+from .bvh import BVH, nearest
+from .vector3d import Vector3D
+
+# bump when the cache layout changes
+CacheVersion = 2
+
+def _fan(polygon):
+    # triangulates a convex polygon given as a list of vertex indices
+    return [(polygon[0], polygon[k], polygon[k + 1]) for k in range(1, len(polygon) - 1)]
+
+def load_obj(path):
+    # vertices, triangles and per vertex normals (None when the file has
+    # none for some face) of a Wavefront OBJ file; vertices used with
+    # several normals are split, one copy per normal
+    vertices = []
+    normals = []
+    faces = []
+    face_normals = []
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == "v":
+                vertices.append([float(v) for v in parts[1:4]])
+            elif parts[0] == "vn":
+                normals.append([float(v) for v in parts[1:4]])
+            elif parts[0] == "f":
+                polygon = []
+                polygon_normals = []
+                for corner in parts[1:]:
+                    fields = corner.split("/")
+                    v = int(fields[0])
+                    # negative indices count from the end
+                    polygon.append(v - 1 if v > 0 else len(vertices) + v)
+                    if len(fields) > 2 and fields[2]:
+                        n = int(fields[2])
+                        polygon_normals.append(n - 1 if n > 0 else len(normals) + n)
+                faces.extend(_fan(polygon))
+                if len(polygon_normals) == len(polygon):
+                    face_normals.extend(_fan(polygon_normals))
+    vertices = np.array(vertices, dtype=float).reshape(-1, 3)
+    faces = np.array(faces, dtype=np.int64).reshape(-1, 3)
+    vertex_normals = None
+    if normals and len(face_normals) == len(faces):
+        # OBJ indexes normals separately, every (vertex, normal) pair used
+        # becomes a vertex
+        corners = np.stack([faces.ravel(), np.array(face_normals, dtype=np.int64).ravel()], axis=1)
+        pairs, inverse = np.unique(corners, axis=0, return_inverse=True)
+        if len(pairs) == len(np.unique(pairs[:, 0])):
+            # one normal per vertex, the vertices stay as in the file
+            vertex_normals = np.zeros_like(vertices)
+            vertex_normals[pairs[:, 0]] = np.array(normals, dtype=float)[pairs[:, 1]]
+        else:
+            vertices = vertices[pairs[:, 0]]
+            vertex_normals = np.array(normals, dtype=float)[pairs[:, 1]]
+            faces = inverse.reshape(-1, 3)
+    return vertices, faces, vertex_normals
+
+PlyTypes = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+}
+
+def _read_ply_header(f):
+    if f.readline().strip() != b"ply":
+        raise ValueError("not a PLY file")
+    fmt = None
+    elements = []
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError("PLY header is not terminated")
+        parts = line.decode("ascii").split()
+        if not parts or parts[0] in ("comment", "obj_info"):
+            continue
+        if parts[0] == "end_header":
+            return fmt, elements
+        if parts[0] == "format":
+            fmt = parts[1]
+        elif parts[0] == "element":
+            elements.append((parts[1], int(parts[2]), []))
+        elif parts[0] == "property":
+            if parts[1] == "list":
+                elements[-1][2].append((parts[4], (PlyTypes[parts[2]], PlyTypes[parts[3]])))
+            else:
+                elements[-1][2].append((parts[2], PlyTypes[parts[1]]))
+
+def load_ply(path):
+    # vertices, triangles and per vertex normals of a binary PLY file
+    with open(path, "rb") as f:
+        fmt, elements = _read_ply_header(f)
+        if fmt not in ("binary_little_endian", "binary_big_endian"):
+            raise ValueError(f"{path}: only binary PLY files are supported, got {fmt}")
+        endian = "<" if fmt == "binary_little_endian" else ">"
+        data = f.read()
+    offset = 0
+    vertices = faces = normals = None
+    for name, count, properties in elements:
+        if all(not isinstance(t, tuple) for _, t in properties):
+            # fixed size records are read in one go
+            dtype = np.dtype([(p, endian + t) for p, t in properties])
+            records = np.frombuffer(data, dtype, count, offset)
+            offset += dtype.itemsize * count
+            if name == "vertex":
+                vertices = np.stack([records[a] for a in "xyz"], axis=1).astype(float)
+                if all(a in records.dtype.names for a in ("nx", "ny", "nz")):
+                    normals = np.stack([records[a] for a in ("nx", "ny", "nz")], axis=1).astype(float)
+            continue
+        if name == "face" and len(properties) == 1:
+            # fast path: every face a triangle
+            count_type, index_type = properties[0][1]
+            dtype = np.dtype([("n", endian + count_type), ("i", endian + index_type, 3)])
+            if offset + dtype.itemsize * count <= len(data):
+                records = np.frombuffer(data, dtype, count, offset)
+                if (records["n"] == 3).all():
+                    faces = records["i"].astype(np.int64)
+                    offset += dtype.itemsize * count
+                    continue
+        # general case, record by record
+        polygons = []
+        for _ in range(count):
+            for prop, t in properties:
+                if isinstance(t, tuple):
+                    n = int(np.frombuffer(data, endian + t[0], 1, offset)[0])
+                    offset += np.dtype(t[0]).itemsize
+                    values = np.frombuffer(data, endian + t[1], n, offset)
+                    offset += np.dtype(t[1]).itemsize * n
+                    if name == "face" and prop in ("vertex_indices", "vertex_index"):
+                        polygons.extend(_fan(values.tolist()))
+                else:
+                    offset += np.dtype(t).itemsize
+        if name == "face":
+            faces = np.array(polygons, dtype=np.int64).reshape(-1, 3)
+    if vertices is None or faces is None:
+        raise ValueError(f"{path}: PLY file without vertex or face element")
+    return vertices, faces, normals
+
+Loaders = {".obj": load_obj, ".ply": load_ply}
+
+def mmap_npz(path):
+    # arrays of an uncompressed .npz file memory-mapped in place: the members
+    # of the zip file are .npy files stored as is
+    arrays = dict()
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: compressed member {info.filename} cannot be memory-mapped")
+            # the local file header has its own name and extra field lengths
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            arrays[info.filename[:-len(".npy")]] = np.memmap(
+                path, dtype, "r", f.tell(), shape, "F" if fortran_order else "C")
+    return arrays
+
+class TriangleMesh(Shape):
+    def __init__(self, vertices, faces, normals=None, leaf_size=8, width=8, chunk_size=4096, bvh=None):
+        super().__init__("triangle_mesh")
+        self.vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        # per vertex normals, interpolated across the triangles
+        self.normals = None if normals is None else np.asarray(normals, dtype=float).reshape(-1, 3)
+        corners = self.vertices[faces]
+        if bvh is None:
+            bvh = BVH(corners.min(axis=1), corners.max(axis=1), leaf_size, width)
+            # triangles are stored in BVH order
+            faces = faces[bvh.order]
+            corners = corners[bvh.order]
+        self.bvh = bvh
+        self.faces = faces
+        # first vertex and edges of every triangle, as used by Moller-Trumbore
+        self.v0 = np.ascontiguousarray(corners[:, 0])
+        self.e1 = corners[:, 1] - corners[:, 0]
+        self.e2 = corners[:, 2] - corners[:, 0]
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_arrays(cls, arrays, chunk_size=4096):
+        # rebuilds a mesh from its cache arrays without any computation
+        mesh = cls.__new__(cls)
+        Shape.__init__(mesh, "triangle_mesh")
+        mesh.bvh = BVH.from_arrays(arrays)
+        for name in ("vertices", "faces", "v0", "e1", "e2"):
+            setattr(mesh, name, arrays[name])
+        mesh.normals = arrays.get("normals")
+        mesh.chunk_size = chunk_size
+        return mesh
+
+    def arrays(self):
+        arrays = dict(self.bvh.arrays(), vertices=self.vertices, faces=self.faces, v0=self.v0, e1=self.e1, e2=self.e2)
+        if self.normals is not None:
+            arrays["normals"] = self.normals
+        return arrays
+
+    @classmethod
+    def load(cls, path, cache=True, leaf_size=8, width=8, chunk_size=4096):
+        # OBJ or binary PLY, through the .npz cache unless cache is False
+        cache_path = path + ".npz"
+        stat = os.stat(path)
+        # the cache is rebuilt when the model or the BVH settings change
+        source = np.array([CacheVersion, stat.st_size, stat.st_mtime_ns, leaf_size, width])
+        if cache and os.path.exists(cache_path):
+            arrays = mmap_npz(cache_path)
+            if np.array_equal(arrays.get("source"), source):
+                return cls.from_arrays(arrays, chunk_size)
+        loader = Loaders.get(os.path.splitext(path)[1].lower())
+        if loader is None:
+            raise ValueError(f"{path}: unsupported mesh format, expected one of {sorted(Loaders)}")
+        mesh = cls(*loader(path), leaf_size=leaf_size, width=width, chunk_size=chunk_size)
+        if cache:
+            arrays = dict(mesh.arrays(), source=source)
+            # written under a temporary name so readers never see half a file
+            with open(cache_path + ".tmp", "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(cache_path + ".tmp", cache_path)
+        return mesh
+
+    def bounds(self):
+        # root box of the BVH
+        return self.bvh.lo[0].astype(float), self.bvh.hi[0].astype(float)
+
+    def __len__(self):
+        return len(self.faces)
+
+    def intersect(self, origins, directions, t_max=None):
+        # Batched closest hits of N rays (N x 3 arrays): distance along the
+        # ray (inf on a miss) and index of the triangle hit (-1 on a miss)
+        origins = np.asarray(origins, dtype=float)
+        directions = np.asarray(directions, dtype=float)
+        n = len(origins)
+        t_max = np.full(n, np.inf) if t_max is None else np.asarray(t_max, dtype=float)
+        best_t = np.full(n, np.inf)
+        best_index = np.full(n, -1, dtype=np.int64)
+        for start in range(0, n, self.chunk_size):
+            chunk = slice(start, min(start + self.chunk_size, n))
+            o, d, limit = origins[chunk], directions[chunk], t_max[chunk]
+            rays, tris = self.bvh.candidates(o, d, limit)
+            dd = d[rays]
+            e1 = self.e1[tris]
+            e2 = self.e2[tris]
+            p = np.cross(dd, e2)
+            det = (e1 * p).sum(axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                inv_det = 1.0 / det
+                s = o[rays] - self.v0[tris]
+                u = (s * p).sum(axis=1) * inv_det
+                q = np.cross(s, e1)
+                v = (dd * q).sum(axis=1) * inv_det
+                t = (e2 * q).sum(axis=1) * inv_det
+                # rays parallel to a triangle give nan, which fails every test
+                valid = (np.abs(det) > 1e-12) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > CastEpsilon) & (t < limit[rays])
+            t = np.where(valid, t, np.inf)
+            t_chunk, pair = nearest(rays, t, len(o))
+            found = pair >= 0
+            best_t[chunk] = t_chunk
+            best_index[chunk][found] = tris[pair[found]]
+        return best_t, best_index
+
+    def barycentric(self, k, point):
+        # (u, v) of a point on triangle k, weights of its second and third vertex
+        e1, e2 = self.e1[k], self.e2[k]
+        w = np.array([point.x, point.y, point.z]) - self.v0[k]
+        d11, d12, d22 = e1 @ e1, e1 @ e2, e2 @ e2
+        w1, w2 = w @ e1, w @ e2
+        denom = d11 * d22 - d12 * d12
+        return (d22 * w1 - d12 * w2) / denom, (d11 * w2 - d12 * w1) / denom
+
+    def hit(self, ray):
+        o, d = ray.origin, ray.direction
+        t, index = self.intersect(np.array([[o.x, o.y, o.z]]), np.array([[d.x, d.y, d.z]]))
+        k = int(index[0])
+        if k < 0:
+            return HitRecord(False, float('inf'), None, None)
+        t = float(t[0])
+        point = ray.point_at_parameter(t)
+        if self.normals is not None:
+            # smooth shading: vertex normals blended by barycentric weights
+            u, v = self.barycentric(k, point)
+            n = self.normals[self.faces[k]]
+            normal = Vector3D(*(float(c) for c in (1 - u - v) * n[0] + u * n[1] + v * n[2]))
+        else:
+            normal = Vector3D(*(float(c) for c in np.cross(self.e1[k], self.e2[k])))
+        return HitRecord(True, t, point, normal.normalize())
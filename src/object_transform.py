@@ -1,6 +1,6 @@
 import numpy as np
 from src.vector3d import Vector3D
-from src.ray import Ray
+from src.ray import Ray, normalized_differential
 from .base import Shape, HitRecord, CastEpsilon
 
 
@@ -8,6 +8,10 @@ class ObjectTransform(Shape):
     def __init__(self, shape, transform_matrix):
         super().__init__(f"transformed_{shape.type}")
         self.shape = shape
+        self.set_transform(transform_matrix)
+
+    def set_transform(self, transform_matrix):
+        # also used to move the shape between animation frames
         self.transform_matrix = np.array(transform_matrix, dtype=float)
         
         # Precompute the inverse transformation matrix
@@ -19,6 +23,12 @@ class ObjectTransform(Shape):
         # Precompute the inverse transpose for normal transformation
         self.inverse_transpose = self.inverse_transform.T
 
+    def bounds(self):
+        local = self.shape.bounds()
+        if local is None:
+            return None
+        return transform_bounds(local, self.transform_matrix)
+
     def _transform_point(self, point, matrix):
     # Transform a point using a 4x4 homogeneous matrix
         # Converting Vector3D to homogeneous coordinates
@@ -38,6 +48,11 @@ class ObjectTransform(Shape):
         transformed = matrix @ homogeneous
         return Vector3D(transformed[0], transformed[1], transformed[2])
 
+    def _object_differentials(self, ray, object_direction):
+        # origins change like directions, by the linear part only
+        dOdx, dDdx, dOdy, dDdy = (self._transform_direction(v, self.inverse_transform) for v in ray.differentials)
+        return (dOdx, normalized_differential(object_direction, dDdx), dOdy, normalized_differential(object_direction, dDdy))
+
     def hit(self, ray):
     # Ray-object intersection using inverse ray transform.
 
@@ -50,6 +65,8 @@ class ObjectTransform(Shape):
             object_direction,
             ray.depth if hasattr(ray, 'depth') else 0
         )
+        if ray.has_differentials():
+            object_ray.defer_differentials(lambda: self._object_differentials(ray, object_direction))
 
         # Then we calculate the intersection in object space
         object_hit = self.shape.hit(object_ray)
@@ -80,7 +97,7 @@ class ObjectTransform(Shape):
             return HitRecord(False, float('inf'), None, None)
 
         # Returning final hit record
-        return HitRecord(
+        hit_rec = HitRecord(
             hit=True,
             t=world_t,
             point=world_point,
@@ -89,6 +106,18 @@ class ObjectTransform(Shape):
             ray=ray,
             uv=object_hit.uv if hasattr(object_hit, 'uv') else None
         )
+        # uv is in object space, and so is its change per pixel
+        hit_rec.defer_duv(lambda: object_hit.duv)
+        return hit_rec
+
+def transform_bounds(bounds, matrix):
+    # world box around the 8 transformed corners of a local box; with a
+    # stack of N matrices, N boxes
+    lo, hi = bounds
+    corners = np.array([[x, y, z, 1.0] for x in (lo[0], hi[0]) for y in (lo[1], hi[1]) for z in (lo[2], hi[2])])
+    world = corners @ np.swapaxes(np.asarray(matrix, dtype=float), -1, -2)
+    world = world[..., :3] / world[..., 3:]
+    return world.min(axis=-2), world.max(axis=-2)
 
 # Some utility functions for creating common transformation matrices
 def translation_matrix(tx, ty, tz):
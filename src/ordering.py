@@ -0,0 +1,111 @@
+# Space filling curve orders for tiles, pixels and ray batches. Neighbouring
+# work items along a Morton or Hilbert curve are neighbours in the image, so
+# consecutive rays hit the same objects and touch the same memory.
+import numpy as np
+
+Orders = ["row", "morton", "hilbert"]
+
+def _part1by1(v):
+    # spreads the bits of v apart: b3 b2 b1 b0 -> b3 0 b2 0 b1 0 b0
+    v = np.asarray(v, dtype=np.uint64) & np.uint64(0xFFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+def morton_index(x, y):
+    return _part1by1(x) | (_part1by1(y) << np.uint64(1))
+
+def hilbert_index(x, y, n):
+    # position along the Hilbert curve filling an n x n grid (n a power of two)
+    x = np.array(x, dtype=np.int64)
+    y = np.array(y, dtype=np.int64)
+    d = np.zeros_like(x)
+    s = n // 2
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant so the curve stays continuous
+        flip = ~ry & rx
+        x = np.where(flip, s - 1 - x, x)
+        y = np.where(flip, s - 1 - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s //= 2
+    return d
+
+def curve_order(x, y, order):
+    # permutation visiting the points (x, y) along the requested curve
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if order == "row":
+        keys = y.astype(np.int64) * (int(x.max(initial=0)) + 1) + x
+    elif order == "morton":
+        keys = morton_index(x, y)
+    elif order == "hilbert":
+        n = 1
+        while n <= max(int(x.max(initial=0)), int(y.max(initial=0))):
+            n *= 2
+        keys = hilbert_index(x, y, n)
+    else:
+        raise ValueError(f"Unknown order '{order}', expected one of {Orders}")
+    return np.argsort(keys, kind="stable")
+
+def order_tiles(tiles, order):
+    if order == "row" or not tiles:
+        return list(tiles)
+    size = max(max(tile.width, tile.height) for tile in tiles)
+    x = [tile.x0 // size for tile in tiles]
+    y = [tile.y0 // size for tile in tiles]
+    return [tiles[k] for k in curve_order(x, y, order)]
+
+def order_pixels(tile, order):
+    # (i, j) pixels of a tile along the curve
+    if order == "row":
+        return list(tile.pixels())
+    i, j = np.mgrid[tile.y0:tile.y1, tile.x0:tile.x1]
+    i, j = i.ravel(), j.ravel()
+    perm = curve_order(j - tile.x0, i - tile.y0, order)
+    return list(zip(i[perm].tolist(), j[perm].tolist()))
+
+def bin_rays(origins, directions, cell_size):
+    # Permutation grouping a batch of rays (N x 3 arrays) by direction
+    # octant first and origin cell second, cells ordered along a 3D Morton
+    # curve. Batched intersection runs faster on the sorted batch since
+    # neighbouring rays traverse the same acceleration structure nodes.
+    origins = np.asarray(origins, dtype=float)
+    directions = np.asarray(directions, dtype=float)
+    octant = ((directions[:, 0] < 0).astype(np.uint64)
+              | ((directions[:, 1] < 0).astype(np.uint64) << np.uint64(1))
+              | ((directions[:, 2] < 0).astype(np.uint64) << np.uint64(2)))
+    cells = np.floor((origins - origins.min(axis=0)) / cell_size).astype(np.int64)
+    cells = np.clip(cells, 0, 2**21 - 1)
+    code = morton_index_3d(cells[:, 0], cells[:, 1], cells[:, 2])
+    return np.lexsort((code, octant))
+
+def morton_index_3d(x, y, z):
+    # x, y, z below 2**21
+    return _part1by2(x) | (_part1by2(y) << np.uint64(1)) | (_part1by2(z) << np.uint64(2))
+
+def morton_order(points, bits=21):
+    # permutation sorting N x 3 points along a 3D Morton curve over their bounds
+    points = np.asarray(points, dtype=float)
+    if len(points) == 0:
+        return np.zeros(0, dtype=np.int64)
+    lo = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - lo, 1e-30)
+    cells = ((points - lo) / extent * (2**bits - 1)).astype(np.int64)
+    return np.argsort(morton_index_3d(cells[:, 0], cells[:, 1], cells[:, 2]), kind="stable")
+
+def _part1by2(v):
+    # spreads the low 21 bits of v two positions apart for 3D Morton codes
+    v = np.asarray(v, dtype=np.uint64) & np.uint64(0x1FFFFF)
+    v = (v | (v << np.uint64(32))) & np.uint64(0x1F00000000FFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x1F0000FF0000FF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x100F00F00F00F00F)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x10C30C30C30C30C3)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return v
@@ -1,8 +1,81 @@
+import math
+
 class Ray:
     def __init__(self, origin, direction, depth=0):
         self.origin = origin
         self.direction = direction.normalize()
         self.depth = depth  # for recursion depth if needed
+        # change of origin and direction per pixel step in x and y,
+        # (dO/dx, dD/dx, dO/dy, dD/dy); set for camera rays only
+        self._differentials = None
+        # computes them on first use instead, most rays never need them
+        self._make_differentials = None
+
+    @property
+    def differentials(self):
+        if self._make_differentials is not None:
+            self._differentials = self._make_differentials()
+            self._make_differentials = None
+        return self._differentials
+
+    @differentials.setter
+    def differentials(self, value):
+        self._differentials = value
+        self._make_differentials = None
+
+    def has_differentials(self):
+        # without computing deferred ones
+        return self._differentials is not None or self._make_differentials is not None
+
+    def defer_differentials(self, make):
+        # make() returns the differentials when they are first read
+        self._differentials = None
+        self._make_differentials = make
 
     def point_at_parameter(self, t):
-        return self.origin + self.direction * t
\ No newline at end of file
+        return self.origin + self.direction * t
+
+    def transfer(self, t, normal):
+        # change of the point at t per pixel step in x and y, for a surface
+        # with this normal (Igehy's transfer of ray differentials)
+        dOdx, dDdx, dOdy, dDdy = self.differentials
+        dn = self.direction.dot(normal)
+        # grazing hits spread the footprint without bound
+        if abs(dn) < 1e-12:
+            dn = math.copysign(1e-12, dn)
+        steps = []
+        for dO, dD in ((dOdx, dDdx), (dOdy, dDdy)):
+            dP = dO + dD * t
+            steps.append(dP - self.direction * (dP.dot(normal) / dn))
+        return steps
+
+    def footprint(self, t):
+        # width of the pixel footprint at t, None without differentials
+        if self.differentials is None:
+            return None
+        dOdx, dDdx, dOdy, dDdy = self.differentials
+        return max((dOdx + dDdx * t).length(), (dOdy + dDdy * t).length())
+
+    def reflected_differentials(self, t, normal):
+        # differentials of the mirror reflection at t, exact for flat
+        # surfaces (the change of the normal is ignored)
+        dPdx, dPdy = self.transfer(t, normal)
+        reflect = lambda d: d - normal * (2 * d.dot(normal))
+        return (dPdx, reflect(self.differentials[1]), dPdy, reflect(self.differentials[3]))
+
+    def transmitted_differentials(self, t, normal):
+        # differentials of a ray leaving the hit at t with the spread of
+        # this one, an approximation for refraction
+        dPdx, dPdy = self.transfer(t, normal)
+        return (dPdx, self.differentials[1], dPdy, self.differentials[3])
+
+    def shadow_differentials(self, t, normal, distance):
+        # differentials of a ray from the hit at t to a point light at this
+        # distance: the footprint shrinks to nothing at the light
+        dPdx, dPdy = self.transfer(t, normal)
+        return (dPdx, dPdx * (-1 / distance), dPdy, dPdy * (-1 / distance))
+
+def normalized_differential(d, dd):
+    # change of d / |d| when d changes by dd
+    dot = d.dot(d)
+    return (dd * dot - d * d.dot(dd)) / (dot * math.sqrt(dot))
@@ -0,0 +1,285 @@
+# Tile based rendering shared by raster.py and the other render tools
+import time
+import hashlib
+from itertools import product
+from collections import Counter
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from .base import Color
+from . import rng, stats
+from .heatmap import CostChannels, pixel_cost
+from .ordering import order_pixels
+
+DefaultTileSize = 32
+
+class Context:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+class Tile:
+    def __init__(self, index, x0, y0, x1, y1):
+        self.index = index
+        # pixel bounds, [x0, x1) x [y0, y1)
+        self.x0 = x0
+        self.y0 = y0
+        self.x1 = x1
+        self.y1 = y1
+        # (height, width) mask of the pixels to render, None for all of them
+        self.mask = None
+
+    @property
+    def width(self):
+        return self.x1 - self.x0
+
+    @property
+    def height(self):
+        return self.y1 - self.y0
+
+    def pixels(self):
+        # (i, j) = (row, column) pairs in row-major order
+        return product(range(self.y0, self.y1), range(self.x0, self.x1))
+
+    def split(self):
+        # halves along the longer side; the parts keep the index of the tile
+        # so they render exactly the pixels the whole tile would
+        if self.width >= self.height:
+            xm = (self.x0 + self.x1) // 2
+            parts = [Tile(self.index, self.x0, self.y0, xm, self.y1), Tile(self.index, xm, self.y0, self.x1, self.y1)]
+        else:
+            ym = (self.y0 + self.y1) // 2
+            parts = [Tile(self.index, self.x0, self.y0, self.x1, ym), Tile(self.index, self.x0, ym, self.x1, self.y1)]
+        if self.mask is not None:
+            for part in parts:
+                part.mask = self.mask[part.y0 - self.y0:part.y1 - self.y0, part.x0 - self.x0:part.x1 - self.x0]
+        return parts
+
+def make_tiles(img_width, img_height, tile_size=DefaultTileSize):
+    tiles = []
+    for y0 in range(0, img_height, tile_size):
+        for x0 in range(0, img_width, tile_size):
+            x1 = min(x0 + tile_size, img_width)
+            y1 = min(y0 + tile_size, img_height)
+            tiles.append(Tile(len(tiles), x0, y0, x1, y1))
+    return tiles
+
+def shard_tiles(tiles, shard_index, num_shards):
+    # Interleaved assignment: shard k gets tiles k, k + N, k + 2N, ... so
+    # every shard covers the whole image evenly, including expensive regions.
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"Shard index {shard_index} out of range for {num_shards} shards")
+    return tiles[shard_index::num_shards]
+
+def tile_seed(scene_key, tile_index, pass_index):
+    # The seed only depends on what is rendered, never on which worker
+    # renders it or when, so any tile can be re-rendered bit-identically.
+    key = f"{scene_key}:{tile_index}:{pass_index}".encode()
+    return int.from_bytes(hashlib.sha256(key).digest()[:8], "little")
+
+def seed_pixel(seed, i, j):
+    # Every pixel gets its own stream derived from the tile seed, so any
+    # part of a tile renders the same as when the whole tile is rendered.
+    # Pixel jitter, cameras and lights all draw from `rng`.
+    rng.seed((i << 96) | (j << 64) | seed)
+
+def render_pixel(context, ij, tracer=None):
+    # tracer: shades the rays instead, recording or replaying what they hit
+    i, j = ij
+    pixel = Color(0, 0, 0)
+    pixel_sq = Color(0, 0, 0)
+    total_rays = 0
+    for _ in range(context.num_samples):
+        # random offset for anti-aliasing
+        dx = rng.uniform(-0.5, 0.5)
+        dy = rng.uniform(-0.5, 0.5)
+        # middle of pixel coordinates
+        x = j + 0.5 + dx
+        y = i + 0.5 + dy
+        # rays from camera (supports depth of field)
+        rays = context.camera.rays(x, y)
+        total_rays += len(rays)
+        for ray in rays:
+            if tracer is not None:
+                shaded_color = tracer.shade(ray)
+                pixel = pixel + shaded_color
+                pixel_sq = pixel_sq + shaded_color @ shaded_color
+                continue
+            # hit ray with scene
+            hit_rec = context.scene.hit(ray)
+            # test if hit something
+            if hit_rec.hit:
+                material = hit_rec.material
+                shaded_color = material.shade(hit_rec, context.scene)
+            else:
+                shaded_color = context.scene.background
+            pixel = pixel + shaded_color
+            pixel_sq = pixel_sq + shaded_color @ shaded_color
+    # unnormalized radiance sums, divided by the ray count when resolved
+    return (i, j, pixel, pixel_sq, total_rays)
+
+class TileResult:
+    def __init__(self, tile, pass_index, sums, sums_sq, counts):
+        self.tile = tile
+        self.pass_index = pass_index
+        # per pixel radiance sum, sum of squares and number of rays
+        self.sums = sums
+        self.sums_sq = sums_sq
+        self.counts = counts
+        # wall time spent rendering the tile
+        self.seconds = 0.0
+        # counters of the tile when statistics are enabled
+        self.stats = None
+        # per pixel cost (see CostChannels) when cost tracking is enabled
+        self.cost = None
+        # parts of the G-buffer recorded for the tile
+        self.gbuffer = None
+        # shading queries a relight answered from the G-buffer and traced
+        self.replay = None
+        # shapes, lights and ray segments the tile depends on, when tracked
+        self.dependencies = None
+        # surface seen through the center of every pixel, for temporal reuse
+        self.surface = None
+        # shape, normal and depth of the first ray of every pixel, for
+        # edge guided anti-aliasing
+        self.features = None
+
+def render_tile(context, tile, pass_index=0):
+    seed = tile_seed(context.scene_key, tile.index, pass_index)
+    sums = np.zeros((tile.height, tile.width, 3))
+    sums_sq = np.zeros((tile.height, tile.width, 3))
+    counts = np.zeros((tile.height, tile.width))
+    # cost tracking reads the statistics counters after every pixel
+    track_cost = stats.enabled and getattr(context, "track_cost", False)
+    cost = np.zeros((tile.height, tile.width, len(CostChannels))) if track_cost else None
+    tile_counters = Counter()
+    # optional tracer class (GBufferRecorder, GBufferRelighter,
+    # DependencyTracker, SurfaceTracer, FeatureTracer), made per tile
+    make_tracer = getattr(context, "tracer", None)
+    tracer = make_tracer(context, tile, pass_index) if make_tracer is not None else None
+    start = time.perf_counter()
+    # every pixel has its own random stream, the order only affects locality
+    for ij in order_pixels(tile, getattr(context, "pixel_order", "row")):
+        # masked out pixels keep zero samples
+        if tile.mask is not None and not tile.mask[ij[0] - tile.y0, ij[1] - tile.x0]:
+            continue
+        pixel_start = time.perf_counter()
+        seed_pixel(seed, *ij)
+        if tracer is not None:
+            tracer.start_pixel(*ij)
+        i, j, pixel, pixel_sq, total_rays = render_pixel(context, ij, tracer)
+        sums[i - tile.y0, j - tile.x0] = pixel.as_list()
+        sums_sq[i - tile.y0, j - tile.x0] = pixel_sq.as_list()
+        counts[i - tile.y0, j - tile.x0] = total_rays
+        if track_cost:
+            snapshot = stats.take()
+            cost[i - tile.y0, j - tile.x0] = pixel_cost(snapshot, time.perf_counter() - pixel_start)
+            tile_counters.update(snapshot)
+    result = TileResult(tile, pass_index, sums, sums_sq, counts)
+    result.cost = cost
+    if tracer is not None:
+        tracer.finish(result)
+    result.seconds = time.perf_counter() - start
+    if stats.enabled:
+        stats.counters["tiles"] += 1
+        stats.counters["time.tiles"] += result.seconds
+        tile_counters.update(stats.take())
+        result.stats = dict(tile_counters)
+    return result
+
+def probe_tile(context, tile):
+    # wall time of every pixel of a cheap 1 spp render, used to estimate
+    # where the real render will spend its time
+    seed = tile_seed(context.scene_key, tile.index, -1)
+    times = np.zeros((tile.height, tile.width))
+    for ij in tile.pixels():
+        start = time.perf_counter()
+        seed_pixel(seed, *ij)
+        render_pixel(context, ij)
+        times[ij[0] - tile.y0, ij[1] - tile.x0] = time.perf_counter() - start
+    if stats.enabled:
+        # the probe is not part of the render, its counts are dropped so the
+        # next tile of this worker does not report them
+        stats.take()
+    return tile, times
+
+def resolve_image(sums, counts):
+    # average radiance per pixel, pixels without samples stay black
+    image = sums / np.maximum(counts, 1)[..., None]
+    return np.clip(image, 0, 1)
+
+# Worker side state: the context is sent once per worker process by the
+# pool initializer instead of being pickled with every task.
+_worker_context = None
+
+def init_worker(context):
+    global _worker_context
+    _worker_context = context
+    if getattr(context, "stats", False):
+        # forked workers inherit the instrumentation of the parent, spawned
+        # and forkserver ones start without it
+        stats.enable()
+        stats.instrument_scene(context.scene)
+
+def render_tile_task(task):
+    tile, pass_index = task
+    return render_tile(_worker_context, tile, pass_index)
+
+def set_frame(context, frame):
+    # Moves the scene of the context to a frame of its animation. Scenes
+    # with frames have set_frame(frame), which sets the camera and the
+    # transforms from the frame number alone, so every worker can move its
+    # own copy of the scene and stay in step with the others.
+    if getattr(context, "frame", None) != frame:
+        context.scene.set_frame(frame)
+        context.camera = context.scene.camera
+        # every frame gets its own random streams
+        context.scene_key = f"{context.sequence_key}:{frame}"
+        context.frame = frame
+
+def render_frame_tile_task(task):
+    frame, tile, pass_index = task
+    set_frame(_worker_context, frame)
+    return frame, render_tile(_worker_context, tile, pass_index)
+
+def probe_tile_task(task):
+    camera, tile = task
+    context = Context(**dict(_worker_context.__dict__, camera=camera, num_samples=1))
+    return probe_tile(context, tile)
+
+class ThreadPool:
+    # Pool lookalike running tasks on threads of this process: the scene and
+    # the results are shared instead of pickled. Only pays off where the
+    # work releases the GIL (NumPy kernels, free-threaded Python builds).
+    def __init__(self, num_jobs, initializer=None, initargs=()):
+        self.executor = ThreadPoolExecutor(num_jobs)
+        if initializer is not None:
+            initializer(*initargs)
+
+    def imap(self, func, tasks):
+        return self.executor.map(func, tasks)
+
+    def imap_unordered(self, func, tasks):
+        futures = [self.executor.submit(func, task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    def terminate(self):
+        # queued tasks are dropped, the running ones finish
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def join(self):
+        self.executor.shutdown(wait=True)
+
+Backends = ["processes", "threads"]
+
+StartMethods = ["fork", "spawn", "forkserver"]
+
+def make_pool(backend, num_jobs, context, start_method=None):
+    if backend == "threads":
+        return ThreadPool(num_jobs, initializer=init_worker, initargs=(context,))
+    return multiprocessing.get_context(start_method).Pool(num_jobs, initializer=init_worker, initargs=(context,))
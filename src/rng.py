@@ -0,0 +1,23 @@
+# Random numbers used while rendering. Every thread draws from its own
+# generator, so tiles rendered concurrently by the thread backend do not
+# interleave their streams. Within one thread the sequence is the same as
+# the one of the `random` module for the same seed.
+import random as _random
+import threading
+
+_local = threading.local()
+
+def generator():
+    gen = getattr(_local, "generator", None)
+    if gen is None:
+        gen = _local.generator = _random.Random()
+    return gen
+
+def seed(value):
+    generator().seed(value)
+
+def random():
+    return generator().random()
+
+def uniform(a, b):
+    return generator().uniform(a, b)
@@ -0,0 +1,133 @@
+# Cost aware tile scheduling: a cheap low resolution pre-pass estimates the
+# cost of every tile, then the most expensive work is dispatched first and
+# outlier tiles are split so all workers finish together
+import copy
+
+import numpy as np
+
+from .render import Context, TileResult, make_tiles, probe_tile, probe_tile_task
+
+def probe_costs(context, scale=4, pool=None, tile_size=16):
+    # 1 spp render at 1/scale resolution, returns per pixel time estimates
+    # for the full resolution image
+    camera = copy.copy(context.camera)
+    width, height = camera.img_width, camera.img_height
+    camera.set_resolution(max(width // scale, 1), max(height // scale, 1))
+    tiles = make_tiles(camera.img_width, camera.img_height, tile_size)
+    if pool is None:
+        probe_context = Context(**dict(context.__dict__, camera=camera, num_samples=1))
+        results = (probe_tile(probe_context, tile) for tile in tiles)
+    else:
+        results = pool.imap_unordered(probe_tile_task, [(camera, tile) for tile in tiles])
+    probe = np.zeros((camera.img_height, camera.img_width))
+    for tile, times in results:
+        probe[tile.y0:tile.y1, tile.x0:tile.x1] = times
+    # every probe pixel stands for a block of full resolution pixels
+    rows = np.arange(height) * camera.img_height // height
+    cols = np.arange(width) * camera.img_width // width
+    block = (height / camera.img_height) * (width / camera.img_width)
+    return probe[rows][:, cols] / block
+
+class CostModel:
+    def __init__(self, pixel_costs):
+        # summed area table for O(1) cost of any rectangle
+        self.table = np.zeros((pixel_costs.shape[0] + 1, pixel_costs.shape[1] + 1))
+        self.table[1:, 1:] = pixel_costs.cumsum(0).cumsum(1)
+
+    def cost(self, tile):
+        t = self.table
+        return t[tile.y1, tile.x1] - t[tile.y0, tile.x1] - t[tile.y1, tile.x0] + t[tile.y0, tile.x0]
+
+def plan(tasks, model, num_jobs, min_size=4):
+    # Longest processing time first: tasks sorted by decreasing estimated
+    # cost and pulled one at a time by idle workers. A task costing more
+    # than a quarter of a worker's fair share would finish last on its own,
+    # so it is split until it no longer does.
+    total = sum(model.cost(tile) for tile, _ in tasks)
+    limit = total / (4 * max(num_jobs, 1))
+    planned = []
+    for tile, pass_index in tasks:
+        parts = [tile]
+        while parts:
+            part = parts.pop()
+            if model.cost(part) > limit and max(part.width, part.height) >= 2 * min_size:
+                parts.extend(part.split())
+            else:
+                planned.append((part, pass_index))
+    planned.sort(key=lambda task: model.cost(task[0]), reverse=True)
+    return planned
+
+class TileAssembler:
+    # Joins the parts of split tiles back into whole tile results and
+    # releases the passes of every tile in increasing order, so the
+    # accumulation order does not depend on the dispatch order.
+    def __init__(self, tiles, tasks):
+        self.tiles = {tile.index: tile for tile in tiles}
+        self.parts = dict()
+        self.remaining = dict()
+        self.next_pass = dict()
+        self.ready = dict()
+        for tile, pass_index in tasks:
+            key = (tile.index, pass_index)
+            self.remaining[key] = self.remaining.get(key, 0) + tile.width * tile.height
+        for index, pass_index in sorted(self.remaining):
+            self.next_pass.setdefault(index, []).append(pass_index)
+
+    def add(self, part):
+        key = (part.tile.index, part.pass_index)
+        self.parts.setdefault(key, []).append(part)
+        self.remaining[key] -= part.tile.width * part.tile.height
+        if self.remaining[key] > 0:
+            return []
+        self.ready[key] = self._join(self.tiles[part.tile.index], part.pass_index, self.parts.pop(key))
+        released = []
+        passes = self.next_pass[part.tile.index]
+        while passes and (part.tile.index, passes[0]) in self.ready:
+            released.append(self.ready.pop((part.tile.index, passes.pop(0))))
+        return released
+
+    def _join(self, tile, pass_index, parts):
+        if len(parts) == 1 and parts[0].tile.width == tile.width and parts[0].tile.height == tile.height:
+            return parts[0]
+        shape = (tile.height, tile.width)
+        result = TileResult(tile, pass_index, np.zeros(shape + (3,)), np.zeros(shape + (3,)), np.zeros(shape))
+        if parts[0].cost is not None:
+            result.cost = np.zeros(shape + parts[0].cost.shape[2:])
+        for part in parts:
+            rows = slice(part.tile.y0 - tile.y0, part.tile.y1 - tile.y0)
+            cols = slice(part.tile.x0 - tile.x0, part.tile.x1 - tile.x0)
+            result.sums[rows, cols] = part.sums
+            result.sums_sq[rows, cols] = part.sums_sq
+            result.counts[rows, cols] = part.counts
+            if result.cost is not None:
+                result.cost[rows, cols] = part.cost
+            result.seconds += part.seconds
+            if part.stats:
+                result.stats = result.stats or dict()
+                for k, v in part.stats.items():
+                    result.stats[k] = result.stats.get(k, 0) + v
+            if part.gbuffer is not None:
+                result.gbuffer = (result.gbuffer or []) + part.gbuffer
+            if part.dependencies is not None:
+                if result.dependencies is None:
+                    result.dependencies = dict(shapes=set(), lights=set(), segments=[])
+                result.dependencies["shapes"] |= part.dependencies["shapes"]
+                result.dependencies["lights"] |= part.dependencies["lights"]
+                result.dependencies["segments"].append(part.dependencies["segments"])
+            if part.surface is not None:
+                if result.surface is None:
+                    result.surface = dict(part.surface, points=np.full(shape + (3,), np.nan), normals=np.full(shape + (3,), np.nan))
+                result.surface["points"][rows, cols] = part.surface["points"]
+                result.surface["normals"][rows, cols] = part.surface["normals"]
+            if part.features is not None:
+                if result.features is None:
+                    result.features = {k: np.zeros(shape + v.shape[2:], dtype=v.dtype) for k, v in part.features.items()}
+                for k, v in part.features.items():
+                    result.features[k][rows, cols] = v
+            if part.replay is not None:
+                result.replay = result.replay or dict()
+                for k, v in part.replay.items():
+                    result.replay[k] = result.replay.get(k, 0) + v
+        if result.dependencies is not None:
+            result.dependencies["segments"] = np.concatenate(result.dependencies["segments"])
+        return result
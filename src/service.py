@@ -0,0 +1,89 @@
+# Render jobs for long running render servers: a scene cache kept warm in
+# every worker process and a small line based protocol for clients
+import json
+import importlib
+from collections import OrderedDict
+
+import numpy as np
+
+from .render import Context, DefaultTileSize, make_tiles, render_tile, resolve_image
+
+class SceneCache:
+    def __init__(self, max_size=8):
+        self.max_size = max_size
+        self.scenes = OrderedDict()
+
+    def get(self, scene, params=None, width=None, height=None):
+        # scenes are keyed by module name, constructor parameters and
+        # resolution override; least recently used ones are dropped
+        key = (scene, json.dumps(params or {}, sort_keys=True), width, height)
+        if key in self.scenes:
+            self.scenes.move_to_end(key)
+            return self.scenes[key]
+        instance = importlib.import_module(scene).Scene(**(params or {}))
+        if width is not None or height is not None:
+            camera = instance.camera
+            instance.camera.set_resolution(width or camera.img_width, height or camera.img_height)
+        self.scenes[key] = instance
+        if len(self.scenes) > self.max_size:
+            self.scenes.popitem(last=False)
+        return instance
+
+class Job:
+    def __init__(self, scene, num_samples=1, passes=1, params=None, width=None, height=None, tile_size=DefaultTileSize):
+        self.scene = scene
+        self.num_samples = num_samples
+        self.passes = passes
+        self.params = params
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+    def context(self, cache):
+        scene = cache.get(self.scene, self.params, self.width, self.height)
+        return Context(scene=scene, camera=scene.camera, num_samples=self.num_samples, scene_key=self.scene)
+
+# Worker side cache, each pool process builds a scene once and reuses it
+# for every later tile and job that asks for it.
+_worker_cache = None
+
+def init_service_worker(max_size=8):
+    global _worker_cache
+    _worker_cache = SceneCache(max_size)
+
+def render_job_task(task):
+    job, tile, pass_index = task
+    return render_tile(job.context(_worker_cache), tile, pass_index)
+
+def render_job(job, pool, cache):
+    # runs a whole job on a warm pool and returns the resolved image
+    camera = job.context(cache).camera
+    tiles = make_tiles(camera.img_width, camera.img_height, job.tile_size)
+    sums = np.zeros((camera.img_height, camera.img_width, 3))
+    counts = np.zeros((camera.img_height, camera.img_width))
+    tasks = [(job, tile, p) for p in range(job.passes) for tile in tiles]
+    for result in pool.imap(render_job_task, tasks):
+        tile = result.tile
+        sums[tile.y0:tile.y1, tile.x0:tile.x1] += result.sums
+        counts[tile.y0:tile.y1, tile.x0:tile.x1] += result.counts
+    return resolve_image(sums, counts)
+
+# Protocol: every message is a JSON header line, optionally followed by
+# `nbytes` bytes of payload (the float32 image for results).
+
+def send_message(stream, header, payload=b""):
+    header = dict(header, nbytes=len(payload))
+    stream.write(json.dumps(header).encode() + b"\n")
+    stream.write(payload)
+    stream.flush()
+
+def recv_message(stream):
+    line = stream.readline()
+    if not line:
+        raise ConnectionError("Connection closed")
+    header = json.loads(line)
+    payload = stream.read(header["nbytes"]) if header["nbytes"] else b""
+    return header, payload
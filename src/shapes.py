@@ -1,3 +1,4 @@
+import numpy as np
 from src.vector3d import Vector3D
 from .base import Shape, HitRecord, CastEpsilon
 import math
@@ -8,6 +9,10 @@ class Ball(Shape):
         self.center = center
         self.radius = radius
 
+    def bounds(self):
+        c = np.array([self.center.x, self.center.y, self.center.z])
+        return c - self.radius, c + self.radius
+
     def hit(self, ray):
         # Ray-sphere intersection
         oc = ray.origin - self.center
@@ -38,6 +43,9 @@ class Cube(Shape):
         super().__init__("cube")
         self.edge_size = edge_size
 
+    def bounds(self):
+        return np.full(3, -self.edge_size / 2), np.full(3, self.edge_size / 2)
+
     def hit(self, ray):
         # Intersection between a ray and a cube centered at the origin
         half_edge = self.edge_size / 2
@@ -88,7 +96,11 @@ class Cylinder(Shape):
         super().__init__("cylinder")
         self.height = height
         self.radius = radius
-    
+
+    def bounds(self):
+        extent = np.array([self.radius, self.radius, self.height / 2])
+        return -extent, extent
+
     def hit(self, ray):
     # Intersection between a ray and a cylinder centered at the origin
         # There are two possibilites of intersection: to the side and at the bases
@@ -178,9 +190,29 @@ class PlaneUV(Shape):
                 u = vec.dot(self.right_direction)
                 v = vec.dot(self.forward_direction)
                 uv = Vector3D(u, v, 0)
-                return HitRecord(True, t, point, self.normal, uv=uv)
+                hit_rec = HitRecord(True, t, point, self.normal, uv=uv)
+                # most candidate hits are not the closest one or are never
+                # shaded
+                if ray.has_differentials():
+                    hit_rec.defer_duv(lambda: self._duv(ray, t))
+                return hit_rec
         return HitRecord(False, float('inf'), None, None)
 
+    def _duv(self, ray, t):
+        return tuple(Vector3D(dP.dot(self.right_direction), dP.dot(self.forward_direction), 0) for dP in ray.transfer(t, self.normal))
+
+# Level of detail of implicit surfaces for rays with differentials: the
+# coarse scan steps about one pixel footprint (measured where the ray enters
+# the box) and roots are refined to a fraction of it, but never coarser
+# than MinFootprintSamples steps nor finer than the fixed settings.
+FootprintStep = 1.0
+FootprintTolerance = 0.1
+MinFootprintSamples = 8
+
+# share of the distance a Lipschitz bound allows that the scan skips,
+# neither the bound nor f round in a known direction
+LipschitzSafety = 0.5
+
 class ImplicitFunction(Shape):
     def __init__(
         self,
@@ -193,6 +225,9 @@ class ImplicitFunction(Shape):
         grad_similarity=0.95,
         f_epsilon=1e-5,
         sample_count=128,
+        bound=None,
+        kernel=None,
+        lipschitz=None,
     ):
         super().__init__("implicit_function")
         # Function f(x, y, z) defining the implicit surface f = 0.
@@ -208,6 +243,20 @@ class ImplicitFunction(Shape):
         self.grad_similarity = grad_similarity
         self.f_epsilon = f_epsilon
         self.sample_count = sample_count
+        # Optional bound(lo, hi) of f over the box between two corners, as
+        # (min, max).
+        self.bound = bound
+        # Optional f(x, y, z) on arrays, the coarse scan then takes all its
+        # samples in one call.
+        self.kernel = kernel
+        # Optional bound of |grad f| in the bounding box, the coarse scan
+        # skips samples where f cannot change sign.
+        self.lipschitz = lipschitz
+
+    def bounds(self):
+        if self.bbox_min is None or self.bbox_max is None:
+            return None
+        return np.array([self.bbox_min[i] for i in range(3)], dtype=float), np.array([self.bbox_max[i] for i in range(3)], dtype=float)
 
     def in_out(self, point):
         # Inside if f <= 0, outside if f > 0.
@@ -263,15 +312,17 @@ class ImplicitFunction(Shape):
             return False
         return na.dot(nb) >= self.grad_similarity
 
-    def _search_interval(self, ray, t0, t1, f0, f1, depth):
-        # Bisection within a bracketed sign change.
+    def _search_interval(self, ray, t0, t1, f0, f1, depth, t_epsilon, f_epsilon, outside=False):
+        # Bisection within a bracketed sign change. With outside, the root
+        # is the end of the final interval on the side of the ray origin,
+        # so coarse tolerances never put the hit inside the surface.
         if t1 < CastEpsilon:
             return None
 
         # Early accept if we are already close to the surface.
-        if abs(f0) <= self.f_epsilon:
+        if abs(f0) <= f_epsilon:
             return t0
-        if abs(f1) <= self.f_epsilon:
+        if abs(f1) <= f_epsilon and not outside:
             return t1
 
         if depth <= 0:
@@ -282,45 +333,52 @@ class ImplicitFunction(Shape):
             return None
 
         # If interval is tiny, validate by gradient similarity.
-        if abs(t1 - t0) <= self.t_epsilon:
+        if abs(t1 - t0) <= t_epsilon:
             grad0 = self._gradient(ray.point_at_parameter(t0))
             grad1 = self._gradient(ray.point_at_parameter(t1))
             if self._grad_similar(grad0, grad1):
-                return 0.5 * (t0 + t1)
+                return t0 if outside else 0.5 * (t0 + t1)
             return None
 
         # Bisect the interval.
         tm = 0.5 * (t0 + t1)
         fm = self.func(ray.point_at_parameter(tm))
         if f0 * fm <= 0:
-            return self._search_interval(ray, t0, tm, f0, fm, depth - 1)
-        return self._search_interval(ray, tm, t1, fm, f1, depth - 1)
-
-    def hit(self, ray):
-        # Intersect ray with bounding box, then search for f = 0.
-        box_hit = self._ray_box_intersection(ray)
-        if box_hit is None:
-            return HitRecord(False, float("inf"), None, None)
-
-        t_enter, t_exit = box_hit
-        if t_exit < CastEpsilon:
-            return HitRecord(False, float("inf"), None, None)
-
-        # Clamp start to avoid self-intersections.
-        t0 = max(t_enter, CastEpsilon)
-        t1 = t_exit
+            return self._search_interval(ray, t0, tm, f0, fm, depth - 1, t_epsilon, f_epsilon, outside)
+        return self._search_interval(ray, tm, t1, fm, f1, depth - 1, t_epsilon, f_epsilon, outside)
 
-        # Coarse sampling to find a sign change interval quickly.
+    def _tolerances(self, ray, t0, t1):
+        # coarse steps, t and f tolerances for this ray, and whether they
+        # were relaxed from the fixed settings
         steps = max(self.sample_count, 1)
-        dt = (t1 - t0) / steps
+        footprint = ray.footprint(t0)
+        if not footprint:
+            return steps, self.t_epsilon, self.f_epsilon, False
+        steps = min(steps, max(MinFootprintSamples, math.ceil((t1 - t0) / (FootprintStep * footprint))))
+        # f is about |grad f| times the distance to the surface, both
+        # tolerances are relaxed alike
+        scale = max(1.0, FootprintTolerance * footprint / self.t_epsilon)
+        return steps, self.t_epsilon * scale, self.f_epsilon * scale, scale > 1.0
+
+    def _scan(self, ray, t0, t1, dt, steps, f_epsilon):
+        # first sign change of f at the coarse samples: (bracket, None), or
+        # (None, (best_t, best_f)) for the sample closest to f = 0
+        if self.kernel is not None:
+            return self._scan_kernel(ray, t0, dt, steps)
+        # f changes by at most rate * dt from one sample to the next, so from
+        # samples far enough from zero the scan skips the ones that keep
+        # their sign and could not be the best one; it goes on from the last
+        # of them, and the bracket is the one found without skipping
+        rate = 0.0 if self.lipschitz is None else self.lipschitz * ray.direction.length()
+        skip_above = f_epsilon + 2 * rate * dt / LipschitzSafety if rate > 0 else float("inf")
         t_prev = t0
         f_prev = self.func(ray.point_at_parameter(t_prev))
         best_t = t_prev
         best_f = abs(f_prev)
-        bracket = None
 
         # Scan for the first sign change; keep best near-zero sample.
-        for i in range(1, steps + 1):
+        i = 1
+        while i <= steps:
             t_curr = t0 + dt * i
             f_curr = self.func(ray.point_at_parameter(t_curr))
             abs_f = abs(f_curr)
@@ -329,16 +387,52 @@ class ImplicitFunction(Shape):
                 best_t = t_curr
 
             if f_prev * f_curr <= 0:
-                bracket = (t_prev, t_curr, f_prev, f_curr)
-                break
+                return (t_prev, t_curr, f_prev, f_curr), None
 
             t_prev = t_curr
             f_prev = f_curr
+            i += 1
+            if abs_f > skip_above:
+                i += int(LipschitzSafety * (abs_f - f_epsilon) / (rate * dt)) - 1
+        return None, (best_t, best_f)
+
+    def _scan_kernel(self, ray, t0, dt, steps):
+        # the same samples as the scan, taken in one call of the kernel
+        t = t0 + dt * np.arange(steps + 1)
+        o, d = ray.origin, ray.direction
+        f = self.kernel(o.x + d.x * t, o.y + d.y * t, o.z + d.z * t)
+        change = np.flatnonzero(f[:-1] * f[1:] <= 0)
+        if change.size:
+            i = change[0]
+            return (float(t[i]), float(t[i + 1]), float(f[i]), float(f[i + 1])), None
+        # first of the closest samples, nan never is
+        abs_f = np.abs(f)
+        i = np.argmin(np.where(np.isnan(abs_f), np.inf, abs_f))
+        return None, (float(t[i]), float(abs_f[i]))
+
+    def hit(self, ray):
+        # Intersect ray with bounding box, then search for f = 0.
+        box_hit = self._ray_box_intersection(ray)
+        if box_hit is None:
+            return HitRecord(False, float("inf"), None, None)
+
+        t_enter, t_exit = box_hit
+        if t_exit < CastEpsilon:
+            return HitRecord(False, float("inf"), None, None)
+
+        # Clamp start to avoid self-intersections.
+        t0 = max(t_enter, CastEpsilon)
+        t1 = t_exit
+
+        # Coarse sampling to find a sign change interval quickly.
+        steps, t_epsilon, f_epsilon, relaxed = self._tolerances(ray, t0, t1)
+        dt = (t1 - t0) / steps
+        bracket, best = self._scan(ray, t0, t1, dt, steps, f_epsilon)
 
         # If no sign change, accept only if we got very close to f = 0.
         if bracket is None:
-            if best_f <= self.f_epsilon:
-                t_hit = best_t
+            if best is not None and best[1] <= f_epsilon:
+                t_hit = best[0]
             else:
                 return HitRecord(False, float("inf"), None, None)
         else:
@@ -350,6 +444,9 @@ class ImplicitFunction(Shape):
                 bracket[2],
                 bracket[3],
                 self.max_depth,
+                t_epsilon,
+                f_epsilon,
+                relaxed,
             )
         if t_hit is None:
             return HitRecord(False, float("inf"), None, None)
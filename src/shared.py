@@ -0,0 +1,99 @@
+# Scene arrays in named shared memory.
+#
+# SharedScene copies the NumPy arrays of a scene (transform matrices,
+# geometry arrays, acceleration structure nodes, caches) once into a single
+# shared memory block and points the scene at read-only views of it. When
+# the scene is pickled for a worker, a shared view only sends the block name
+# and its offset and the worker maps the same pages. Forked workers never
+# write to the block, so its pages are not copied on write either.
+import pickle
+from multiprocessing import shared_memory
+from multiprocessing.reduction import ForkingPickler
+
+import numpy as np
+
+# array start offsets in the block are aligned for vectorized loads
+Alignment = 64
+
+# id of a shared view -> (view, location), filled by the owning process
+_locations = dict()
+# blocks attached by this process, by name
+_blocks = dict()
+
+def attach_array(name, offset, shape, dtype):
+    block = _blocks.get(name)
+    if block is None:
+        block = _blocks[name] = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype, buffer=block.buf, offset=offset)
+    array.flags.writeable = False
+    return array
+
+def _reduce_array(array):
+    entry = _locations.get(id(array))
+    if entry is not None and entry[0] is array:
+        return attach_array, entry[1]
+    return array.__reduce_ex__(pickle.DEFAULT_PROTOCOL)
+
+# only applies to the pickling done by multiprocessing
+ForkingPickler.register(np.ndarray, _reduce_array)
+
+def _children(obj):
+    # (container, key, value) of the attributes and items that can be replaced
+    if isinstance(obj, dict):
+        return [(obj, k, v) for k, v in obj.items()]
+    if isinstance(obj, list):
+        return [(obj, k, v) for k, v in enumerate(obj)]
+    if isinstance(obj, tuple):
+        return [(None, None, v) for v in obj]
+    if hasattr(obj, "__dict__") and not isinstance(obj, type):
+        return [(obj.__dict__, k, v) for k, v in obj.__dict__.items()]
+    return []
+
+def find_arrays(root, min_bytes=0):
+    # (container, key, array) of every array reachable from root
+    found = []
+    seen = set()
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        for container, key, value in _children(obj):
+            if isinstance(value, np.ndarray):
+                if container is not None and value.dtype != object and value.nbytes >= min_bytes:
+                    found.append((container, key, value))
+            elif not isinstance(value, (str, bytes, int, float, bool)) and value is not None:
+                stack.append(value)
+    return found
+
+class SharedScene:
+    def __init__(self, scene, min_bytes=0):
+        found = find_arrays(scene, min_bytes)
+        # arrays referenced from several places are stored once
+        unique = dict()
+        for _, _, array in found:
+            unique.setdefault(id(array), array)
+        offsets = dict()
+        size = 0
+        for key, array in unique.items():
+            offsets[key] = size
+            size += -(-array.nbytes // Alignment) * Alignment
+        self.block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.nbytes = size
+        views = dict()
+        for key, array in unique.items():
+            view = np.ndarray(array.shape, array.dtype, buffer=self.block.buf, offset=offsets[key])
+            view[...] = array
+            view.flags.writeable = False
+            _locations[id(view)] = (view, (self.block.name, offsets[key], array.shape, array.dtype))
+            views[key] = view
+        for container, key, array in found:
+            container[key] = views[id(array)]
+        self.count = len(unique)
+
+    def close(self):
+        # the scene keeps its views, the block is freed once they are gone
+        for key in [k for k, (_, location) in _locations.items() if location[0] == self.block.name]:
+            del _locations[key]
+        self.block.unlink()
@@ -0,0 +1,89 @@
+# Many spheres in one shape: centers, radii and material indices live in
+# contiguous arrays with a BVH over them, instead of one Ball object each.
+import numpy as np
+
+from .base import Shape, HitRecord, CastEpsilon
+from .bvh import BVH, nearest
+from .vector3d import Vector3D
+
+def _load(value, dtype=None):
+    # a path is memory-mapped, so huge inputs are read on demand
+    if isinstance(value, str):
+        value = np.load(value, mmap_mode="r")
+    return value if dtype is None or value is None else np.asarray(value, dtype=dtype)
+
+class SphereSet(Shape):
+    def __init__(self, centers, radii, material_ids=None, materials=None, leaf_size=8, width=8, chunk_size=4096):
+        super().__init__("sphere_set")
+        centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+        radii = np.broadcast_to(np.asarray(radii, dtype=float), (len(centers),))
+        self.bvh = BVH(centers - radii[:, None], centers + radii[:, None], leaf_size, width)
+        # spheres are stored in BVH order
+        order = self.bvh.order
+        self.centers = centers[order]
+        self.radii = np.ascontiguousarray(radii[order])
+        self.material_ids = None
+        if material_ids is not None:
+            self.material_ids = np.asarray(material_ids, dtype=np.int32)[order]
+        # materials indexed by material_ids; without them the scene material is used
+        self.materials = list(materials) if materials is not None else None
+        # rays intersected per batch, bounds the size of the temporary arrays
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def load(cls, centers, radii, material_ids=None, materials=None, **kwargs):
+        # every array argument may also be the path of a .npy file
+        return cls(_load(centers), _load(radii), _load(material_ids), materials, **kwargs)
+
+    def bounds(self):
+        # root box of the BVH
+        return self.bvh.lo[0].astype(float), self.bvh.hi[0].astype(float)
+
+    def __len__(self):
+        return len(self.radii)
+
+    def intersect(self, origins, directions, t_max=None):
+        # Batched closest hits of N rays (N x 3 arrays): distance along the
+        # ray (inf on a miss) and index of the sphere hit (-1 on a miss)
+        origins = np.asarray(origins, dtype=float)
+        directions = np.asarray(directions, dtype=float)
+        n = len(origins)
+        t_max = np.full(n, np.inf) if t_max is None else np.asarray(t_max, dtype=float)
+        best_t = np.full(n, np.inf)
+        best_index = np.full(n, -1, dtype=np.int64)
+        for start in range(0, n, self.chunk_size):
+            chunk = slice(start, min(start + self.chunk_size, n))
+            o, d, limit = origins[chunk], directions[chunk], t_max[chunk]
+            rays, spheres = self.bvh.candidates(o, d, limit)
+            oc = o[rays] - self.centers[spheres]
+            dd = d[rays]
+            a = (dd * dd).sum(axis=1)
+            half_b = (oc * dd).sum(axis=1)
+            c = (oc * oc).sum(axis=1) - self.radii[spheres] ** 2
+            discriminant = half_b * half_b - a * c
+            root = np.sqrt(np.maximum(discriminant, 0.0))
+            # nearest root in front of the origin, as in Ball.hit
+            t_near = (-half_b - root) / a
+            t_far = (-half_b + root) / a
+            t = np.where(t_near > CastEpsilon, t_near, np.where(t_far > CastEpsilon, t_far, np.inf))
+            t[(discriminant < 0) | (t >= limit[rays])] = np.inf
+            t_chunk, pair = nearest(rays, t, len(o))
+            found = pair >= 0
+            best_t[chunk] = t_chunk
+            best_index[chunk][found] = spheres[pair[found]]
+        return best_t, best_index
+
+    def hit(self, ray):
+        o, d = ray.origin, ray.direction
+        t, index = self.intersect(np.array([[o.x, o.y, o.z]]), np.array([[d.x, d.y, d.z]]))
+        k = int(index[0])
+        if k < 0:
+            return HitRecord(False, float('inf'), None, None)
+        t = float(t[0])
+        point = ray.point_at_parameter(t)
+        center = Vector3D(*(float(v) for v in self.centers[k]))
+        normal = (point - center).normalize()
+        material = None
+        if self.materials is not None and self.material_ids is not None:
+            material = self.materials[self.material_ids[k]]
+        return HitRecord(True, t, point, normal, material)
@@ -0,0 +1,141 @@
+# Render statistics: hot path counters that cost nothing unless enabled.
+#
+# enable() wraps the instrumented methods (scene and shape hits, camera
+# rays) in place, and instrument_scene() wraps the implicit functions of a
+# scene. Without those calls the renderer runs the original, untouched code.
+# Each process counts locally; render_tile attaches the counts of every tile
+# to its result and the parent merges them.
+from collections import Counter
+
+from .base import BaseScene, Shape
+from .camera import Camera
+from .shapes import ImplicitFunction
+
+enabled = False
+counters = Counter()
+# (class, attribute, original function) replaced by enable()
+_patched = []
+
+def _subclasses(cls):
+    yield cls
+    for sub in cls.__subclasses__():
+        yield from _subclasses(sub)
+
+def _wrap_scene_hit(original):
+    def hit(self, ray):
+        counters["scene.hit"] += 1
+        if ray.depth > 0:
+            counters["rays.secondary"] += 1
+        hit_rec = original(self, ray)
+        if hit_rec.hit:
+            counters[f"hits.depth.{ray.depth}"] += 1
+        return hit_rec
+    return hit
+
+def _wrap_shape_hit(original):
+    def hit(self, ray):
+        counters[f"shape.hit.{type(self).__name__}"] += 1
+        return original(self, ray)
+    return hit
+
+def _wrap_camera_rays(original):
+    def rays(self, x, y):
+        result = original(self, x, y)
+        counters["rays.primary"] += len(result)
+        return result
+    return rays
+
+class CountedFunction:
+    # picklable wrapper counting the calls of an implicit function
+    def __init__(self, func, key):
+        self.func = func
+        self.key = key
+
+    def __call__(self, *args):
+        counters[self.key] += 1
+        return self.func(*args)
+
+def _patch(base, name, wrapper):
+    for cls in _subclasses(base):
+        if name in cls.__dict__:
+            original = cls.__dict__[name]
+            _patched.append((cls, name, original))
+            setattr(cls, name, wrapper(original))
+
+def enable():
+    global enabled
+    if enabled:
+        return
+    enabled = True
+    _patch(BaseScene, "hit", _wrap_scene_hit)
+    _patch(Shape, "hit", _wrap_shape_hit)
+    _patch(Camera, "rays", _wrap_camera_rays)
+
+def disable():
+    # restores the original methods; instrumented scenes keep counting
+    # their implicit function calls
+    global enabled
+    while _patched:
+        cls, name, original = _patched.pop()
+        setattr(cls, name, original)
+    enabled = False
+    counters.clear()
+
+def iter_shapes(shapes):
+    # shapes of a scene including the ones wrapped by transforms
+    for shape in shapes:
+        yield shape
+        if isinstance(getattr(shape, "shape", None), Shape):
+            yield from iter_shapes([shape.shape])
+
+def instrument_scene(scene):
+    for shape in iter_shapes(scene.shapes):
+        if isinstance(shape, ImplicitFunction) and not isinstance(shape.func, CountedFunction):
+            name = type(shape).__name__
+            shape.func = CountedFunction(shape.func, f"implicit.eval.{name}")
+            if shape.gradient is not None:
+                shape.gradient = CountedFunction(shape.gradient, f"implicit.grad.{name}")
+            # the optional bound and array kernel of the shape
+            for attribute in ("bound", "kernel"):
+                if getattr(shape, attribute) is not None:
+                    setattr(shape, attribute, CountedFunction(getattr(shape, attribute), f"implicit.{attribute}.{name}"))
+
+def take():
+    # counts since the previous call, used to ship per tile deltas
+    snapshot = dict(counters)
+    counters.clear()
+    return snapshot
+
+class RenderStats:
+    # parent side aggregate of the counters shipped by the workers
+    def __init__(self):
+        self.counters = Counter()
+
+    def merge(self, snapshot):
+        if snapshot:
+            self.counters.update(snapshot)
+
+    def derived(self):
+        c = self.counters
+        # depth 0 queries are primary rays or shadow rays cast while shading
+        shadow = c["scene.hit"] - c["rays.primary"] - c["rays.secondary"]
+        return dict(
+            rays_primary=c["rays.primary"],
+            rays_shadow=shadow,
+            rays_secondary=c["rays.secondary"],
+            rays_per_second=c["scene.hit"] / c["time.tiles"] if c["time.tiles"] else 0.0,
+        )
+
+    def as_dict(self):
+        return dict(counters=dict(sorted(self.counters.items())), derived=self.derived())
+
+    def report(self):
+        lines = ["Render statistics:"]
+        for key, value in sorted(self.counters.items()):
+            if isinstance(value, float):
+                lines.append(f"  {key:40s} {value:14.3f}")
+            else:
+                lines.append(f"  {key:40s} {value:14d}")
+        for key, value in self.derived().items():
+            lines.append(f"  {key:40s} {value:14.0f}")
+        return "\n".join(lines)
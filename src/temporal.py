@@ -0,0 +1,123 @@
+# Temporal reuse of samples between the frames of an animation.
+#
+# Every frame renders a few new samples per pixel and keeps, per pixel, the
+# surface seen through its center. The accumulated radiance of the previous frame
+# is then fetched where the surface of each pixel was seen by the previous
+# camera, and blended with the new samples when the previous frame saw the
+# same surface there: the current surface point must lie on the tangent
+# plane of the stored one, within a fraction of the distance to the camera,
+# and the normals must point the same way. Disoccluded pixels, moving
+# objects and misses keep the new samples only. The history is capped, so
+# lighting changes fade in after a few frames.
+import numpy as np
+
+# largest distance from the current surface point to the tangent plane of
+# the previous one, relative to the distance to the camera
+PositionTolerance = 0.01
+# smallest cosine between the current and the previous normal
+NormalTolerance = 0.9
+
+class SurfaceTracer:
+    # shades the rays normally and keeps the surface seen through the center
+    # of every pixel, found with one more ray that draws no random numbers
+    # so the samples stay the same as without it
+    def __init__(self, context, tile, pass_index):
+        self.scene = context.scene
+        self.tile = tile
+        self.camera = context.camera
+        self.points = np.full((tile.height, tile.width, 3), np.nan)
+        self.normals = np.full((tile.height, tile.width, 3), np.nan)
+
+    def start_pixel(self, i, j):
+        hit_rec = self.scene.hit(self.camera.ray(j + 0.5, i + 0.5))
+        if hit_rec.hit:
+            p, n = hit_rec.point, hit_rec.normal
+            self.points[i - self.tile.y0, j - self.tile.x0] = [p.x, p.y, p.z]
+            self.normals[i - self.tile.y0, j - self.tile.x0] = [n.x, n.y, n.z]
+
+    def shade(self, ray):
+        hit_rec = self.scene.hit(ray)
+        if not hit_rec.hit:
+            return self.scene.background
+        return hit_rec.material.shade(hit_rec, self.scene)
+
+    def finish(self, result):
+        # the camera of the frame the tile was rendered for
+        result.surface = dict(points=self.points, normals=self.normals, camera=camera_basis(self.camera))
+
+def camera_basis(camera):
+    # what projection needs, copied since animated cameras change in place
+    vector = lambda a: np.array([a.x, a.y, a.z], dtype=float)
+    return dict(
+        eye=vector(camera.eye), u=vector(camera.u), v=vector(camera.v), w=vector(camera.w),
+        su=camera.su, sv=camera.sv, img_width=camera.img_width, img_height=camera.img_height,
+    )
+
+def project(basis, points):
+    # image coordinates (x, y) of world points, the inverse of
+    # Camera.point_image2world; nan behind the camera
+    d = points - basis["eye"]
+    depth = -(d @ basis["w"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_ndc = (d @ basis["u"]) / depth
+        y_ndc = (d @ basis["v"]) / depth
+    x = (x_ndc + basis["su"] / 2) * basis["img_width"] / basis["su"]
+    y = (y_ndc + basis["sv"] / 2) * basis["img_height"] / basis["sv"]
+    behind = ~(depth > 0)
+    x[behind] = np.nan
+    y[behind] = np.nan
+    return x, y
+
+class TemporalHistory:
+    def __init__(self, max_samples):
+        # samples per pixel the history may hold, new ones included
+        self.max_samples = max_samples
+        self.mean = None
+        self.counts = None
+        self.points = None
+        self.normals = None
+        self.basis = None
+
+    def blend(self, basis, sums, counts, points, normals):
+        # radiance of a new frame from its samples and the reprojected
+        # history, and the share of pixels that reused the history
+        mean = sums / np.maximum(counts, 1)[..., None]
+        history = np.zeros(counts.shape)
+        if self.mean is not None:
+            x, y = project(self.basis, points)
+            height, width = counts.shape
+            scale = np.linalg.norm(points - self.basis["eye"], axis=-1)
+            # bilinear fetch from the four previous pixels around the
+            # projection, each one only if it saw the same surface
+            fx, fy = x - 0.5, y - 0.5
+            j0, i0 = np.floor(np.nan_to_num(fx)), np.floor(np.nan_to_num(fy))
+            total = np.zeros(counts.shape)
+            history_mean = np.zeros(sums.shape)
+            for di in (0, 1):
+                for dj in (0, 1):
+                    weight = (1 - np.abs(fy - i0 - di)) * (1 - np.abs(fx - j0 - dj))
+                    inside = (i0 + di >= 0) & (i0 + di < height) & (j0 + dj >= 0) & (j0 + dj < width)
+                    i = np.where(inside, i0 + di, 0).astype(int)
+                    j = np.where(inside, j0 + dj, 0).astype(int)
+                    previous_normals = self.normals[i, j]
+                    distance = np.abs(((points - self.points[i, j]) * previous_normals).sum(axis=-1))
+                    facing = (normals * previous_normals).sum(axis=-1)
+                    # nan (misses on either side) fails every comparison,
+                    # points behind the previous camera project to nan
+                    same = inside & np.isfinite(x) & np.isfinite(y) & (distance <= PositionTolerance * scale) & (facing >= NormalTolerance)
+                    weight = np.where(same, weight, 0)
+                    total += weight
+                    # rejected taps are left out, not weighted by zero,
+                    # which would keep a nan
+                    history_mean += np.where(same[..., None], weight[..., None] * self.mean[i, j], 0)
+                    history += np.where(same, weight * self.counts[i, j], 0)
+            reused = total > 0
+            history_mean = history_mean / np.where(reused, total, 1)[..., None]
+            history = np.where(reused, np.minimum(history / np.where(reused, total, 1), np.maximum(self.max_samples - counts, 0)), 0)
+            mean = (history_mean * history[..., None] + sums) / np.maximum(history + counts, 1)[..., None]
+        self.mean = mean
+        self.counts = history + counts
+        self.points = points
+        self.normals = normals
+        self.basis = basis
+        return mean, float((history > 0).mean())
@@ -0,0 +1,47 @@
+# Terrain scene: a fractal landscape as a Heightfield over a 257 x 257 grid
+import numpy as np
+from src.base import BaseScene, Color
+from src.heightfield import Heightfield
+from src.camera import Camera
+from src.vector3d import Vector3D
+from src.light import PointLight
+from src.materials import CheckerboardMaterial
+
+def fractal_heights(size, octaves=6, seed=11):
+    # sum of smooth random noise at doubling frequencies and halving amplitude
+    rng = np.random.default_rng(seed)
+    heights = np.zeros((size, size))
+    for octave in range(octaves):
+        cells = 2 ** (octave + 2)
+        noise = rng.normal(size=(cells + 1, cells + 1))
+        # bilinear upsampling of the coarse noise to the full grid
+        x = np.linspace(0, cells, size)
+        i = np.minimum(x.astype(int), cells - 1)
+        f = x - i
+        rows = noise[i] * (1 - f)[:, None] + noise[i + 1] * f[:, None]
+        heights += (rows[:, i] * (1 - f) + rows[:, i + 1] * f) / 2 ** octave
+    return heights
+
+# class name should be Scene
+class Scene(BaseScene):
+    def __init__(self):
+        super().__init__("Terrain Scene")
+
+        self.background = Color(0.6, 0.75, 0.95)
+        self.ambient_light = Color(0.15, 0.15, 0.15)
+        self.max_depth = 3
+        self.camera = Camera(
+            eye=Vector3D(-9, -9, 6),
+            look_at=Vector3D(1, 1, 0),
+            up=Vector3D(0, 0, 1),
+            fov=45,
+            img_width=800,
+            img_height=600
+        )
+        self.lights = [
+            PointLight(Vector3D(-10, 5, 15), Color(1, 0.95, 0.85), 1.4),
+        ]
+
+        grass = CheckerboardMaterial(ambient_coefficient=1, diffuse_coefficient=0.8, square_size=1.0, white_color=Color(0.45, 0.6, 0.3), black_color=Color(0.35, 0.5, 0.25))
+        terrain = Heightfield(fractal_heights(257), origin=(-8, -8), cell_size=(16 / 256, 16 / 256), z_scale=0.8)
+        self.add(terrain, grass)
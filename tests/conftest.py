@@ -0,0 +1,45 @@
+# Shared helpers: the tests run the command line tools on the tiny scene
+# in tests/scenes and compare the HDR accumulation files they write.
+import os
+import sys
+import subprocess
+
+import numpy as np
+import pytest
+
+Root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SceneDir = os.path.join(Root, "tests", "scenes")
+sys.path[:0] = [Root, SceneDir]
+
+from src.accumulator import Accumulator
+
+# tiles of the tiny scene, 2 x 2 of them
+TileSize = 8
+
+@pytest.fixture
+def run(tmp_path):
+    # runs a script of the repository in tmp_path; it must succeed unless
+    # check is False
+    def run(script, *args, check=True, **env):
+        environ = dict(os.environ, PYTHONPATH=os.pathsep.join([Root, SceneDir]), MPLBACKEND="Agg", **env)
+        done = subprocess.run([sys.executable, os.path.join(Root, script)] + [str(a) for a in args],
+                              cwd=tmp_path, env=environ, capture_output=True, text=True)
+        if check:
+            assert done.returncode == 0, done.stderr
+        return done
+    return run
+
+@pytest.fixture
+def render(run, tmp_path):
+    # renders the tiny scene and returns the accumulator it wrote
+    def render(name, *args, **env):
+        path = tmp_path / f"{name}.npz"
+        run("raster.py", "-s", "tiny_scene", "-t", TileSize, "-o", tmp_path / f"{name}.png", "--accumulate", path, *args, **env)
+        return Accumulator.load(str(path))
+    return render
+
+def assert_same_image(a, b):
+    # bit for bit, not within a tolerance
+    assert np.array_equal(a.sums, b.sums)
+    assert np.array_equal(a.sums_sq, b.sums_sq)
+    assert np.array_equal(a.counts, b.counts)
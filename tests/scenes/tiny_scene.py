@@ -0,0 +1,18 @@
+# The Cornell box at 16 x 16 pixels, small enough to render in a test.
+# TINY_SCENE_EDIT=1 gives the sphere another material, for the tests of
+# incremental re-rendering.
+import os
+
+from src.base import Color
+from src.materials import SimpleMaterialWithShadows
+
+import cornell_box_scene
+
+# class name should be Scene
+class Scene(cornell_box_scene.Scene):
+    def __init__(self):
+        super().__init__()
+        self.camera.set_resolution(16, 16)
+        if os.environ.get("TINY_SCENE_EDIT"):
+            # shape 6 is the scaled sphere
+            self.materials[6] = SimpleMaterialWithShadows(0.1, 0.7, Color(0.2, 0.7, 0.9), 0.6, Color(1, 1, 1), 64)
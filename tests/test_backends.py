@@ -0,0 +1,14 @@
+import pytest
+
+from conftest import assert_same_image
+
+@pytest.mark.parametrize("options", [
+    ("-j", 2, "--backend", "processes"),
+    ("-j", 2, "--backend", "processes", "--copy_scene"),
+    ("-j", 2, "--backend", "processes", "--start_method", "spawn"),
+    ("-j", 2, "--backend", "threads"),
+    ("-j", 2, "--backend", "threads", "--schedule", "cost"),
+])
+def test_parallel_render_matches_serial(render, options):
+    serial = render("serial", "-j", 1)
+    assert_same_image(serial, render("parallel", *options))
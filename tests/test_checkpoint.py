@@ -0,0 +1,22 @@
+from src.accumulator import Accumulator
+from src.render import make_tiles
+
+from conftest import TileSize, assert_same_image
+
+def test_resume_renders_the_same_image(render, tmp_path):
+    checkpoint = tmp_path / "checkpoint"
+    full = render("full", "-j", 1, "--checkpoint", checkpoint)
+    # a render stopped after half of the tiles
+    state = str(checkpoint / "state.npz")
+    stopped = Accumulator.load(state)
+    stopped.reset_tiles(make_tiles(16, 16, TileSize)[2:])
+    stopped.save(state)
+    resumed = render("resumed", "-j", 1, "--checkpoint", checkpoint, "--resume")
+    assert_same_image(full, resumed)
+
+def test_resume_skips_finished_tiles(run, tmp_path):
+    checkpoint = tmp_path / "checkpoint"
+    run("raster.py", "-s", "tiny_scene", "-t", TileSize, "-j", 1, "--checkpoint", checkpoint)
+    output = run("raster.py", "-s", "tiny_scene", "-t", TileSize, "-j", 1, "--checkpoint", checkpoint, "--resume").stdout
+    assert "Resuming" in output
+    assert "Parallel efficiency" not in output
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from src.heightfield import Heightfield
+from src.ray import Ray
+from src.vector3d import Vector3D
+
+from test_mesh import moller_trumbore
+
+def terrain_triangles(heights, origin, cell_size, z_scale, z_offset):
+    # the two triangles of every cell in world space
+    rows, cols = heights.shape
+    x = origin[0] + np.arange(cols) * cell_size[0]
+    y = origin[1] + np.arange(rows) * cell_size[1]
+    xx, yy = np.meshgrid(x, y)
+    points = np.stack([xx, yy, heights * z_scale + z_offset], axis=2)
+    p00, p10 = points[:-1, :-1], points[:-1, 1:]
+    p01, p11 = points[1:, :-1], points[1:, 1:]
+    first = np.stack([p00, p10, p11], axis=2).reshape(-1, 3, 3)
+    second = np.stack([p00, p11, p01], axis=2).reshape(-1, 3, 3)
+    return np.concatenate([first, second])
+
+@pytest.mark.parametrize("shape, z_scale", [((2, 2), 1.0), ((9, 7), 2.0), ((16, 16), 0.5), ((13, 20), -1.5)])
+def test_heightfield_matches_brute_force(shape, z_scale):
+    rng = np.random.default_rng(shape[0] * shape[1])
+    heights = rng.uniform(0, 1, shape)
+    origin, cell_size, z_offset = (-2.0, 1.0), (0.5, 0.75), 0.25
+    field = Heightfield(heights, origin, cell_size, z_scale, z_offset)
+    lo, hi = field.bounds()
+    # rays from around the terrain towards points inside its box, and some
+    # in any direction
+    count = 300
+    origins = rng.uniform(lo - 2, hi + 2, (count, 3))
+    targets = rng.uniform(lo, hi, (count, 3))
+    directions = targets - origins
+    directions[::5] = rng.normal(size=(len(directions[::5]), 3))
+    directions /= np.linalg.norm(directions, axis=1)[:, None]
+    all_t = moller_trumbore(terrain_triangles(heights, origin, cell_size, z_scale, z_offset), origins, directions)
+    expected = all_t.min(axis=1)
+    hits = 0
+    for k in range(count):
+        record = field.hit(Ray(Vector3D(*origins[k]), Vector3D(*directions[k])))
+        assert record.hit == np.isfinite(expected[k])
+        if record.hit:
+            hits += 1
+            assert record.t == pytest.approx(expected[k], rel=1e-9, abs=1e-12)
+    assert hits > count // 4
@@ -0,0 +1,31 @@
+import re
+
+import numpy as np
+
+from src.accumulator import Accumulator
+
+from conftest import TileSize, assert_same_image
+
+def render_incremental(run, cache, **env):
+    # renders the tiny scene through the cache, number of tiles re-rendered
+    # (None on the first run)
+    output = run("raster.py", "-s", "tiny_scene", "-t", TileSize, "-j", 1, "--incremental", cache, **env).stdout
+    found = re.search(r"Re-rendering (\d+) of 4 tiles", output)
+    return None if found is None else int(found.group(1))
+
+def test_rerender_after_edit_matches_full_render(run, render, tmp_path):
+    cache = tmp_path / "cache"
+    assert render_incremental(run, cache) is None
+    first = Accumulator.load(str(cache / "image.npz"))
+    assert_same_image(first, render("full", "-j", 1))
+    # the sphere gets another material, only the tiles that saw it render again
+    dirty = render_incremental(run, cache, TINY_SCENE_EDIT="1")
+    assert 0 < dirty < 4
+    edited = Accumulator.load(str(cache / "image.npz"))
+    assert not np.array_equal(first.sums, edited.sums)
+    assert_same_image(edited, render("edited", "-j", 1, TINY_SCENE_EDIT="1"))
+
+def test_unchanged_scene_renders_nothing(run, tmp_path):
+    cache = tmp_path / "cache"
+    render_incremental(run, cache)
+    assert render_incremental(run, cache) == 0
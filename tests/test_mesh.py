@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from src.base import CastEpsilon
+from src.mesh import TriangleMesh
+from src.ray import Ray
+from src.vector3d import Vector3D
+
+from test_sphere_set import random_rays
+
+def moller_trumbore(corners, origins, directions):
+    # distance of every ray to every triangle, inf where it misses
+    v0 = corners[None, :, 0]
+    e1 = corners[None, :, 1] - corners[None, :, 0]
+    e2 = corners[None, :, 2] - corners[None, :, 0]
+    d = directions[:, None]
+    p = np.cross(d, e2)
+    det = (e1 * p).sum(axis=2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = origins[:, None] - v0
+        u = (s * p).sum(axis=2) / det
+        q = np.cross(s, e1)
+        v = (d * q).sum(axis=2) / det
+        t = (e2 * q).sum(axis=2) / det
+        valid = (np.abs(det) > 1e-12) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > CastEpsilon)
+    return np.where(valid, t, np.inf)
+
+def random_triangles(rng, count):
+    centers = rng.uniform(-3, 3, (count, 1, 3))
+    vertices = (centers + rng.uniform(-0.5, 0.5, (count, 3, 3))).reshape(-1, 3)
+    return vertices, np.arange(3 * count).reshape(-1, 3)
+
+@pytest.mark.parametrize("count, leaf_size, width", [(1, 8, 8), (500, 8, 8), (500, 2, 2)])
+def test_mesh_matches_brute_force(count, leaf_size, width):
+    rng = np.random.default_rng(count)
+    vertices, faces = random_triangles(rng, count)
+    origins, directions = random_rays(rng, 300)
+    mesh = TriangleMesh(vertices, faces, leaf_size=leaf_size, width=width, chunk_size=64)
+    t, index = mesh.intersect(origins, directions)
+    all_t = moller_trumbore(vertices[faces], origins, directions)
+    expected = np.argmin(all_t, axis=1)
+    found = np.isfinite(all_t.min(axis=1))
+    assert np.array_equal(index >= 0, found)
+    assert np.all(t[~found] == np.inf)
+    assert t[found] == pytest.approx(all_t.min(axis=1)[found], rel=1e-9)
+    # triangles are stored in BVH order
+    assert np.array_equal(mesh.faces[index[found]], faces[expected[found]])
+    if count > 1:
+        assert found.sum() > 10
+
+def test_cached_mesh_matches_parsed(tmp_path):
+    rng = np.random.default_rng(3)
+    vertices, faces = random_triangles(rng, 200)
+    path = tmp_path / "mesh.obj"
+    with open(path, "w") as f:
+        f.writelines(f"v {x} {y} {z}\n" for x, y, z in vertices.tolist())
+        f.writelines(f"f {a + 1} {b + 1} {c + 1}\n" for a, b, c in faces.tolist())
+    origins, directions = random_rays(rng, 300)
+    parsed = TriangleMesh.load(str(path), chunk_size=64)
+    cached = TriangleMesh.load(str(path), chunk_size=64)
+    assert isinstance(cached.v0, np.memmap)
+    for a, b in zip(parsed.intersect(origins, directions), cached.intersect(origins, directions)):
+        assert np.array_equal(a, b)
+
+def test_obj_vertices_with_several_normals_are_split(tmp_path):
+    # two faces of a cube edge sharing vertices 1 and 2, flat shaded
+    path = tmp_path / "edge.obj"
+    path.write_text("\n".join([
+        "v 0 0 0", "v 1 0 0", "v 1 1 0", "v 0 1 0", "v 1 0 -1", "v 1 1 -1",
+        "vn 0 0 1", "vn 1 0 0",
+        "f 1//1 2//1 3//1 4//1",
+        "f 2//2 5//2 6//2 3//2",
+    ]) + "\n")
+    mesh = TriangleMesh.load(str(path), cache=False)
+    assert len(mesh.vertices) == 8
+    front = mesh.hit(Ray(Vector3D(0.6, 0.4, 1), Vector3D(0, 0, -1)))
+    side = mesh.hit(Ray(Vector3D(2, 0.4, -0.6), Vector3D(-1, 0, 0)))
+    assert (front.normal.x, front.normal.y, front.normal.z) == (0, 0, 1)
+    assert (side.normal.x, side.normal.y, side.normal.z) == (1, 0, 0)
@@ -0,0 +1,34 @@
+import pytest
+
+from src.accumulator import Accumulator
+
+from conftest import TileSize, assert_same_image
+
+@pytest.mark.parametrize("selections", [
+    [("--shard", "0/2"), ("--shard", "1/2")],
+    [("--tiles", "0:3"), ("--tiles", "3:4")],
+])
+def test_merged_parts_match_a_full_render(run, render, tmp_path, selections):
+    full = render("full", "-j", 1)
+    parts = []
+    for k, selection in enumerate(selections):
+        # a partial render writes its accumulation file next to the output
+        run("raster.py", "-s", "tiny_scene", "-t", TileSize, "-j", 1, "-o", f"part{k}.png", *selection)
+        parts.append(f"part{k}.npz")
+    run("merge.py", *parts, "--accumulate", "merged.npz", "-o", "merged.png")
+    assert_same_image(full, Accumulator.load(str(tmp_path / "merged.npz")))
+
+def test_merge_refuses_a_missing_shard(run, tmp_path):
+    run("raster.py", "-s", "tiny_scene", "-t", TileSize, "-j", 1, "-o", "part0.png", "--shard", "0/2")
+    done = run("merge.py", "part0.npz", "-o", "merged.png", check=False)
+    assert done.returncode != 0
+    assert "incomplete image" in done.stderr
+    assert not (tmp_path / "merged.png").exists()
+
+@pytest.mark.parametrize("selection", [("--tiles", "4:8"), ("--shard", "5/6")])
+def test_empty_selection_is_a_usage_error(run, tmp_path, selection):
+    done = run("raster.py", "-s", "tiny_scene", "-t", TileSize, "-j", 1, *selection, check=False)
+    # argparse exits with 2 on usage errors
+    assert done.returncode == 2
+    assert "selects none of the 4 tiles" in done.stderr
+    assert not list(tmp_path.glob("*.npz"))
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from src.base import CastEpsilon
+from src.bvh import BVH
+from src.ray import Ray
+from src.shapes import Ball
+from src.sphere_set import SphereSet
+from src.vector3d import Vector3D
+
+def random_rays(rng, count, spread=4.0):
+    origins = rng.uniform(-spread, spread, (count, 3))
+    directions = rng.normal(size=(count, 3))
+    return origins, directions / np.linalg.norm(directions, axis=1)[:, None]
+
+def slab_hits(lo, hi, origins, directions):
+    # every (ray, box) pair the ray enters in front of its origin
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t0 = (lo[None] - origins[:, None]) / directions[:, None]
+        t1 = (hi[None] - origins[:, None]) / directions[:, None]
+    near = np.fmax.reduce(np.fmin(t0, t1), axis=2)
+    far = np.fmin.reduce(np.fmax(t0, t1), axis=2)
+    return set(zip(*np.nonzero((near <= far) & (far > CastEpsilon))))
+
+@pytest.mark.parametrize("count, leaf_size, width", [(1, 8, 8), (300, 8, 8), (300, 3, 2), (1000, 4, 4)])
+def test_bvh_finds_every_box_a_ray_enters(count, leaf_size, width):
+    rng = np.random.default_rng(count)
+    centers = rng.uniform(-3, 3, (count, 3))
+    sizes = rng.uniform(0.01, 0.5, (count, 3))
+    origins, directions = random_rays(rng, 200)
+    bounds = [(centers - sizes, centers + sizes), (centers + 1 - sizes, centers + 1 + 2 * sizes)]
+    bvh = BVH(*bounds[0], leaf_size, width)
+    for k, (lo, hi) in enumerate(bounds):
+        # the second bounds are refitted, not rebuilt
+        if k > 0:
+            bvh.refit(lo, hi)
+        rays, prims = bvh.candidates(origins, directions, np.full(len(origins), np.inf))
+        found = set(zip(rays.tolist(), bvh.order[prims].tolist()))
+        assert slab_hits(lo, hi, origins, directions) <= found
+
+def test_sphere_set_matches_brute_force():
+    rng = np.random.default_rng(1)
+    centers = rng.uniform(-3, 3, (400, 3))
+    radii = rng.uniform(0.05, 0.4, 400)
+    origins, directions = random_rays(rng, 300)
+    spheres = SphereSet(centers, radii, chunk_size=64)
+    t, index = spheres.intersect(origins, directions)
+    balls = [Ball(Vector3D(*c), r) for c, r in zip(centers.tolist(), radii.tolist())]
+    hits = 0
+    for k in range(len(origins)):
+        ray = Ray(Vector3D(*origins[k]), Vector3D(*directions[k]))
+        records = [ball.hit(ray) for ball in balls]
+        # a ball missed from inside keeps the root behind the origin as t
+        found = [b for b in range(len(balls)) if records[b].hit]
+        if not found:
+            assert index[k] == -1 and t[k] == np.inf
+            continue
+        expected = min(found, key=lambda b: records[b].t)
+        hits += 1
+        assert t[k] == pytest.approx(records[expected].t, rel=1e-9)
+        assert np.array_equal(spheres.centers[index[k]], centers[expected])
+        # the single ray path agrees with the batch, up to the rounding of
+        # the direction Ray normalizes again
+        assert spheres.hit(ray).t == pytest.approx(t[k], rel=1e-9)
+    # most rays start inside the cloud and hit something
+    assert hits > 100
+
+def test_sphere_set_respects_t_max():
+    rng = np.random.default_rng(2)
+    centers = rng.uniform(-3, 3, (200, 3))
+    origins, directions = random_rays(rng, 200)
+    spheres = SphereSet(centers, 0.3)
+    t, _ = spheres.intersect(origins, directions)
+    limit = np.where(np.isfinite(t), t * rng.uniform(0.5, 1.5, len(t)), 1.0)
+    clipped, index = spheres.intersect(origins, directions, limit)
+    assert np.array_equal(clipped, np.where(t < limit, t, np.inf))
+    assert np.all((index >= 0) == np.isfinite(clipped))
@@ -0,0 +1,22 @@
+import json
+
+import numpy as np
+import pytest
+
+from conftest import TileSize
+
+def counters(run, tmp_path, name, *options):
+    run("raster.py", "-s", "tiny_scene", "-t", TileSize, "-o", f"{name}.png", "--stats_output", f"{name}.json", "--cost_map", *options)
+    with open(tmp_path / f"{name}.json") as f:
+        found = json.load(f)["counters"]
+    # timings differ from run to run
+    return {k: v for k, v in found.items() if not k.startswith("time.")}, np.load(tmp_path / f"{name}.cost.npy")
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_workers_count_like_a_serial_render(run, tmp_path, start_method):
+    serial, serial_cost = counters(run, tmp_path, "serial", "-j", 1)
+    parallel, parallel_cost = counters(run, tmp_path, "parallel", "-j", 2, "--start_method", start_method)
+    assert serial["rays.primary"] == 16 * 16
+    assert parallel == serial
+    # the counts of the cost map, not the times
+    assert np.array_equal(parallel_cost[..., 1:], serial_cost[..., 1:])
@@ -0,0 +1,78 @@
+# Turntable scene: the camera circles a small forest whose crowns sway in
+# the wind around a spinning cube. Render the frames with sequence.py.
+import math
+import numpy as np
+from src.base import BaseScene, Color
+from src.shapes import Cube, Cylinder, PlaneUV
+from src.instancing import InstanceSet
+from src.object_transform import ObjectTransform, translation_matrix, rotation_x_matrix, rotation_z_matrix, scale_matrix
+from src.camera import Camera
+from src.vector3d import Vector3D
+from src.light import PointLight
+from src.materials import SimpleMaterialWithShadows, CheckerboardMaterial
+from mesh_scene import octahedron_mesh
+
+# class name should be Scene
+class Scene(BaseScene):
+    def __init__(self, num_trees=120, frames=48, seed=5):
+        super().__init__("Turntable Scene")
+
+        self.background = Color(0.7, 0.8, 1)
+        self.ambient_light = Color(0.1, 0.1, 0.1)
+        self.max_depth = 3
+        self.camera = Camera(
+            eye=Vector3D(0, -18, 6),
+            look_at=Vector3D(0, 0, 1),
+            up=Vector3D(0, 0, 1),
+            fov=45,
+            img_width=320,
+            img_height=180
+        )
+        self.lights = [
+            PointLight(Vector3D(10, -10, 20), Color(1, 1, 0.95), 1.5),
+        ]
+        # number of frames of one turn, for sequence.py
+        self.frames = frames
+
+        trunk = Cylinder(1.0, 0.15)
+        crown = octahedron_mesh(1.0)
+        bark = SimpleMaterialWithShadows(0.2, 0.7, Color(0.4, 0.25, 0.1), 0.1, Color(1, 1, 1), 8)
+        leaves = SimpleMaterialWithShadows(0.2, 0.7, Color(0.1, 0.5, 0.15), 0.2, Color(1, 1, 1), 16)
+        rng = np.random.default_rng(seed)
+        shapes, materials = [], []
+        # per tree: placement, height and sway phase
+        self.trees = []
+        for k in range(num_trees):
+            radius = rng.uniform(4, 12)
+            angle = rng.uniform(0, 2 * math.pi)
+            place = translation_matrix(radius * math.cos(angle), radius * math.sin(angle), 0) @ rotation_z_matrix(rng.uniform(0, 2 * math.pi))
+            self.trees.append((place, rng.uniform(1.5, 3.0), rng.uniform(0, 2 * math.pi)))
+            shapes += [trunk, crown]
+            materials += [bark, leaves]
+        self.forest = InstanceSet(shapes, self.tree_matrices(0), materials)
+        self.add(self.forest, bark)
+
+        self.cube = ObjectTransform(Cube(1.5), self.cube_matrix(0))
+        self.add(self.cube, SimpleMaterialWithShadows(0.1, 0.7, Color(0.8, 0.3, 0.2), 0.5, Color(1, 1, 1), 64))
+
+        ground = CheckerboardMaterial(ambient_coefficient=1, diffuse_coefficient=0.8, square_size=2.0, white_color=Color(0.6, 0.7, 0.5), black_color=Color(0.4, 0.5, 0.3))
+        self.add(PlaneUV(point=Vector3D(0, 0, 0), normal=Vector3D(0, 0, 1), forward_direction=Vector3D(1, 0, 0)), ground)
+
+    def tree_matrices(self, frame):
+        # trunks stand still, crowns lean back and forth
+        matrices = []
+        for place, height, phase in self.trees:
+            sway = 0.15 * math.sin(2 * math.pi * frame / self.frames * 3 + phase)
+            matrices.append(place @ translation_matrix(0, 0, height / 4) @ scale_matrix(1, 1, height / 2))
+            matrices.append(place @ translation_matrix(0, 0, height * 0.5) @ rotation_x_matrix(sway) @ translation_matrix(0, 0, height * 0.25) @ scale_matrix(0.6, 0.6, height / 2))
+        return matrices
+
+    def cube_matrix(self, frame):
+        return translation_matrix(0, 0, 1.2) @ rotation_z_matrix(2 * math.pi * frame / self.frames) @ rotation_x_matrix(math.pi / 5)
+
+    def set_frame(self, frame):
+        # only transforms change: the forest BVH is refit, not rebuilt
+        angle = 2 * math.pi * frame / self.frames
+        self.camera.set_view(Vector3D(-18 * math.sin(angle), -18 * math.cos(angle), 6), Vector3D(0, 0, 1), Vector3D(0, 0, 1))
+        self.forest.set_matrices(self.tree_matrices(frame))
+        self.cube.set_transform(self.cube_matrix(frame))